@@ -1,50 +1,75 @@
-from typing import Generator, Optional
-
-from fastapi import Depends, HTTPException, status
-from jose import jwt, JWTError
-from pydantic import BaseModel
-from sqlalchemy.orm.session import Session
-
-from auth_token import oauth2_scheme
-from config import settings
-from db.db import SessionLocal, User
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
-
-
-def get_db() -> Generator:
-    db = SessionLocal()
-    db.current_user_id = None
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(
-            token,
-            settings.JWT_SECRET,
-            algorithms=[settings.ALGORITHM],
-            options={"verify_aud": False},
-        )
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(User).filter(User.id == token_data.username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+from typing import Generator, Optional
+
+from fastapi import Depends, HTTPException, status
+from jose import jwt, JWTError
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.session import Session
+
+from auth_token import get_async_db, get_cached_user, get_cached_user_async, oauth2_scheme
+from config import settings
+from db.db import SessionLocal, User, normalize_email
+
+class TokenData(BaseModel):
+    username: Optional[str] = None
+
+
+def get_db() -> Generator:
+    db = SessionLocal()
+    db.current_user_id = None
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _token_data(token: str) -> TokenData:
+    try:
+        payload = jwt.decode(
+            token,
+            settings.JWT_SECRET,
+            algorithms=[settings.ALGORITHM],
+            options={"verify_aud": False},
+        )
+        username: str = payload.get("sub")
+        if username is None:
+            raise _credentials_exception()
+        return TokenData(username=username)
+    except JWTError:
+        raise _credentials_exception()
+
+
+async def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    token_data = _token_data(token)
+    user = get_cached_user(user_id=token_data.username, db=db)
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)
+) -> User:
+    token_data = _token_data(token)
+    user = await get_cached_user_async(user_id=token_data.username, db=db)
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+
+async def get_current_admin(current_user: User = Depends(get_current_user_async)) -> User:
+    """The current user, provided their email is listed in `ADMIN_EMAILS` (comma-separated)."""
+    admins = {normalize_email(email) for email in settings.ADMIN_EMAILS.split(",") if email.strip()}
+    if current_user.email not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough privileges")
+    return current_user
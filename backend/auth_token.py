@@ -1,96 +1,171 @@
-from typing import Optional, MutableMapping, List, Union
-from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel
-from sqlalchemy.orm.session import Session
-from jose import JWTError, jwt
-from db.db import SessionLocal, User
-from crud.security import verify_password
-
-from db.db import User
-from config import settings
-
-class UserModel(BaseModel):
-    name: str
-    birthday: str
-    password: str
-    email: str
-    countries: List[str]
-
-class TokenData(BaseModel):
-    username: Optional[str] = None
-
-JWTPayloadMapping = MutableMapping[
-    str, Union[datetime, bool, str, List[str], List[int]]
-]
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def create_access_token(*, sub: str) -> str:
-    return _create_token(
-        token_type="access_token",
-        lifetime=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
-        sub=sub,
-    )
-
-def _create_token(
-    token_type: str,
-    lifetime: timedelta,
-    sub: str,
-) -> str:
-    payload = {}
-    expire = datetime.utcnow() + lifetime
-    payload["type"] = token_type
-
-    payload["exp"] = expire
-
-    payload["iat"] = datetime.utcnow()
-
-    payload["sub"] = str(sub)
-    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.ALGORITHM)
-
-def authenticate(
-    *,
-    email: str,
-    password: str,
-    db: Session,
-) -> Optional[User]:
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        return None
-    if not verify_password(password, user.password):
-        return None
-    return user
-
-def get_user(user_id: str, db: Session):
-    return db.query(User).filter(User.id == user_id).first()
-
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_data = TokenData(username=user_id)
-    except JWTError:
-        raise credentials_exception
-
-    user = get_user(user_id=token_data.username, db=db)
-
-    if user is None:
-        raise credentials_exception
+from typing import Optional, MutableMapping, List, Union
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.session import Session
+from jose import JWTError, jwt
+from db.db import SessionLocal, User, get_async_sessionmaker, normalize_email
+from db.session import SyncSessionAdapter
+from crud.security import password_hasher
+from cache import TTLCache
+
+from db.db import User
+from config import settings
+
+class UserModel(BaseModel):
+    name: str
+    birthday: str
+    password: str
+    email: str
+    countries: List[str]
+
+class TokenData(BaseModel):
+    username: Optional[str] = None
+
+JWTPayloadMapping = MutableMapping[
+    str, Union[datetime, bool, str, List[str], List[int]]
+]
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    """
+    Yield an `AsyncSession` when `DB_ASYNC` is enabled, otherwise the sync
+    session wrapped so its round-trips run in the threadpool.
+    """
+    async_session_factory = get_async_sessionmaker()
+    if async_session_factory is not None:
+        async with async_session_factory() as db:
+            yield db
+    else:
+        db = SyncSessionAdapter(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+def create_access_token(*, sub: str) -> str:
+    return _create_token(
+        token_type="access_token",
+        lifetime=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        sub=sub,
+    )
+
+def _create_token(
+    token_type: str,
+    lifetime: timedelta,
+    sub: str,
+) -> str:
+    payload = {}
+    expire = datetime.utcnow() + lifetime
+    payload["type"] = token_type
+
+    payload["exp"] = expire
+
+    payload["iat"] = datetime.utcnow()
+
+    payload["sub"] = str(sub)
+    return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.ALGORITHM)
+
+async def authenticate(
+    *,
+    email: str,
+    password: str,
+    db: AsyncSession,
+) -> Optional[User]:
+    result = await db.execute(select(User).filter(User.email == normalize_email(email)))
+    user = result.scalars().first()
+    if not user:
+        return None
+    valid, new_hash = await password_hasher.verify_and_update(password, user.password)
+    if not valid:
+        return None
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+    return user
+
+def get_user(user_id: str, db: Session):
+    return db.query(User).filter(User.id == user_id).first()
+
+def get_cached_user(user_id: str, db: Session) -> Optional[User]:
+    """
+    Resolve the authenticated user through the principal cache. Cached users are
+    detached from the session, so commits in the request do not expire them.
+    """
+    try:
+        key = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    user = principal_cache.get(key)
+    if user is not None:
+        return user
+    user = get_user(user_id=key, db=db)
+    if user is not None:
+        db.expunge(user)
+        principal_cache.set(key, user)
+    return user
+
+async def get_cached_user_async(user_id: str, db: AsyncSession) -> Optional[User]:
+    try:
+        key = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    user = principal_cache.get(key)
+    if user is not None:
+        return user
+    user = await db.get(User, key)
+    if user is not None:
+        db.expunge(user)
+        principal_cache.set(key, user)
+    return user
+
+def invalidate_user(user_id: int) -> None:
+    principal_cache.invalidate(int(user_id))
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _token_subject(token: str) -> str:
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.ALGORITHM])
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise _credentials_exception()
+        token_data = TokenData(username=user_id)
+    except JWTError:
+        raise _credentials_exception()
+    return token_data.username
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    user = get_cached_user(user_id=_token_subject(token), db=db)
+
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+) -> User:
+    user = await get_cached_user_async(user_id=_token_subject(token), db=db)
+
+    if user is None:
+        raise _credentials_exception()
     return user
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Cost of each step of the authentication hot path, in isolation and end to
+end, against an in-memory SQLite user table. Run from the backend directory:
+
+    PYTHONPATH=.. python -m bench.auth_path --time-cost 1,2,3 --memory-cost 19456,65536 --users 100,100000
+
+Every combination of argon2 parameters and user count is measured:
+
+* `user_lookup`: the login query by email
+* `hash`, `verify`: argon2 on its own, with the swept parameters
+* `create_access_token`, `jwt_decode`: token minting and validation
+* `current_user_cold`, `current_user_warm`: `get_current_user_async` with
+  the principal cache empty and populated
+* `login`: `authenticate` then `create_access_token`, through the hashing
+  pool and the threadpool session as the `/login` route runs them
+
+The JSON report lists every stage per combination, then a comparison of
+login cost and the login throughput one hashing worker can sustain, relative
+to the first combination. `--format table` prints the comparison as text.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from passlib.context import CryptContext
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import auth_token
+from config import settings
+from crud.security import password_hasher
+from db.db import Base, User, normalize_email
+from db.session import SyncSessionAdapter
+
+EMAIL = "bench-user@example.com"
+PASSWORD = "correct horse battery staple"
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def _stats(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    mean = statistics.fmean(ordered)
+    return {
+        "iterations": len(ordered),
+        "mean_ms": round(mean * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "ops_per_s": round(1 / mean, 1) if mean else None,
+    }
+
+
+async def _measure(fn: Callable[[], Awaitable], iterations: int, before: Callable[[], None] = None) -> dict:
+    samples = []
+    for _ in range(iterations):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return _stats(samples)
+
+
+def _sync(fn: Callable, *args) -> Callable[[], Awaitable]:
+    async def call():
+        return fn(*args)
+    return call
+
+
+def user_table(count: int, hashed: str):
+    """In-memory database holding `count` users; the bench user is the last one inserted."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    rows = [
+        {"name": f"user {index}", "email": f"user{index}@example.com", "password": hashed}
+        for index in range(count - 1)
+    ]
+    rows.append({"name": "bench", "email": normalize_email(EMAIL), "password": hashed})
+    with engine.begin() as connection:
+        for start in range(0, len(rows), 10000):
+            connection.execute(insert(User.__table__), rows[start:start + 10000])
+    return engine, sessionmaker(bind=engine, autoflush=False)
+
+
+async def run_case(time_cost: int, memory_cost: int, users: int, args) -> dict:
+    context = CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=args.parallelism,
+    )
+    hashed = context.hash(PASSWORD)
+    engine, Session = user_table(users, hashed)
+    session = Session()
+    db = SyncSessionAdapter(session)
+    user_id = session.scalar(select(User.id).where(User.email == normalize_email(EMAIL)))
+    token = auth_token.create_access_token(sub=user_id)
+    stages: Dict[str, dict] = {}
+    lookup = select(User).filter(User.email == normalize_email(EMAIL))
+
+    # The hashing pool reads its parameters from `context` on every call.
+    default_context, password_hasher.context = password_hasher.context, context
+    try:
+        stages["user_lookup"] = await _measure(
+            _sync(lambda: session.execute(lookup).scalars().first()), args.iterations,
+            before=session.expunge_all,
+        )
+        stages["hash"] = await _measure(_sync(context.hash, PASSWORD), args.hash_iterations)
+        stages["verify"] = await _measure(_sync(context.verify, PASSWORD, hashed), args.hash_iterations)
+        stages["create_access_token"] = await _measure(
+            _sync(lambda: auth_token.create_access_token(sub=user_id)), args.iterations,
+        )
+        stages["jwt_decode"] = await _measure(_sync(auth_token._token_subject, token), args.iterations)
+        stages["current_user_cold"] = await _measure(
+            lambda: auth_token.get_current_user_async(token=token, db=db), args.iterations,
+            before=lambda: (auth_token.invalidate_user(user_id), session.expunge_all()),
+        )
+        stages["current_user_warm"] = await _measure(
+            lambda: auth_token.get_current_user_async(token=token, db=db), args.iterations,
+        )
+
+        async def login():
+            user = await auth_token.authenticate(email=EMAIL, password=PASSWORD, db=db)
+            return auth_token.create_access_token(sub=user.id)
+
+        stages["login"] = await _measure(login, args.hash_iterations, before=session.expunge_all)
+    finally:
+        password_hasher.context = default_context
+        auth_token.invalidate_user(user_id)
+        session.close()
+        engine.dispose()
+
+    return {
+        "argon2": {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": args.parallelism},
+        "users": users,
+        "token_bytes": len(token),
+        "hash_bytes": len(hashed),
+        "stages": stages,
+    }
+
+
+def comparison(results: List[dict]) -> List[dict]:
+    baseline = results[0]["stages"]["login"]["mean_ms"]
+    rows = []
+    for result in results:
+        stages = result["stages"]
+        login = stages["login"]["mean_ms"]
+        rows.append({
+            "time_cost": result["argon2"]["time_cost"],
+            "memory_cost": result["argon2"]["memory_cost"],
+            "users": result["users"],
+            "login_ms": login,
+            "verify_ms": stages["verify"]["mean_ms"],
+            "verify_share": round(stages["verify"]["mean_ms"] / login, 3) if login else None,
+            "logins_per_s_per_worker": round(1000 / login, 1) if login else None,
+            "authenticated_request_ms": stages["current_user_warm"]["mean_ms"],
+            "login_vs_baseline": round(login / baseline, 2) if baseline else None,
+        })
+    return rows
+
+
+def _table(rows: List[dict]) -> str:
+    columns = list(rows[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    lines = ["  ".join(column.rjust(widths[column]) for column in columns)]
+    lines += ["  ".join(str(row[column]).rjust(widths[column]) for column in columns) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--time-cost", type=_ints, default=[settings.ARGON2_TIME_COST])
+    parser.add_argument("--memory-cost", type=_ints, default=[settings.ARGON2_MEMORY_COST], help="KiB")
+    parser.add_argument("--parallelism", type=int, default=settings.ARGON2_PARALLELISM)
+    parser.add_argument("--users", type=_ints, default=[1000])
+    parser.add_argument("--iterations", type=int, default=2000, help="samples of the cheap stages")
+    parser.add_argument("--hash-iterations", type=int, default=10, help="samples of the argon2 stages and login")
+    parser.add_argument("--format", choices=("json", "table"), default="json")
+    args = parser.parse_args(argv)
+
+    results = []
+    for time_cost, memory_cost, users in itertools.product(args.time_cost, args.memory_cost, args.users):
+        results.append(asyncio.run(run_case(time_cost, memory_cost, users, args)))
+    password_hasher.shutdown()
+
+    rows = comparison(results)
+    if args.format == "table":
+        print(_table(rows))
+        return 0
+    print(json.dumps({
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "jwt_algorithm": settings.ALGORITHM,
+        "results": results,
+        "comparison": rows,
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
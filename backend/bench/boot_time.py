@@ -0,0 +1,101 @@
+"""
+Import-time and boot-time budget for the user backend.
+
+Each sample runs in a fresh interpreter so module caches do not hide the real
+cost. Run from the backend directory:
+
+    PYTHONPATH=.. python -m bench.boot_time --samples 5 --import-budget-ms 800 --boot-budget-ms 1500
+
+The report is printed as JSON and the exit code is 1 when a budget is exceeded,
+so it can gate CI and be compared across runs.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+BOOT_SNIPPET = """
+import asyncio, time
+start = time.perf_counter()
+import main
+
+async def boot():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter() - start
+
+print(asyncio.run(boot()))
+"""
+
+
+def _run(snippet: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", snippet],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return float(output.stdout.strip().splitlines()[-1]) * 1000
+
+
+def _slowest_imports(env: dict, top: int) -> list:
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        rows.append({"module": name.strip(), "cumulative_ms": int(cumulative_us) / 1000})
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def _summary(samples: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 1000)))
+    parser.add_argument("--boot-budget-ms", type=float, default=float(os.getenv("BOOT_BUDGET_MS", 1500)))
+    parser.add_argument("--bootstrap", action="store_true", help="include schema bootstrap in the boot measurement")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to report")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["DB_BOOTSTRAP_ON_STARTUP"] = "true" if args.bootstrap else "false"
+
+    import_samples = [_run(IMPORT_SNIPPET, env) for _ in range(args.samples)]
+    boot_samples = [_run(BOOT_SNIPPET, env) for _ in range(args.samples)]
+
+    report = {
+        "python": sys.version.split()[0],
+        "bootstrap": args.bootstrap,
+        "import": {**_summary(import_samples), "budget_ms": args.import_budget_ms},
+        "boot": {**_summary(boot_samples), "budget_ms": args.boot_budget_ms},
+        "slowest_imports": _slowest_imports(env, args.top),
+    }
+    report["within_budget"] = (
+        report["import"]["median_ms"] <= args.import_budget_ms
+        and report["boot"]["median_ms"] <= args.boot_budget_ms
+    )
+    print(json.dumps(report, indent=2))
+    return 0 if report["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
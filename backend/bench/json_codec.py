@@ -0,0 +1,121 @@
+"""
+Serialization cost of large responses: the default FastAPI path
+(`jsonable_encoder` then `json.dumps`) against the `codec` module, with and
+without orjson. Run from the backend directory:
+
+    PYTHONPATH=.. python -m bench.json_codec --itineraries 200 --days 7 --users 2000
+
+The report is printed as JSON, one entry per payload and encoder, with the
+median time of `--repeat` runs.
+"""
+import argparse
+import datetime
+import json
+import statistics
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+import codec
+from db.db import User
+
+
+def itinerary_payload(count: int, days: int, places: int) -> list:
+    start = datetime.date(2025, 6, 1)
+    return [
+        {
+            "_id": f"{index:024x}",
+            "destination": f"City {index}",
+            "startDate": start + datetime.timedelta(days=index),
+            "endDate": start + datetime.timedelta(days=index + days),
+            "state": "planned",
+            "owner": str(index % 50),
+            "country": "Country",
+            "city": f"City {index}",
+            "stars": index % 5,
+            "itinerary": [
+                {
+                    "day": f"Day {day + 1}",
+                    "description": [
+                        {
+                            "place": f"Place {day}-{place}",
+                            "description": "A long description of the place, its history and what to see. " * 4,
+                            "tips": "Go early, book tickets online and check the opening hours.",
+                            "checked": False,
+                        }
+                        for place in range(places)
+                    ],
+                }
+                for day in range(days)
+            ],
+        }
+        for index in range(count)
+    ]
+
+
+def user_rows(count: int) -> list:
+    return [
+        User(
+            name=f"user {index}",
+            birthday=datetime.date(1990, 1, 1) + datetime.timedelta(days=index),
+            email=f"user{index}@example.com",
+            password=None,
+            countries=[],
+        )
+        for index in range(count)
+    ]
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(
+        obj, default=codec._default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _default_path(obj) -> bytes:
+    # What JSONResponse does after FastAPI encoded the return value.
+    return json.dumps(
+        jsonable_encoder(obj), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _measure(fn, payload, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(payload)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "bytes": len(body)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itineraries", type=int, default=200)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--places", type=int, default=4)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    payloads = {
+        "itineraries": itinerary_payload(args.itineraries, args.days, args.places),
+        "user_rows": user_rows(args.users),
+    }
+    encoders = {
+        "jsonable_encoder+json": _default_path,
+        "codec.stdlib": _stdlib_dumps,
+    }
+    if codec.orjson is not None:
+        encoders["codec.orjson"] = codec.dumps
+
+    report = {"backend": codec.BACKEND, "results": {}}
+    for name, payload in payloads.items():
+        report["results"][name] = {
+            encoder: _measure(fn, payload, args.repeat) for encoder, fn in encoders.items()
+        }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
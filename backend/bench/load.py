@@ -0,0 +1,278 @@
+"""
+Load test of the user backend on a throwaway SQLite database. Run from the
+backend directory:
+
+    PYTHONPATH=.. python -m bench.load --concurrency 16 --requests 2000 --users 500 --output run.json
+
+The app is served in-process over an ASGI transport, after seeding `--users`
+accounts that share one precomputed password hash. Login and signup pay
+the configured argon2 cost (`ARGON2_*` settings), so their share of the mix
+dominates the run; drop them with `--scenarios` to measure the rest.
+`--async-db` runs the same load with `DB_ASYNC` enabled.
+
+The report is JSON: throughput and p50/p95/p99 latency per route and
+overall, plus the settings of the run, so runs can be compared over time.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+COUNTRIES = ["France", "Portugal", "Japan", "Peru", "Norway", "Italy", "Chile", "Kenya", "Canada", "Vietnam"]
+PASSWORD = "password"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    weight: int
+    auth: bool = True
+
+
+SCENARIOS = [
+    Scenario("login", "POST", "/login", 1, auth=False),
+    Scenario("signup", "POST", "/signup", 1, auth=False),
+    Scenario("user", "GET", "/user/{user_id}", 6),
+    Scenario("user_patch", "PATCH", "/user/{user_id}", 1),
+    Scenario("countries_count", "GET", "/user/{user_id}/countries/count", 2),
+    Scenario("top_countries", "GET", "/stats/countries/top?limit=5", 2),
+    Scenario("country_users", "GET", "/stats/countries/{country}/users?limit=50", 2),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> dict:
+    latencies = sorted(seconds * 1000 for _, seconds in samples)
+    statuses: Dict[str, int] = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def seed(count: int) -> Dict[int, str]:
+    """Create `count` users with a few visited countries each; return their tokens by id."""
+    from auth_token import create_access_token
+    from crud.security import PWD_CONTEXT
+    from db.db import SessionLocal, User
+    from db.init_db import init_db
+
+    init_db()
+    hashed = PWD_CONTEXT.hash(PASSWORD)
+    draw = random.Random(count)
+    db = SessionLocal()
+    try:
+        users = [
+            User(
+                name=f"bench {index}",
+                birthday=datetime.date(1990, 1, 1) + datetime.timedelta(days=index),
+                email=f"bench{index}@example.com",
+                password=hashed,
+                countries=draw.sample(COUNTRIES, draw.randint(1, 5)),
+            )
+            for index in range(count)
+        ]
+        db.add_all(users)
+        db.commit()
+        return {user.id: create_access_token(sub=user.id) for user in users}
+    finally:
+        db.close()
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenarios: List[Scenario],
+    *,
+    tokens: Dict[int, str],
+    concurrency: int,
+    requests: int,
+    duration: Optional[float],
+    warmup: int,
+    seed_: int,
+) -> dict:
+    """
+    Closed-loop load: `concurrency` workers each send one request at a time,
+    drawn from the weighted scenarios, until `requests` were sent or
+    `duration` seconds passed. The first `warmup` requests are not counted.
+    """
+    draw = random.Random(seed_)
+    population = [scenario for scenario in scenarios for _ in range(scenario.weight)]
+    results: Dict[str, List[tuple]] = {scenario.name: [] for scenario in scenarios}
+    user_ids = sorted(tokens)
+    signups = itertools.count()
+    sent = 0
+    measured_from: List[float] = []
+    deadline = None
+
+    def body(scenario: Scenario, user_id: int) -> Optional[dict]:
+        if scenario.name == "login":
+            return {"username": f"bench{user_id - user_ids[0]}@example.com", "password": PASSWORD}
+        if scenario.name == "signup":
+            email = f"signup{next(signups)}-{seed_}@example.com"
+            return {"name": "new", "birthday": None, "email": email, "password": PASSWORD, "countries": COUNTRIES[:2]}
+        if scenario.name == "user_patch":
+            return {"name": f"renamed {draw.randint(0, 999)}", "email": f"bench{user_id - user_ids[0]}@example.com",
+                    "countries": draw.sample(COUNTRIES, 3)}
+        return None
+
+    async def send(scenario: Scenario) -> tuple:
+        user_id = draw.choice(user_ids)
+        path = scenario.path.format(user_id=user_id, country=draw.choice(COUNTRIES))
+        headers = {"Authorization": f"Bearer {tokens[user_id]}"} if scenario.auth else None
+        start = time.perf_counter()
+        try:
+            response = await client.request(scenario.method, path, json=body(scenario, user_id), headers=headers)
+            await response.aread()
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "error"
+        return status, time.perf_counter() - start
+
+    async def worker():
+        nonlocal sent, deadline
+        while sent < warmup + requests and (deadline is None or time.perf_counter() < deadline):
+            index = sent
+            sent += 1
+            if index == warmup:
+                measured_from.append(time.perf_counter())
+                if duration:
+                    deadline = measured_from[0] + duration
+            scenario = draw.choice(population)
+            sample = await send(scenario)
+            if index >= warmup:
+                results[scenario.name].append(sample)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - (measured_from[0] if measured_from else started)
+    every = [sample for samples in results.values() for sample in samples]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(every, elapsed),
+        "routes": {name: summarize(samples, elapsed) for name, samples in results.items() if samples},
+    }
+
+
+async def _in_process(args, scenarios: List[Scenario], tokens: Dict[int, str]) -> dict:
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://backend", timeout=args.timeout
+        ) as client:
+            return await run_load(
+                client, scenarios, tokens=tokens, concurrency=args.concurrency, requests=args.requests,
+                duration=args.duration, warmup=args.warmup, seed_=args.seed,
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests, after the warmup")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--scenarios", default=None, help="comma-separated subset of: " + ", ".join(s.name for s in SCENARIOS))
+    parser.add_argument("--users", type=int, default=200, help="accounts seeded before the run")
+    parser.add_argument("--async-db", action="store_true", help="serve requests with DB_ASYNC enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=None, help="write the report to this file as well")
+    args = parser.parse_args(argv)
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        wanted = set(args.scenarios.split(","))
+        unknown = wanted - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in wanted]
+
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as directory:
+        os.environ.update(
+            DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            DB_ASYNC="true" if args.async_db else "false",
+            DB_BOOTSTRAP_ON_STARTUP="false",
+            TRACE_EXPORT="",
+        )
+        tokens = seed(args.users)
+        result = asyncio.run(_in_process(args, scenarios, tokens))
+
+    from config import settings
+
+    report = {
+        "benchmark": "backend.load",
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "target": "in-process",
+        "settings": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "users": args.users,
+            "async_db": args.async_db,
+            "scenarios": {scenario.name: scenario.weight for scenario in scenarios},
+            "argon2": {
+                "time_cost": settings.ARGON2_TIME_COST,
+                "memory_cost": settings.ARGON2_MEMORY_COST,
+                "parallelism": settings.ARGON2_PARALLELISM,
+                "workers": settings.HASH_WORKERS or os.cpu_count(),
+            },
+        },
+        **result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
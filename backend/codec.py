@@ -0,0 +1,75 @@
+"""
+JSON encoding for responses, backed by orjson when it is installed and by the
+standard library otherwise. Pydantic models and SQLAlchemy rows are encoded
+directly, without a `jsonable_encoder` pass.
+"""
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Any, Iterable
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import DeclarativeMeta
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def row_to_dict(obj: Any, exclude: Iterable[str] = ()) -> dict:
+    """Column values of a mapped SQLAlchemy instance, keyed by attribute name."""
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(obj).mapper.column_attrs
+        if attr.key not in exclude
+    }
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(type(obj), DeclarativeMeta):
+        # Models list columns that must never leave the service, e.g. hashes.
+        return row_to_dict(obj, exclude=getattr(obj, "__json_exclude__", ()))
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, bytes):
+        return obj.decode()
+    # Only reached on the stdlib path; orjson handles these natively.
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    loads = json.loads
+
+
+class FastJSONResponse(JSONResponse):
+    """`JSONResponse` rendered with `dumps`; return it from a route to skip FastAPI's encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,21 +1,44 @@
-from pydantic_settings import BaseSettings, SettingsConfigDict
-
-class Settings(BaseSettings):
-    model_config = SettingsConfigDict(env_file=".env")
-    DATABASE_URL: str
-    back_baseUrl: str
-    front_baseUrl: str
-    client_id: str
-    project_id: str
-    auth_uri: str
-    token_uri: str
-    auth_provider_x509_cert_url: str
-    client_secret: str
-    items_per_user: int = 5
-    API_V1_STR: str = "/api/v1"
-    JWT_SECRET: str = "TEST_SECRET_DO_NOT_USE_IN_PROD"
-    ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
-    PYTHONPATH: str
-    
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env")
+    DATABASE_URL: str
+    DB_ASYNC: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_BOOTSTRAP_ON_STARTUP: bool = True
+    COUNTRY_STATS_FROM_SUMMARY: bool = True
+    back_baseUrl: str
+    front_baseUrl: str
+    client_id: str
+    project_id: str
+    auth_uri: str
+    token_uri: str
+    auth_provider_x509_cert_url: str
+    client_secret: str
+    GOOGLE_PEOPLE_URL: str = "https://people.googleapis.com/v1/people/me"
+    GOOGLE_OAUTH_TIMEOUT: float = 10.0
+    items_per_user: int = 5
+    API_V1_STR: str = "/api/v1"
+    JWT_SECRET: str = "TEST_SECRET_DO_NOT_USE_IN_PROD"
+    ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: float = 30.0
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    HASH_WORKERS: int = 0
+    HASH_MAX_QUEUE: int = 64
+    TRACE_EXPORT: Optional[str] = None
+    TRACE_SAMPLE_RATIO: float = 1.0
+    MONITORING_ALLOW: Optional[str] = None
+    ADMIN_EMAILS: str = ""
+    BULK_BATCH_SIZE: int = 1000
+    PYTHONPATH: str
+    
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,68 @@
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.db import CountryVisitCount, User, VisitedCountry
+
+
+class CRUDCountryStats:
+    def __init__(self, use_summary: bool = True):
+        """
+        Aggregate queries over visited countries.
+        **Parameters**
+        * `use_summary`: Serve country totals from `country_visit_count`
+          instead of grouping `visited_country` on every call
+        """
+        self.use_summary = use_summary
+
+    async def count_for_user(self, db: AsyncSession, *, user_id: int) -> int:
+        return await db.scalar(
+            select(func.count()).select_from(VisitedCountry).where(VisitedCountry.user_id == user_id)
+        )
+
+    async def visitors(self, db: AsyncSession, *, country: str) -> int:
+        if self.use_summary:
+            return await db.scalar(
+                select(CountryVisitCount.visitors).where(CountryVisitCount.country == country)
+            ) or 0
+        return await db.scalar(
+            select(func.count()).select_from(VisitedCountry).where(VisitedCountry.country == country)
+        )
+
+    async def top(self, db: AsyncSession, *, limit: int = 10) -> List[dict]:
+        if self.use_summary:
+            statement = (
+                select(CountryVisitCount.country, CountryVisitCount.visitors)
+                .where(CountryVisitCount.visitors > 0)
+                .order_by(CountryVisitCount.visitors.desc(), CountryVisitCount.country)
+                .limit(limit)
+            )
+        else:
+            visitors = func.count().label("visitors")
+            statement = (
+                select(VisitedCountry.country, visitors)
+                .group_by(VisitedCountry.country)
+                .order_by(visitors.desc(), VisitedCountry.country)
+                .limit(limit)
+            )
+        result = await db.execute(statement)
+        return [{"country": country, "visitors": count} for country, count in result.all()]
+
+    async def users_who_visited(
+        self, db: AsyncSession, *, country: str, after: Optional[int] = None, limit: int = 100
+    ) -> List[dict]:
+        statement = (
+            select(User.id, User.name)
+            .join(VisitedCountry, VisitedCountry.user_id == User.id)
+            .where(VisitedCountry.country == country)
+            .order_by(VisitedCountry.user_id)
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(VisitedCountry.user_id > after)
+        result = await db.execute(statement)
+        return [{"id": user_id, "name": name} for user_id, name in result.all()]
+
+country_stats = CRUDCountryStats(use_summary=settings.COUNTRY_STATS_FROM_SUMMARY)
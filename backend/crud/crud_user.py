@@ -1,36 +1,96 @@
-from typing import Any, Dict, List, Optional, Union
-
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-
-from crud.base import CRUDBase
-from db.db import User
-from argon2 import PasswordHasher
-
-ph = PasswordHasher()
-
-class UserCreate(BaseModel):
-    name: str = None
-    birthday: Optional[str] = None
-    email: str = None
-    password: Optional[str] = None
-    countries: Optional[List[str]] = None
-
-class CRUDUser(CRUDBase[User, UserCreate]):
-    def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
-        return db.query(User).filter(User.email == email).first()
-
-    def create(self, db: Session, obj_in: UserCreate) -> User:
-        create_data = obj_in.dict(exclude_unset=True)
-        if create_data.get('password'):
-            create_data['password'] = ph.hash(create_data['password'])
-        db_obj = User(**create_data)
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
-        return db_obj
-
-    def is_superuser(self, user: User) -> bool:
-        return user.is_superuser
-
-user = CRUDUser(User)
\ No newline at end of file
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+from sqlalchemy import literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from crud.base import AsyncCRUDBase, CRUDBase
+from crud.security import get_password_hash, password_hasher
+from db.db import User, normalize_email
+
+class UserCreate(BaseModel):
+    name: str = None
+    birthday: Optional[str] = None
+    email: str = None
+    password: Optional[str] = None
+    countries: Optional[List[str]] = None
+
+class CRUDUser(CRUDBase[User, UserCreate]):
+    def get_by_email(self, db: Session, *, email: str) -> Optional[User]:
+        return db.query(User).filter(User.email == normalize_email(email)).first()
+
+    def create(self, db: Session, obj_in: UserCreate) -> User:
+        create_data = obj_in.dict(exclude_unset=True)
+        if create_data.get('password'):
+            create_data['password'] = get_password_hash(create_data['password'])
+        db_obj = User(**create_data)
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def is_superuser(self, user: User) -> bool:
+        return user.is_superuser
+
+class AsyncCRUDUser(AsyncCRUDBase[User, UserCreate]):
+    async def get_by_email(self, db: AsyncSession, *, email: str) -> Optional[User]:
+        result = await db.execute(select(User).filter(User.email == normalize_email(email)))
+        return result.scalars().first()
+
+    async def create(self, db: AsyncSession, obj_in: UserCreate) -> User:
+        create_data = obj_in.dict(exclude_unset=True)
+        if create_data.get('password'):
+            create_data['password'] = await password_hasher.hash(create_data['password'])
+        db_obj = User(**create_data)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def upsert_oauth(self, db: AsyncSession, *, name: str, email: str) -> Tuple[int, bool]:
+        """
+        Insert a passwordless account for a Google sign-in unless one already
+        exists with that email, in a single statement on PostgreSQL.
+        Returns the account id and whether it was created.
+        """
+        table = User.__table__
+        values = {"name": name, "email": normalize_email(email), "password": None}
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+
+            statement = insert(table).values(**values)
+            # The no-op update makes RETURNING yield the existing row as
+            # well; xmax is 0 only for a freshly inserted tuple.
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.email], set_={"email": statement.excluded.email},
+            ).returning(table.c.id, literal_column("xmax = 0"))
+            user_id, created = (await db.execute(statement)).one()
+            await db.commit()
+            return user_id, bool(created)
+
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+
+            statement = insert(table).values(**values).on_conflict_do_nothing(
+                index_elements=[table.c.email],
+            ).returning(table.c.id)
+            user_id = (await db.execute(statement)).scalar()
+            await db.commit()
+            if user_id is not None:
+                return user_id, True
+            return await db.scalar(select(table.c.id).where(table.c.email == values["email"])), False
+
+        existing = await db.scalar(select(table.c.id).where(table.c.email == values["email"]))
+        if existing is not None:
+            return existing, False
+        user_id = (await db.execute(table.insert().values(**values))).inserted_primary_key[0]
+        await db.commit()
+        return user_id, True
+
+    def is_superuser(self, user: User) -> bool:
+        return user.is_superuser
+
+user = CRUDUser(User)
+async_user = AsyncCRUDUser(User)
\ No newline at end of file
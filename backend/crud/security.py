@@ -1,9 +1,137 @@
-from passlib.context import CryptContext
-
-PWD_CONTEXT = CryptContext(schemes=["argon2"], deprecated="auto")
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return PWD_CONTEXT.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return PWD_CONTEXT.hash(password)
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from config import settings
+from observability.metrics import Histogram
+from observability.tracing import record_span
+
+HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds", "Time spent in argon2, by operation.", ("operation",),
+)
+HASH_QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds", "Time a hashing call waited for a free worker.",
+)
+
+PWD_CONTEXT = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class PasswordHashingService:
+    """
+    Runs every argon2 hash and verification on a bounded thread pool, so the
+    event loop never blocks on it. argon2 releases the GIL while hashing, so
+    the workers run in parallel.
+    **Parameters**
+    * `context`: The passlib context holding the hashing parameters
+    * `max_workers`: Number of hashes computed concurrently
+    * `max_queue`: Number of calls allowed to wait for a worker before new
+      ones are rejected with `HashingOverloaded`
+    """
+
+    def __init__(self, context: CryptContext, *, max_workers: int, max_queue: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="password-hash"
+                )
+            return self._executor
+
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    @staticmethod
+    def _timed(fn: Callable, submitted: float, *args):
+        start = time.perf_counter()
+        HASH_QUEUE_WAIT.observe(start - submitted)
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            HASH_LATENCY.labels(fn.__name__).observe(elapsed)
+            record_span(f"password.{fn.__name__}", elapsed, stage="hash")
+
+    def _submit(self, fn: Callable, *args) -> Future:
+        executor = self._get_executor()
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HashingOverloaded()
+            self.pending += 1
+        try:
+            # The copied context lets the worker attach its span to the request.
+            future = executor.submit(
+                contextvars.copy_context().run, self._timed, fn, time.perf_counter(), *args
+            )
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, hashed_password))
+
+    async def verify_and_update(
+        self, password: str, hashed_password: Optional[str]
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and, when its hash was made with outdated
+        parameters, return a new hash to store alongside the result.
+        """
+        return await asyncio.wrap_future(
+            self._submit(self.context.verify_and_update, password, hashed_password)
+        )
+
+    def hash_sync(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify_sync(self, password: str, hashed_password: Optional[str]) -> bool:
+        return self._submit(self.context.verify, password, hashed_password).result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHashingService(
+    PWD_CONTEXT,
+    max_workers=settings.HASH_WORKERS or os.cpu_count() or 1,
+    max_queue=settings.HASH_MAX_QUEUE,
+)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hasher.verify_sync(plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return password_hasher.hash_sync(password)
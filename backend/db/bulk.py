@@ -0,0 +1,342 @@
+"""
+Bulk export and import of user accounts, as NDJSON or CSV, in constant memory
+whatever the size of the table. Used by the `/admin/users/*` routes and from
+the command line:
+
+    python -m db.bulk export --format csv --output users.csv
+    python -m db.bulk import users.ndjson --batch-size 5000
+
+A record holds `id`, `name`, `email`, `birthday` (ISO date), `countries`
+(a list; `;`-separated in CSV) and, when asked for, the `password` hash.
+Exports read the users through one server-side cursor, in id order, and can
+resume after a given id. Imports insert in batches, one transaction each:
+`COPY` through a staging table on PostgreSQL with psycopg2, `executemany`
+elsewhere. Accounts whose email already exists are skipped, and imported
+ids are not kept. The `password` field is stored as-is, so it must be a hash
+the app can verify.
+"""
+import argparse
+import codecs
+import csv
+import datetime
+import io
+import logging
+import sys
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection, Engine
+
+from codec import dumps, loads
+from db.db import User, VisitedCountry, bump_country_visits, get_engine, normalize_email
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+FIELDS = ("id", "name", "email", "birthday", "countries")
+COUNTRY_SEPARATOR = ";"
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_users(
+    connection: Connection, *, include_passwords: bool = False, after: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[dict]:
+    """
+    Users in id order, with their countries, fetched `batch_size` rows at a
+    time from a server-side cursor.
+    """
+    users, visits = User.__table__, VisitedCountry.__table__
+    columns = [users.c.id, users.c.name, users.c.email, users.c.birthday]
+    if include_passwords:
+        columns.append(users.c.password)
+    statement = (
+        select(*columns, visits.c.country)
+        .select_from(users.outerjoin(visits, visits.c.user_id == users.c.id))
+        .order_by(users.c.id, visits.c.country)
+    )
+    if after is not None:
+        statement = statement.where(users.c.id > after)
+
+    # One row per visited country; rows of a user are adjacent.
+    current = None
+    result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+    for row in result:
+        if current is None or current["id"] != row.id:
+            if current is not None:
+                yield current
+            current = {
+                "id": row.id,
+                "name": row.name,
+                "email": row.email,
+                "birthday": row.birthday.isoformat() if row.birthday else None,
+                "countries": [],
+            }
+            if include_passwords:
+                current["password"] = row.password
+        if row.country is not None:
+            current["countries"].append(row.country)
+    if current is not None:
+        yield current
+
+
+def encode_ndjson(records: Iterable[dict], chunk_size: int = DEFAULT_BATCH_SIZE) -> Iterator[bytes]:
+    chunk = []
+    for record in records:
+        chunk.append(dumps(record))
+        if len(chunk) >= chunk_size:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+def encode_csv(
+    records: Iterable[dict], fields=FIELDS, chunk_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    for record in records:
+        writer.writerow([
+            COUNTRY_SEPARATOR.join(record[field]) if field == "countries" else record[field]
+            for field in fields
+        ])
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_users(
+    engine: Engine, fmt: str = "ndjson", *, include_passwords: bool = False, after: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    The encoded export, in chunks of `batch_size` records. The connection is
+    held until the iterator is exhausted or closed.
+    """
+    with engine.connect() as connection:
+        records = iter_users(connection, include_passwords=include_passwords, after=after, batch_size=batch_size)
+        if fmt == "csv":
+            fields = FIELDS + ("password",) if include_passwords else FIELDS
+            yield from encode_csv(records, fields, chunk_size=batch_size)
+        else:
+            yield from encode_ndjson(records, chunk_size=batch_size)
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode a stream of byte chunks into lines, keeping their line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def parse_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        if line.strip():
+            yield loads(line)
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[dict]:
+    for row in csv.DictReader(lines):
+        countries = row.get("countries") or ""
+        yield {
+            **{key: value or None for key, value in row.items() if key is not None},
+            "countries": [country for country in countries.split(COUNTRY_SEPARATOR) if country],
+        }
+
+
+def _user_row(record: dict) -> Optional[dict]:
+    email = normalize_email(record.get("email"))
+    if not email:
+        return None
+    birthday = record.get("birthday")
+    return {
+        "name": record.get("name"),
+        "email": email,
+        "birthday": datetime.date.fromisoformat(birthday) if birthday else None,
+        "password": record.get("password"),
+    }
+
+
+def _copy_buffer(rows: List[dict]) -> io.StringIO:
+    """The batch as COPY input. Strings are quoted, and so is None, as `""`."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        birthday = row["birthday"].isoformat() if row["birthday"] else None
+        writer.writerow([row["name"], birthday, row["email"], row["password"]])
+    buffer.seek(0)
+    return buffer
+
+
+# COPY reads a quoted empty field as an empty string; FORCE_NULL makes it
+# NULL for the nullable columns, so blank birthdays cast and hashes stay NULL.
+_COPY_USERS = (
+    "COPY user_import (name, birthday, email, password) FROM STDIN "
+    "WITH (FORMAT csv, FORCE_NULL (name, birthday, password))"
+)
+
+
+def _copy_users(connection: Connection, rows: List[dict]) -> Dict[str, int]:
+    """Stage the batch with COPY, then insert the new emails in one statement."""
+    with connection.connection.driver_connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS user_import "
+            "(name varchar(255), birthday date, email varchar(255), password varchar) "
+            "ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_expert(_COPY_USERS, _copy_buffer(rows))
+        cursor.execute(
+            'INSERT INTO "user" (name, birthday, email, password) '
+            "SELECT name, birthday, email, password FROM user_import "
+            "ON CONFLICT (email) DO NOTHING RETURNING id, email"
+        )
+        return {email: user_id for user_id, email in cursor.fetchall()}
+
+
+def _insert_users(connection: Connection, rows: List[dict]) -> Dict[str, int]:
+    users = User.__table__
+    emails = [row["email"] for row in rows]
+    existing = set(connection.execute(select(users.c.email).where(users.c.email.in_(emails))).scalars())
+    new_rows = [row for row in rows if row["email"] not in existing]
+    if not new_rows:
+        return {}
+    connection.execute(users.insert(), new_rows)
+    created = select(users.c.email, users.c.id).where(users.c.email.in_([row["email"] for row in new_rows]))
+    return dict(connection.execute(created).all())
+
+
+def insert_batch(connection: Connection, records: List[dict]) -> dict:
+    """
+    Insert one batch of records and their countries; returns how many were
+    inserted, skipped because the email exists and rejected for lacking one.
+    """
+    rows, countries, invalid = {}, {}, 0
+    for record in records:
+        row = _user_row(record)
+        if row is None:
+            invalid += 1
+        elif row["email"] not in rows:
+            rows[row["email"]] = row
+            countries[row["email"]] = dict.fromkeys(
+                country.strip() for country in record.get("countries") or [] if country and country.strip()
+            )
+
+    if not rows:
+        created = {}
+    elif connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        created = _copy_users(connection, list(rows.values()))
+    else:
+        created = _insert_users(connection, list(rows.values()))
+
+    visits = [
+        {"user_id": user_id, "country": country}
+        for email, user_id in created.items()
+        for country in countries[email]
+    ]
+    if visits:
+        connection.execute(VisitedCountry.__table__.insert(), visits)
+        bump_country_visits(connection, Counter(visit["country"] for visit in visits))
+    return {"inserted": len(created), "skipped": len(records) - invalid - len(created), "invalid": invalid}
+
+
+def import_users(
+    engine: Engine, lines: Iterable[str], fmt: str = "ndjson", *, batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Import records from `lines` in batches of `batch_size`, committing each
+    batch. `progress` is called with the running totals after every batch.
+    """
+    records = parse_csv(lines) if fmt == "csv" else parse_ndjson(lines)
+    totals = {"read": 0, "inserted": 0, "skipped": 0, "invalid": 0, "batches": 0, "elapsed_s": 0.0}
+    started = time.perf_counter()
+
+    def flush(batch: List[dict]) -> None:
+        with engine.begin() as connection:
+            counts = insert_batch(connection, batch)
+        for key, value in counts.items():
+            totals[key] += value
+        totals["read"] += len(batch)
+        totals["batches"] += 1
+        totals["elapsed_s"] = round(time.perf_counter() - started, 3)
+        if progress is not None:
+            progress(dict(totals))
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    totals["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return totals
+
+
+def log_progress(totals: dict) -> None:
+    rate = totals["read"] / totals["elapsed_s"] if totals["elapsed_s"] else 0.0
+    logger.info(
+        "Imported batch %d: %d read, %d inserted, %d skipped, %d invalid (%.0f records/s)",
+        totals["batches"], totals["read"], totals["inserted"], totals["skipped"], totals["invalid"], rate,
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write every user to a file or stdout")
+    export.add_argument("--format", choices=FORMATS, default="ndjson")
+    export.add_argument("--output", default=None, help="defaults to stdout")
+    export.add_argument("--include-passwords", action="store_true", help="add the password hashes")
+    export.add_argument("--after", type=int, default=None, help="resume after this user id")
+    export.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    load = commands.add_parser("import", help="add the users of a file or stdin")
+    load.add_argument("input", nargs="?", default=None, help="defaults to stdin")
+    load.add_argument("--format", choices=FORMATS, default=None, help="defaults to the file extension, else ndjson")
+    load.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == "export":
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in export_users(engine, args.format, include_passwords=args.include_passwords,
+                                      after=args.after, batch_size=args.batch_size):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+        return 0
+
+    fmt = args.format or ("csv" if args.input and args.input.endswith(".csv") else "ndjson")
+    source = open(args.input, encoding="utf-8-sig", newline="") if args.input else sys.stdin
+    try:
+        totals = import_users(engine, source, fmt, batch_size=args.batch_size, progress=log_progress)
+    finally:
+        if args.input:
+            source.close()
+    print(dumps(totals).decode())
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
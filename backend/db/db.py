@@ -1,39 +1,142 @@
-import sqlalchemy
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, String, Date, Integer, create_engine
-from sqlalchemy.engine import URL
-from sqlalchemy_utils import drop_database, database_exists, create_database
-from config import Settings
-config = Settings()
-
-engine = create_engine(config.DATABASE_URL)
-
-if not database_exists(engine.url):
-    create_database(engine.url)
-
-Base = declarative_base()
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-class User(Base):
-    __tablename__ = 'user'
-
-    id = Column(Integer, primary_key=True)
-    name = Column(String(255))
-    birthday = Column(Date)
-    email = Column(String(255))
-    countries = Column(String(10000))
-    password = Column(String, nullable=True)
-    
-    def __init__(self, name, birthday, email, password, countries):
-        self.name = name
-        self.birthday = birthday
-        self.email = email
-        self.password = password
-        self.countries = countries
-
-try:
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully!")
-except Exception as e:
-    print(f"An error occurred: {e}")
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, relationship, validates
+from sqlalchemy import Column, ForeignKey, Index, String, Date, Integer, create_engine, event
+from sqlalchemy.engine import Engine
+from db.session import async_database_url, engine_options, instrument_engine
+from config import settings as config
+
+Base = declarative_base()
+
+_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+_async_engine = None
+_async_session_factory = None
+
+class User(Base):
+    __tablename__ = 'user'
+    __json_exclude__ = ('password',)
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255))
+    birthday = Column(Date)
+    email = Column(String(255), unique=True, index=True)
+    password = Column(String, nullable=True)
+    visited = relationship(
+        "VisitedCountry",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+        order_by="VisitedCountry.country",
+    )
+
+    def __init__(self, name, birthday, email, password, countries):
+        self.name = name
+        self.birthday = birthday
+        self.email = email
+        self.password = password
+        self.countries = countries
+
+    @validates('email')
+    def _normalize_email(self, key, email):
+        return normalize_email(email)
+
+    @property
+    def countries(self) -> List[str]:
+        return [visit.country for visit in self.visited]
+
+    @countries.setter
+    def countries(self, countries: Optional[Iterable[str]]):
+        existing = {visit.country: visit for visit in self.visited}
+        wanted = dict.fromkeys(c.strip() for c in countries or [] if c and c.strip())
+        self.visited = [existing.get(c) or VisitedCountry(country=c) for c in wanted]
+
+class VisitedCountry(Base):
+    __tablename__ = 'visited_country'
+
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    country = Column(String(100), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_visited_country_country_user', 'country', 'user_id'),
+    )
+
+class CountryVisitCount(Base):
+    """Per-country visitor totals, kept up to date as visits are added or removed."""
+    __tablename__ = 'country_visit_count'
+
+    country = Column(String(100), primary_key=True)
+    visitors = Column(Integer, nullable=False, default=0, index=True)
+
+def _bump_country(connection, country: str, delta: int) -> None:
+    table = CountryVisitCount.__table__
+    if delta > 0 and connection.dialect.name in ("postgresql", "sqlite"):
+        if connection.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).values(country=country, visitors=delta)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.country],
+            set_={"visitors": table.c.visitors + delta},
+        ))
+        return
+    updated = connection.execute(
+        table.update().where(table.c.country == country).values(visitors=table.c.visitors + delta)
+    )
+    if updated.rowcount == 0 and delta > 0:
+        connection.execute(table.insert().values(country=country, visitors=delta))
+
+def bump_country_visits(connection, counts: Dict[str, int]) -> None:
+    """Add to the per-country totals after visits were inserted without the ORM."""
+    for country, delta in counts.items():
+        _bump_country(connection, country, delta)
+
+@event.listens_for(VisitedCountry, "after_insert")
+def _count_visit(mapper, connection, target):
+    _bump_country(connection, target.country, 1)
+
+@event.listens_for(VisitedCountry, "after_delete")
+def _uncount_visit(mapper, connection, target):
+    _bump_country(connection, target.country, -1)
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    return email.strip().lower() if email else email
+
+def get_engine() -> Engine:
+    """
+    Create the engine on first use, so importing this module never opens a
+    connection. Schema creation lives in `db.init_db`.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_engine(config.DATABASE_URL, **engine_options(config.DATABASE_URL, config))
+        instrument_engine(_engine)
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+def SessionLocal() -> Session:
+    get_engine()
+    return _session_factory()
+
+def get_async_sessionmaker():
+    """Return the async session factory, or None when `DB_ASYNC` is disabled."""
+    global _async_engine, _async_session_factory
+    if not config.DB_ASYNC:
+        return None
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        async_url = async_database_url(config.DATABASE_URL, config.ASYNC_DATABASE_URL)
+        _async_engine = create_async_engine(async_url, **engine_options(async_url, config))
+        instrument_engine(_async_engine)
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+async def dispose_engines() -> None:
+    global _engine, _async_engine, _session_factory, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_session_factory = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = _session_factory = None
@@ -0,0 +1,28 @@
+"""
+Explicit schema bootstrap for the user database.
+
+Run it once per deployment with `python -m db.init_db`, or let the app do it
+on startup by leaving `DB_BOOTSTRAP_ON_STARTUP` enabled.
+"""
+import logging
+
+from db.db import Base, get_engine
+from db.migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+
+def init_db() -> None:
+    from sqlalchemy_utils import create_database, database_exists
+
+    engine = get_engine()
+    if not database_exists(engine.url):
+        create_database(engine.url)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    logger.info("Database schema is up to date")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
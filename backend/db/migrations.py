@@ -0,0 +1,129 @@
+"""
+Idempotent schema migrations, applied in order by `db.init_db` after the
+tables are created. Each step must be safe to run against both a fresh and an
+already migrated database. Applied steps are recorded in `schema_migrations`
+and skipped afterwards, so booting a worker does not re-run them.
+"""
+import csv
+import logging
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateEmailError(Exception):
+    """Accounts share an email once normalized; `groups` holds their ids, oldest first."""
+
+    def __init__(self, groups: List[List[int]]):
+        super().__init__(
+            "Users share an email address once lower-cased and trimmed; merge or rename these "
+            "accounts, then restart: " + "; ".join(", ".join(map(str, ids)) for ids in groups)
+        )
+        self.groups = groups
+
+
+def unique_normalized_email(conn: Connection) -> None:
+    """
+    Lower-case and trim every email and enforce uniqueness with an index, so
+    lookups no longer scan the table. Accounts that would collide are not
+    touched: their itineraries and visited countries hang off the ids, so
+    the step stops with `DuplicateEmailError` for an operator to resolve.
+    """
+    rows = conn.execute(text(
+        'SELECT lower(trim(email)), id FROM "user" WHERE lower(trim(email)) IN ('
+        ' SELECT lower(trim(email)) FROM "user" WHERE email IS NOT NULL'
+        ' GROUP BY lower(trim(email)) HAVING COUNT(*) > 1)'
+        ' ORDER BY lower(trim(email)), id'
+    )).all()
+    if rows:
+        groups: Dict[str, List[int]] = {}
+        for email, user_id in rows:
+            groups.setdefault(email, []).append(user_id)
+        raise DuplicateEmailError(list(groups.values()))
+    conn.execute(text('UPDATE "user" SET email = lower(trim(email)) WHERE email <> lower(trim(email))'))
+    conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_user_email ON "user" (email)'))
+
+
+def _parse_legacy_countries(value: str) -> List[str]:
+    """Parse the array literal (`{Spain,"United States"}`) the old column held."""
+    value = value.strip()
+    if value.startswith("{") and value.endswith("}"):
+        value = value[1:-1]
+    if not value:
+        return []
+    row = next(csv.reader([value], skipinitialspace=True))
+    return list(dict.fromkeys(country.strip() for country in row if country.strip()))
+
+
+def visited_countries_table(conn: Connection) -> None:
+    """
+    Move the serialized `user.countries` strings into `visited_country` rows
+    and clear the legacy column, then rebuild the per-country totals.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("user")}
+    if "countries" in columns:
+        rows = conn.execute(text(
+            'SELECT id, countries FROM "user" WHERE countries IS NOT NULL'
+        )).all()
+        visits = [
+            {"user_id": user_id, "country": country}
+            for user_id, countries in rows
+            for country in _parse_legacy_countries(countries)
+        ]
+        if visits:
+            conn.execute(text(
+                'DELETE FROM visited_country WHERE user_id IN '
+                '(SELECT id FROM "user" WHERE countries IS NOT NULL)'
+            ))
+            conn.execute(
+                text("INSERT INTO visited_country (user_id, country) VALUES (:user_id, :country)"),
+                visits,
+            )
+        conn.execute(text('UPDATE "user" SET countries = NULL WHERE countries IS NOT NULL'))
+        logger.info("Migrated %d visited countries from %d users", len(visits), len(rows))
+    conn.execute(text("DELETE FROM country_visit_count"))
+    conn.execute(text(
+        "INSERT INTO country_visit_count (country, visitors) "
+        "SELECT country, COUNT(*) FROM visited_country GROUP BY country"
+    ))
+
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_unique_normalized_email", unique_normalized_email),
+    ("0002_visited_countries_table", visited_countries_table),
+]
+
+
+def applied_migrations(conn: Connection) -> List[str]:
+    return list(conn.execute(text("SELECT name FROM schema_migrations ORDER BY name")).scalars())
+
+
+def run_migrations(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " name VARCHAR(255) PRIMARY KEY,"
+            " applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        applied = set(applied_migrations(conn))
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.connect() as conn:
+            transaction = conn.begin()
+            try:
+                # Claiming the name first makes a concurrent worker wait on
+                # the row lock, then skip the step once this one commits.
+                conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+            except IntegrityError:
+                transaction.rollback()
+                logger.info("Migration %s was applied by another process", name)
+                continue
+            # Errors raised by the step itself roll it back and propagate.
+            with transaction:
+                migration(conn)
+        logger.info("Applied migration %s", name)
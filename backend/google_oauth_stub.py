@@ -0,0 +1,92 @@
+"""
+Local stand-in for the Google endpoints the sign-in flow calls: the consent
+page, the token endpoint and the People API. Either serve it and point the
+settings at it:
+
+    uvicorn google_oauth_stub:app --port 9000
+    auth_uri=http://localhost:9000/o/oauth2/auth
+    token_uri=http://localhost:9000/token
+    GOOGLE_PEOPLE_URL=http://localhost:9000/v1/people/me
+
+or hand it to the client directly, without a socket:
+
+    GoogleOAuthClient(config, transport=httpx.ASGITransport(app=create_app()))
+
+The consent page approves at once and redirects back with a code whose
+profile is `code:<email>` unless `profiles` maps it to another one.
+"""
+import secrets
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse
+from starlette.routing import Route
+
+DEFAULT_PROFILE = {"name": "Stub User", "email": "stub.user@example.com"}
+
+
+def create_app(profiles: Optional[Dict[str, dict]] = None) -> Starlette:
+    """
+    **Parameters**
+    * `profiles`: `{name, email}` returned for an authorization code; codes
+      of the form `code:<email>` need no entry
+    """
+    profiles = dict(profiles or {})
+    access_tokens: Dict[str, dict] = {}
+
+    def profile_for(code: str) -> Optional[dict]:
+        if code in profiles:
+            return profiles[code]
+        if code.startswith("code:"):
+            email = code[len("code:"):]
+            return {"name": email.split("@")[0], "email": email}
+        return None
+
+    async def authorize(request: Request):
+        params = request.query_params
+        if "redirect_uri" not in params:
+            return JSONResponse({"error": "invalid_request"}, status_code=400)
+        query = {"code": f"code:{params.get('login_hint') or DEFAULT_PROFILE['email']}"}
+        if "state" in params:
+            query["state"] = params["state"]
+        return RedirectResponse(f"{params['redirect_uri']}?{urlencode(query)}")
+
+    async def token(request: Request):
+        form = await request.form()
+        if form.get("grant_type") != "authorization_code":
+            return JSONResponse({"error": "unsupported_grant_type"}, status_code=400)
+        profile = profile_for(form.get("code", ""))
+        if profile is None:
+            return JSONResponse({"error": "invalid_grant", "error_description": "Bad Request"}, status_code=400)
+        access_token = secrets.token_urlsafe(24)
+        access_tokens[access_token] = profile
+        return JSONResponse({
+            "access_token": access_token,
+            "expires_in": 3599,
+            "token_type": "Bearer",
+            "scope": "openid https://www.googleapis.com/auth/userinfo.email https://www.googleapis.com/auth/userinfo.profile",
+            "id_token": "stub",
+        })
+
+    async def people_me(request: Request):
+        scheme, _, access_token = request.headers.get("authorization", "").partition(" ")
+        profile = access_tokens.get(access_token) if scheme.lower() == "bearer" else None
+        if profile is None:
+            return JSONResponse({"error": {"code": 401, "status": "UNAUTHENTICATED"}}, status_code=401)
+        person = {"resourceName": "people/stub"}
+        if profile.get("name"):
+            person["names"] = [{"displayName": profile["name"]}]
+        if profile.get("email"):
+            person["emailAddresses"] = [{"value": profile["email"]}]
+        return JSONResponse(person)
+
+    return Starlette(routes=[
+        Route("/o/oauth2/auth", authorize, methods=["GET"]),
+        Route("/token", token, methods=["POST"]),
+        Route("/v1/people/me", people_me, methods=["GET"]),
+    ])
+
+
+app = create_app()
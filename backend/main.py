@@ -1,231 +1,341 @@
-import json
-from fastapi import FastAPI, Depends, APIRouter, HTTPException, Response
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from crud.security import PWD_CONTEXT
-from config import settings, Settings
-from functools import lru_cache
-from typing import Any, List
-from google_auth_oauthlib.flow import Flow
-from crud.crud_user import user
-from db.db import User
-from fastapi.responses import JSONResponse, RedirectResponse
-import httpx
-from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
-from auth_token import authenticate, create_access_token, get_current_user, get_db
-from api import deps
-from fastapi.middleware.cors import CORSMiddleware
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-app = FastAPI(title="GlobeTrek", openapi_url="/openapi.json")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[settings.front_baseUrl],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@lru_cache
-def get_settings():
-    return Settings()
-
-api_router = APIRouter()
-
-class UserCreate(BaseModel):
-    name: str
-    birthday: Optional[str] = None
-    email: str
-    password: Optional[str] = None
-    countries: Optional[List[str]] = None
-
-
-class UserCredentials(BaseModel):
-    username: str
-    password: str
-
-def get_google_oauth_flow():
-
-    data = {"web":
-        {
-            "client_id": settings.client_id,
-            "project_id": settings.project_id,
-            "auth_uri":"https://accounts.google.com/o/oauth2/auth",
-            "token_uri":"https://oauth2.googleapis.com/token",
-            "auth_provider_x509_cert_url":"https://www.googleapis.com/oauth2/v1/certs",
-            "client_secret": settings.client_secret,
-            "redirect_uris":[f'{settings.back_baseUrl}/oauth/callback'],
-            "javascript_origins":[f'{settings.back_baseUrl}',f'{settings.front_baseUrl}']
-            }
-        }
-    
-    with open('client_secret.json', 'w') as f:
-        json.dump(data, f)
-        
-    return Flow.from_client_secrets_file(
-        './client_secret.json',
-        scopes=[
-            'openid', 
-            'https://www.googleapis.com/auth/userinfo.email', 
-            'https://www.googleapis.com/auth/userinfo.profile'
-        ],
-        redirect_uri=f'{settings.back_baseUrl}/oauth/callback'
-    )
-
-@app.post("/signup", response_model=dict, tags=["Auth"])
-def create_user_signup(
-    *,
-    db: Session = Depends(get_db),
-    user_in: UserCreate,
-) -> Any:
-    existing_user = user.get_by_email(db=db, email=user_in.email)
-    if existing_user:
-        raise HTTPException(
-            status_code=400,
-            detail="The user with this email already exists in the system",
-        )
-    
-    new_user = user.create(db=db, obj_in=user_in)
-    return {
-        "id": new_user.id,
-        "name": new_user.name,
-        "birthday": new_user.birthday,
-        "email": new_user.email,
-        "countries": new_user.countries
-    }
-
-@app.post("/login", tags=["Auth"], response_model=dict)
-async def login(
-    user: UserCredentials,
-    db: Session = Depends(get_db),
-):
-    user_obj = authenticate(email=user.username, password=user.password, db=db)
-    if not user_obj:
-        raise HTTPException(status_code=400, detail="Incorrect username or password")
-
-    access_token = create_access_token(sub=user_obj.id)
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user_id": user_obj.id
-    }
- 
-@app.get("/api/login", tags=["Auth"])
-async def login():
-    flow = get_google_oauth_flow()
-    authorization_url, _ = flow.authorization_url(prompt='consent')
-    return RedirectResponse(url=authorization_url)
-
-@app.get("/oauth/callback", tags=["Auth"])
-async def oauth_callback(code: str, db: Session = Depends(get_db)):
-    flow = get_google_oauth_flow()
-    try:
-        flow.fetch_token(code=code)
-        credentials = flow.credentials
-    except Exception as e:
-        return JSONResponse(content={"error": "Token exchange failed", "details": str(e)}, status_code=400)
-
-    async with httpx.AsyncClient() as client:
-        headers = {'Authorization': f'Bearer {credentials.token}'}
-        user_info_response = await client.get(
-            'https://people.googleapis.com/v1/people/me?personFields=names,emailAddresses',
-            headers=headers
-        )
-        
-    if user_info_response.status_code != 200:
-        error_details = await user_info_response.json()
-        return JSONResponse(content={
-            "error": "Failed to retrieve user information from Google",
-            "details": error_details
-        }, status_code=400)
-        
-    user_info = user_info_response.json()
-    name = user_info.get('names', [{}])[0].get('displayName', 'No name found')
-    email = user_info.get('emailAddresses', [{}])[0].get('value', 'No email found')
-    birthday = None
-
-    existing_user = db.query(User).filter(User.email == email).first()
-    if existing_user:
-        token = create_access_token(sub=existing_user.id)
-        return RedirectResponse(url=f"{settings.front_baseUrl}/Globetrek/en/home?token={token}&id={existing_user.id}")
-    else:
-        new_user = User(name=name, birthday=birthday, email=email, password=None, countries=[])
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        token = create_access_token(sub=new_user.id)
-        return RedirectResponse(url=f"{settings.front_baseUrl}/Globetrek/en/new_password?token={token}&id={new_user.id}")
-    
-@api_router.get("/user/{user_id}", response_model=dict, status_code=200, tags=["Users"])
-def fetch_user(
-    user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
-):    
-    if user_id != current_user.id:
-        raise HTTPException(
-            status_code=401,
-            detail="Not authorized"
-        )
-
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    return {"id": user.id, "name": user.name, "countries": user.countries, "email": user.email, "birthday": user.birthday}
-
-@api_router.delete("/user/{user_id}", status_code=200, tags=["Users"])
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        user_to_delete = db.query(User).filter(User.id == user_id).first()
-        if user_to_delete is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        if user_id != current_user.id:
-            raise HTTPException(
-                status_code=401,
-                detail="Not authorized"
-            )
-        db.delete(user_to_delete)
-        db.commit()
-        return {"detail": "User deleted successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@api_router.patch("/user/{user_id}", status_code=200, tags=["Users"])
-def modify_user(user_id: int, user_update: UserCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        if user_id != current_user.id:
-            raise HTTPException(
-                status_code=401,
-                detail="Not authorized"
-            )
-
-        if user_update.name is not None:
-            user.name = user_update.name
-        if user_update.birthday is not None:
-            user.birthday = user_update.birthday
-        if user_update.email is not None:
-            user.email = user_update.email
-        if user_update.countries is not None:
-            user.countries = user_update.countries
-        if user_update.password is not None:
-            hashed_password = PWD_CONTEXT.hash(user_update.password)
-            user.password = hashed_password
-            
-        db.commit()
-
-        return {
-            "id": user.id,
-            "name": user.name,
-            "birthday": user.birthday,
-            "email": user.email,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+import httpx
+from contextlib import asynccontextmanager
+from anyio import from_thread
+from fastapi import FastAPI, Depends, APIRouter, HTTPException, Query, Request, Response
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud.security import HashingOverloaded, password_hasher
+from config import settings, Settings
+from functools import lru_cache
+from typing import Any, List
+from crud.crud_user import async_user as user
+from crud.crud_country import country_stats
+from db import bulk
+from db.db import User, dispose_engines, get_engine
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from typing import Optional
+from auth_token import authenticate, create_access_token, get_async_db, get_current_user_async, invalidate_user
+from api import deps
+from codec import FastJSONResponse
+from observability.tracing import SpanExporter, TracingMiddleware, configure as configure_tracing
+from observability.access import MonitoringAllowlist
+from observability.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS, Gauge, MetricsMiddleware
+from google_oauth import GoogleOAuthClient, GoogleOAuthConfig, GoogleOAuthError, OAuthState
+from fastapi.middleware.cors import CORSMiddleware
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+span_exporter = SpanExporter(settings.TRACE_EXPORT, "backend") if settings.TRACE_EXPORT else None
+configure_tracing(span_exporter)
+monitoring_access = MonitoringAllowlist(settings.MONITORING_ALLOW)
+google_oauth = GoogleOAuthClient(GoogleOAuthConfig.from_settings(settings), timeout=settings.GOOGLE_OAUTH_TIMEOUT)
+oauth_state = OAuthState(settings.JWT_SECRET)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.DB_BOOTSTRAP_ON_STARTUP:
+        from db.init_db import init_db
+
+        await run_in_threadpool(init_db)
+    try:
+        yield
+    finally:
+        password_hasher.shutdown()
+        await google_oauth.aclose()
+        await dispose_engines()
+        if span_exporter is not None:
+            span_exporter.shutdown()
+
+app = FastAPI(title="GlobeTrek", openapi_url="/openapi.json", lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[settings.front_baseUrl],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, sample_ratio=settings.TRACE_SAMPLE_RATIO)
+
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent authentication requests, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+@lru_cache
+def get_settings():
+    return Settings()
+
+api_router = APIRouter()
+
+class UserCreate(BaseModel):
+    name: str
+    birthday: Optional[str] = None
+    email: str
+    password: Optional[str] = None
+    countries: Optional[List[str]] = None
+
+
+class UserCredentials(BaseModel):
+    username: str
+    password: str
+
+@app.post("/signup", response_model=dict, tags=["Auth"])
+async def create_user_signup(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    user_in: UserCreate,
+) -> Any:
+    try:
+        new_user = await user.create(db=db, obj_in=user_in)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system",
+        )
+
+    return FastJSONResponse({
+        "id": new_user.id,
+        "name": new_user.name,
+        "birthday": new_user.birthday,
+        "email": new_user.email,
+        "countries": new_user.countries
+    })
+
+@app.post("/login", tags=["Auth"], response_model=dict)
+async def login(
+    user: UserCredentials,
+    db: AsyncSession = Depends(get_async_db),
+):
+    user_obj = await authenticate(email=user.username, password=user.password, db=db)
+    if not user_obj:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+
+    access_token = create_access_token(sub=user_obj.id)
+    return FastJSONResponse({
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user_id": user_obj.id
+    })
+ 
+@app.get("/api/login", tags=["Auth"])
+async def login():
+    # The gateway passes this on to the browser, which has to open it
+    # itself so the state cookie lands on the backend's origin.
+    return RedirectResponse(url=f"{settings.back_baseUrl}/oauth/start")
+
+@app.get("/oauth/start", tags=["Auth"])
+async def oauth_start():
+    state, cookie = oauth_state.issue()
+    response = RedirectResponse(url=google_oauth.authorization_url(state, prompt='consent'))
+    response.set_cookie(OAuthState.cookie, cookie, max_age=oauth_state.ttl, path="/oauth/callback",
+                        httponly=True, samesite="lax", secure=settings.back_baseUrl.startswith("https://"))
+    return response
+
+@app.get("/oauth/callback", tags=["Auth"])
+async def oauth_callback(request: Request, code: str, state: Optional[str] = None,
+                         db: AsyncSession = Depends(get_async_db)):
+    if not oauth_state.verify(state, request.cookies.get(OAuthState.cookie)):
+        return JSONResponse(content={"error": "Invalid or expired sign-in state, please sign in again"}, status_code=400)
+    try:
+        tokens = await google_oauth.exchange_code(code)
+        user_info = await google_oauth.fetch_profile(tokens["access_token"])
+    except GoogleOAuthError as e:
+        return JSONResponse(content={"error": str(e), "details": e.details}, status_code=400)
+    except httpx.HTTPError as e:
+        return JSONResponse(content={"error": "Google is unreachable", "details": str(e)}, status_code=400)
+
+    name = (user_info.get('names') or [{}])[0].get('displayName', 'No name found')
+    email = (user_info.get('emailAddresses') or [{}])[0].get('value')
+    if not email:
+        return JSONResponse(content={"error": "The Google account has no email address"}, status_code=400)
+
+    user_id, created = await user.upsert_oauth(db, name=name, email=email)
+    token = create_access_token(sub=user_id)
+    page = "new_password" if created else "home"
+    response = RedirectResponse(url=f"{settings.front_baseUrl}/Globetrek/en/{page}?token={token}&id={user_id}")
+    response.delete_cookie(OAuthState.cookie, path="/oauth/callback")
+    return response
+    
+@api_router.get("/user/{user_id}", response_model=dict, status_code=200, tags=["Users"])
+async def fetch_user(
+    user_id: int, current_user: User = Depends(get_current_user_async)
+):    
+    if user_id != current_user.id:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authorized"
+        )
+
+    return FastJSONResponse({
+        "id": current_user.id,
+        "name": current_user.name,
+        "countries": current_user.countries,
+        "email": current_user.email,
+        "birthday": current_user.birthday
+    })
+
+@api_router.delete("/user/{user_id}", status_code=200, tags=["Users"])
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    try:
+        if user_id != current_user.id:
+            raise HTTPException(
+                status_code=401,
+                detail="Not authorized"
+            )
+        user_to_delete = await db.get(User, user_id)
+        if user_to_delete is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        await db.delete(user_to_delete)
+        await db.commit()
+        invalidate_user(user_id)
+        return {"detail": "User deleted successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@api_router.patch("/user/{user_id}", status_code=200, tags=["Users"])
+async def modify_user(user_id: int, user_update: UserCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    try:
+        if user_id != current_user.id:
+            raise HTTPException(
+                status_code=401,
+                detail="Not authorized"
+            )
+
+        user = await db.get(User, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if user_update.name is not None:
+            user.name = user_update.name
+        if user_update.birthday is not None:
+            user.birthday = user_update.birthday
+        if user_update.email is not None:
+            user.email = user_update.email
+        if user_update.countries is not None:
+            user.countries = user_update.countries
+        if user_update.password is not None:
+            hashed_password = await password_hasher.hash(user_update.password)
+            user.password = hashed_password
+            
+        await db.commit()
+        invalidate_user(user_id)
+
+        return FastJSONResponse({
+            "id": user.id,
+            "name": user.name,
+            "birthday": user.birthday,
+            "email": user.email,
+        })
+    except (HTTPException, HashingOverloaded):
+        raise
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system",
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/user/{user_id}/countries/count", response_model=dict, tags=["Stats"])
+async def count_user_countries(
+    user_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)
+):
+    if user_id != current_user.id:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authorized"
+        )
+    return FastJSONResponse({"user_id": user_id, "count": await country_stats.count_for_user(db, user_id=user_id)})
+
+@api_router.get("/stats/countries/top", response_model=dict, tags=["Stats"])
+async def top_countries(
+    limit: int = Query(10, ge=1, le=250),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    return FastJSONResponse({"countries": await country_stats.top(db, limit=limit)})
+
+@api_router.get("/stats/countries/{country}/users", response_model=dict, tags=["Stats"])
+async def users_who_visited(
+    country: str,
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    users = await country_stats.users_who_visited(db, country=country, after=after, limit=limit)
+    return FastJSONResponse({
+        "country": country,
+        "visitors": await country_stats.visitors(db, country=country),
+        "users": users,
+        "next": users[-1]["id"] if len(users) == limit else None,
+    })
+
+@api_router.get("/admin/users/export", tags=["Admin"])
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_passwords: bool = False,
+    after: Optional[int] = None,
+    current_user: User = Depends(deps.get_current_admin),
+):
+    # The generator runs in the threadpool and holds its own connection,
+    # reading from a server-side cursor as the client consumes the body.
+    return StreamingResponse(
+        bulk.export_users(get_engine(), format, include_passwords=include_passwords, after=after,
+                          batch_size=settings.BULK_BATCH_SIZE),
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
+
+@api_router.post("/admin/users/import", response_model=dict, tags=["Admin"])
+async def import_users(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(settings.BULK_BATCH_SIZE, ge=1, le=50000),
+    current_user: User = Depends(deps.get_current_admin),
+):
+    chunks = request.stream()
+
+    async def next_chunk() -> Optional[bytes]:
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def read_body():
+        # The body is pulled from the event loop one chunk at a time, so
+        # only the current batch is ever held in memory.
+        while True:
+            chunk = from_thread.run(next_chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    try:
+        totals = await run_in_threadpool(
+            bulk.import_users, get_engine(), bulk.iter_lines(read_body()), format,
+            batch_size=batch_size, progress=bulk.log_progress,
+        )
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid record: {e}")
+    return FastJSONResponse(totals)
+
+Gauge(
+    "password_hash_pending", "Hashing calls running or waiting for a worker.",
+    collect=lambda: [((), password_hasher.pending)],
+)
+
+@api_router.get("/metrics", tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def metrics():
+    return Response(content=METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
 app.include_router(api_router)
\ No newline at end of file
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The service modules, and the shared `observability` package next to them.
+sys.path[:0] = [BACKEND, os.path.dirname(BACKEND)]
+
+# Settings are read at import time; tests never use the configured engines.
+os.environ.update(DATABASE_URL="sqlite://", DB_ASYNC="false", TRACE_EXPORT="")
+for key, value in {
+    "back_baseUrl": "http://localhost:8000",
+    "front_baseUrl": "http://localhost:3000",
+    "client_id": "test-client",
+    "project_id": "test-project",
+    "auth_uri": "http://google.test/o/oauth2/auth",
+    "token_uri": "http://google.test/token",
+    "auth_provider_x509_cert_url": "http://google.test/certs",
+    "client_secret": "test-secret",
+    "PYTHONPATH": BACKEND,
+    "ARGON2_TIME_COST": "1",
+    "ARGON2_MEMORY_COST": "1024",
+}.items():
+    os.environ.setdefault(key, value)
+
+
+def _sqlite_engine(path):
+    from db.db import Base
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = _sqlite_engine(tmp_path / "users.db")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def other_engine(tmp_path):
+    engine = _sqlite_engine(tmp_path / "other.db")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
@@ -0,0 +1,160 @@
+import csv
+import datetime
+import io
+import os
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from db import bulk
+from db.db import CountryVisitCount, User
+
+HASH = "$argon2id$v=19$m=1024,t=1,p=1$c2FsdHNhbHQ$aGFzaGhhc2hoYXNoaGFzaA"
+
+
+def add_users(engine, *users):
+    session = sessionmaker(bind=engine)()
+    session.add_all(users)
+    session.commit()
+    ids = [user.id for user in users]
+    session.close()
+    return ids
+
+
+def exported(engine, fmt="ndjson", **kwargs):
+    return b"".join(bulk.export_users(engine, fmt, **kwargs))
+
+
+def records(engine, **kwargs):
+    with engine.connect() as connection:
+        return list(bulk.iter_users(connection, **kwargs))
+
+
+def without_ids(items):
+    return [{key: value for key, value in item.items() if key != "id"} for item in items]
+
+
+def visitors(engine):
+    with engine.connect() as connection:
+        return dict(connection.execute(select(CountryVisitCount.country, CountryVisitCount.visitors)).all())
+
+
+@pytest.mark.parametrize("fmt", bulk.FORMATS)
+def test_round_trip_keeps_null_birthday_and_password(engine, other_engine, fmt):
+    add_users(
+        engine,
+        # What a Google sign-up leaves behind: no birthday, no password.
+        User(name="Google User", birthday=None, email="google@example.com", password=None, countries=[]),
+        User(name="Ana", birthday=datetime.date(1990, 5, 17), email="ana@example.com", password=HASH,
+             countries=["Peru", "France"]),
+    )
+
+    body = exported(engine, fmt, include_passwords=True)
+    totals = bulk.import_users(other_engine, bulk.iter_lines([body]), fmt)
+
+    assert totals["inserted"] == 2
+    assert without_ids(records(other_engine, include_passwords=True)) == without_ids(
+        records(engine, include_passwords=True)
+    )
+    session = sessionmaker(bind=other_engine)()
+    google = session.scalars(select(User).where(User.email == "google@example.com")).one()
+    assert google.birthday is None and google.password is None
+    session.close()
+    assert visitors(other_engine) == {"France": 1, "Peru": 1}
+
+
+def test_import_skips_existing_and_duplicate_emails(engine):
+    add_users(engine, User(name="Old", birthday=None, email="old@example.com", password=None, countries=["Chile"]))
+    lines = [
+        '{"name": "Old again", "email": " OLD@example.com ", "countries": ["Japan"]}\n',
+        '{"name": "New", "email": "new@example.com", "countries": ["Japan", "Chile"]}\n',
+        '{"name": "New twice", "email": "New@Example.com"}\n',
+        '{"name": "No email"}\n',
+    ]
+
+    totals = bulk.import_users(engine, lines)
+
+    assert {key: totals[key] for key in ("read", "inserted", "skipped", "invalid")} == {
+        "read": 4, "inserted": 1, "skipped": 2, "invalid": 1,
+    }
+    assert [(item["name"], item["countries"]) for item in records(engine)] == [
+        ("Old", ["Chile"]), ("New", ["Chile", "Japan"]),
+    ]
+    assert visitors(engine) == {"Chile": 2, "Japan": 1}
+
+
+def test_import_commits_in_batches_and_reports_progress(engine):
+    lines = ['{"email": "user%d@example.com"}\n' % index for index in range(5)]
+    reports = []
+
+    totals = bulk.import_users(engine, lines, batch_size=2, progress=reports.append)
+
+    assert [report["read"] for report in reports] == [2, 4, 5]
+    assert totals["batches"] == 3 and totals["inserted"] == 5
+
+
+def test_export_resumes_after_id(engine):
+    ids = add_users(engine, *(
+        User(name=f"user {index}", birthday=None, email=f"user{index}@example.com", password=None,
+             countries=["Peru"] if index % 2 else [])
+        for index in range(5)
+    ))
+
+    assert [item["id"] for item in records(engine, after=ids[2])] == ids[3:]
+    # Users spanning several joined rows must not be split across fetches.
+    assert [item["id"] for item in records(engine, batch_size=1)] == ids
+    assert exported(engine, after=ids[-1]) == b""
+
+
+def test_csv_export_has_header_and_joined_countries(engine):
+    add_users(engine, User(name="Ana", birthday=None, email="ana@example.com", password=HASH, countries=["Peru", "Chile"]))
+
+    rows = list(csv.DictReader(io.StringIO(exported(engine, "csv").decode())))
+
+    assert list(rows[0]) == list(bulk.FIELDS)
+    assert rows[0]["countries"] == "Chile;Peru" and rows[0]["birthday"] == ""
+
+
+def test_iter_lines_joins_lines_split_across_chunks():
+    chunks = [b'\xef\xbb\xbf{"a": "\xc3', b'\xa9"}\n{"b"', b": 1}\r\n", b'{"c": 2}']
+
+    assert list(bulk.iter_lines(chunks)) == ['{"a": "\xe9"}\n', '{"b": 1}\r\n', '{"c": 2}']
+
+
+def test_copy_input_reads_quoted_empty_fields_as_null():
+    buffer = bulk._copy_buffer([
+        {"name": None, "birthday": None, "email": "google@example.com", "password": None},
+        {"name": "Ana", "birthday": datetime.date(1990, 5, 17), "email": "ana@example.com", "password": HASH},
+    ])
+
+    assert buffer.getvalue().splitlines() == [
+        '"","","google@example.com",""',
+        f'"Ana","1990-05-17","ana@example.com","{HASH}"',
+    ]
+    assert "FORCE_NULL (name, birthday, password)" in bulk._COPY_USERS
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="set TEST_POSTGRES_URL to run against PostgreSQL")
+def test_copy_round_trip_on_postgres(engine):
+    from db.db import Base
+
+    postgres = create_engine(os.environ["TEST_POSTGRES_URL"])
+    Base.metadata.drop_all(postgres)
+    Base.metadata.create_all(postgres)
+    try:
+        add_users(
+            engine,
+            User(name="Google User", birthday=None, email="google@example.com", password=None, countries=["Peru"]),
+            User(name="Ana", birthday=datetime.date(1990, 5, 17), email="ana@example.com", password=HASH, countries=[]),
+        )
+        body = exported(engine, include_passwords=True)
+
+        assert bulk.import_users(postgres, bulk.iter_lines([body]))["inserted"] == 2
+        assert bulk.import_users(postgres, bulk.iter_lines([body]))["skipped"] == 2
+        assert without_ids(records(postgres, include_passwords=True)) == without_ids(
+            records(engine, include_passwords=True)
+        )
+    finally:
+        Base.metadata.drop_all(postgres)
+        postgres.dispose()
@@ -0,0 +1,38 @@
+import asyncio
+
+from crud.crud_user import async_user, user
+from db.db import User
+from db.session import SyncSessionAdapter
+
+
+def add_users(session, count):
+    users = [User(name=f"user {index}", birthday=None, email=f"user{index}@example.com", password=None, countries=[])
+             for index in range(count)]
+    session.add_all(users)
+    session.commit()
+    return [item.id for item in users]
+
+
+def test_get_multi_pages_by_id(session):
+    ids = add_users(session, 7)
+
+    pages, after = [], None
+    while True:
+        page = user.get_multi(session, after=after, limit=3)
+        if not page:
+            break
+        pages.append([item.id for item in page])
+        after = page[-1].id
+
+    assert pages == [ids[:3], ids[3:6], ids[6:]]
+
+
+def test_async_get_multi_pages_by_id(session):
+    ids = add_users(session, 5)
+    db = SyncSessionAdapter(session)
+
+    first = asyncio.run(async_user.get_multi(db, limit=2))
+    rest = asyncio.run(async_user.get_multi(db, after=first[-1].id))
+
+    assert [item.id for item in first] == ids[:2]
+    assert [item.id for item in rest] == ids[2:]
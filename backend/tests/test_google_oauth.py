@@ -0,0 +1,92 @@
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+
+from db.db import User
+from db.session import SyncSessionAdapter
+from google_oauth import GoogleOAuthClient, GoogleOAuthConfig, OAuthState
+from google_oauth_stub import create_app
+
+
+@pytest.fixture
+def backend(session):
+    """The backend app, signing in against the Google stub and writing to the test database."""
+    import main
+    from auth_token import get_async_db
+    from config import settings
+
+    async def test_db():
+        yield SyncSessionAdapter(session)
+
+    google = main.google_oauth
+    main.google_oauth = GoogleOAuthClient(GoogleOAuthConfig.from_settings(settings),
+                                          transport=httpx.ASGITransport(app=create_app()))
+    main.app.dependency_overrides[get_async_db] = test_db
+    yield main
+    main.app.dependency_overrides.pop(get_async_db)
+    main.google_oauth = google
+
+
+def sign_in(backend, tamper=None):
+    """Follow /api/login and /oauth/start through the stub's consent page back to /oauth/callback."""
+    async def call():
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost:8000") as client:
+            login = await client.get("/api/login")
+            start = await client.get(login.headers["location"])
+            assert start.status_code == 307
+            consent = await backend.google_oauth.client.get(start.headers["location"])
+            callback = consent.headers["location"]
+            if tamper is not None:
+                callback = tamper(client, callback)
+            return await client.get(callback)
+
+    return asyncio.run(call())
+
+
+def test_callback_signs_in_through_the_stub(backend, session):
+    response = sign_in(backend)
+
+    assert response.status_code == 307
+    location = urlsplit(response.headers["location"])
+    query = parse_qs(location.query)
+    account = session.query(User).filter_by(email="stub.user@example.com").one()
+    assert location.path == "/Globetrek/en/new_password"
+    assert query["id"] == [str(account.id)] and query["token"]
+    assert 'oauth_state=""' in response.headers["set-cookie"]
+
+    assert urlsplit(sign_in(backend).headers["location"]).path == "/Globetrek/en/home"
+
+
+def replace_state(client, callback):
+    return callback.replace("state=", "state=forged")
+
+
+def drop_cookie(client, callback):
+    client.cookies.clear()
+    return callback
+
+
+def drop_state(client, callback):
+    return callback.split("&state=")[0]
+
+
+@pytest.mark.parametrize("tamper", [replace_state, drop_cookie, drop_state])
+def test_callback_rejects_a_state_it_did_not_issue(backend, session, tamper):
+    response = sign_in(backend, tamper)
+
+    assert response.status_code == 400
+    assert session.query(User).count() == 0
+
+
+def test_state_cookie_expires():
+    now = [1000.0]
+    states = OAuthState("secret", ttl=600, clock=lambda: now[0])
+    state, cookie = states.issue()
+
+    assert states.verify(state, cookie)
+    assert not OAuthState("other secret").verify(state, cookie)
+    now[0] += 601
+    assert not states.verify(state, cookie)
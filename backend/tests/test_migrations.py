@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from db import migrations
+
+
+def test_migrations_run_once(engine, monkeypatch):
+    calls = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        ("0001_first", lambda conn: calls.append("first")),
+        ("0002_second", lambda conn: calls.append("second")),
+    ])
+
+    migrations.run_migrations(engine)
+    migrations.run_migrations(engine)
+
+    assert calls == ["first", "second"]
+    with engine.connect() as conn:
+        assert migrations.applied_migrations(conn) == ["0001_first", "0002_second"]
+
+
+def test_failed_migration_is_retried(engine, monkeypatch):
+    def broken(conn):
+        conn.execute(text("INSERT INTO country_visit_count (country, visitors) VALUES ('Peru', 1)"))
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [("0001_broken", broken)])
+    with pytest.raises(RuntimeError):
+        migrations.run_migrations(engine)
+
+    with engine.connect() as conn:
+        assert migrations.applied_migrations(conn) == []
+        assert conn.execute(text("SELECT COUNT(*) FROM country_visit_count")).scalar() == 0
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [("0001_broken", lambda conn: None)])
+    migrations.run_migrations(engine)
+    with engine.connect() as conn:
+        assert migrations.applied_migrations(conn) == ["0001_broken"]
+
+
+def test_recorded_migrations_are_not_rerun(engine):
+    migrations.run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO country_visit_count (country, visitors) VALUES ('Peru', 5)"))
+
+    migrations.run_migrations(engine)
+
+    # The totals rebuild of 0002 would have reset this row.
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT visitors FROM country_visit_count")).scalar() == 5
+
+
+def test_duplicate_emails_stop_the_migration_without_deleting_accounts(engine):
+    with engine.begin() as conn:
+        # A database from before the unique index.
+        conn.execute(text("DROP INDEX ix_user_email"))
+        conn.execute(text(
+            'INSERT INTO "user" (id, name, email) VALUES '
+            "(1, 'Ana', 'ana@example.com'), (2, 'Bob', 'bob@example.com'), "
+            "(3, 'Ana again', ' ANA@example.com'), (4, 'Bob again', 'Bob@Example.com ')"
+        ))
+        conn.execute(text("INSERT INTO visited_country (user_id, country) VALUES (3, 'Peru')"))
+
+    with pytest.raises(migrations.DuplicateEmailError) as error:
+        migrations.run_migrations(engine)
+
+    assert error.value.groups == [[1, 3], [2, 4]]
+    assert "1, 3; 2, 4" in str(error.value)
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM "user"')).scalar() == 4
+        assert conn.execute(text("SELECT user_id FROM visited_country")).scalars().all() == [3]
+        assert migrations.applied_migrations(conn) == []
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE \"user\" SET email = 'ana.2@example.com' WHERE id = 3"))
+        conn.execute(text("UPDATE \"user\" SET email = 'bob.2@example.com' WHERE id = 4"))
+    migrations.run_migrations(engine)
+    with engine.connect() as conn:
+        assert migrations.applied_migrations(conn) == ["0001_unique_normalized_email", "0002_visited_countries_table"]
+
+
+def test_constraint_errors_inside_a_migration_propagate(engine, monkeypatch):
+    def conflicting(conn):
+        conn.execute(text("INSERT INTO country_visit_count (country, visitors) VALUES ('Peru', 1)"))
+        conn.execute(text("INSERT INTO country_visit_count (country, visitors) VALUES ('Peru', 2)"))
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [("0001_conflicting", conflicting)])
+    with pytest.raises(IntegrityError):
+        migrations.run_migrations(engine)
+
+    with engine.connect() as conn:
+        assert migrations.applied_migrations(conn) == []
@@ -0,0 +1,57 @@
+import time
+from typing import Optional
+
+from jose import JWTError, jwt
+
+from cache import TTLCache
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens locally with the secret shared by the backend and
+    the Node API, so invalid or expired tokens are rejected at the edge.
+    Valid payloads are memoized per token until they expire or the cache TTL
+    runs out, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str],
+        algorithm: str = "HS256",
+        *,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0,
+    ):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def verify(self, token: str) -> Optional[dict]:
+        if not token or not self.secret:
+            return None
+        payload = self.cache.get(token)
+        if payload is not None:
+            return payload
+        try:
+            payload = jwt.decode(
+                token,
+                self.secret,
+                algorithms=[self.algorithm],
+                options={"verify_aud": False, "require_exp": True},
+            )
+        except JWTError:
+            return None
+        if payload.get("sub") is None:
+            return None
+        remaining = payload["exp"] - time.time()
+        self.cache.set(token, payload, ttl=min(self.cache.ttl, remaining))
+        return payload
+
+    def issue(self, sub: str, lifetime: float) -> str:
+        """Mint a short-lived token for `sub`, for calls the gateway makes on a user's behalf."""
+        now = int(time.time())
+        return jwt.encode(
+            {"type": "access_token", "sub": str(sub), "iat": now, "exp": now + int(lifetime)},
+            self.secret,
+            algorithm=self.algorithm,
+        )
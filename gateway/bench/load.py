@@ -0,0 +1,284 @@
+"""
+Load test of the gateway against in-process stand-ins for the backend and
+the Node API (see `bench.upstreams`). Run from the gateway directory:
+
+    PYTHONPATH=.. python -m bench.load --concurrency 32 --requests 2000 --llm-delay 1.5 --output run.json
+
+The gateway, the stand-ins and the load generator share one event loop and
+talk over ASGI transports, so the numbers are the gateway's own overhead
+plus the simulated upstream delays, without network noise. `--gateway-url`
+sends the same mix to a running gateway instead.
+
+The report is JSON: throughput and p50/p95/p99 latency per route and
+overall, plus the settings of the run, so runs can be compared over time.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.upstreams import CITIES, fake_backend, fake_nodeapi
+
+BENCH_SECRET = "bench-secret"
+# Limits the gateway is configured with in-process; the rate limiter would
+# otherwise turn most of the generated load into 429s.
+BENCH_ENV = {
+    "BACK_BASE_URL": "http://backend",
+    "API_BASE_URL": "http://nodeapi",
+    "JWT_SECRET": BENCH_SECRET,
+    "ITINERARY_CACHE_PATH": "",
+    "JOB_STORE_PATH": "",
+    "TRACE_EXPORT": "",
+    "PERSONALIZE_RATE_PER_MIN": "1000000000",
+    "PERSONALIZE_BURST": "1000000000",
+    "PERSONALIZE_MAX_CONCURRENT": "1000000",
+    "PLACE_INFO_RATE_PER_MIN": "1000000000",
+    "PLACE_INFO_BURST": "1000000000",
+    "LOGIN_RATE_PER_MIN": "1000000000",
+    "LOGIN_BURST": "1000000000",
+}
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    weight: int
+    body: Optional[dict] = None
+    auth: bool = True
+
+
+SCENARIOS = [
+    Scenario("login", "POST", "/login", 1, {"username": "bench@example.com", "password": "password"}, auth=False),
+    Scenario("user", "GET", "/user/{user_id}", 4),
+    Scenario("dashboard", "GET", "/dashboard/{user_id}", 3),
+    Scenario("itineraries_by_user", "GET", "/itineraries/byUser/{user_id}", 3),
+    Scenario("itinerary_get", "GET", "/itineraries/get/{itinerary_id}", 4),
+    Scenario("place_info", "GET", "/place/info/{city}/{country}", 2),
+    Scenario("personalize", "POST", "/itineraries/personalize/{city}/{country}", 1,
+             {"prompt": "Three days, museums and food", "language": "English"}),
+    Scenario("personalize_stream", "POST", "/itineraries/personalize/stream/{city}/{country}?format=ndjson", 1,
+             {"prompt": "Three days, museums and food", "language": "English"}),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> dict:
+    latencies = sorted(seconds * 1000 for _, seconds in samples)
+    statuses: Dict[str, int] = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenarios: List[Scenario],
+    *,
+    token: str,
+    concurrency: int,
+    requests: int,
+    duration: Optional[float],
+    warmup: int,
+    users: int,
+    seed: int,
+) -> dict:
+    """
+    Closed-loop load: `concurrency` workers each send one request at a time,
+    drawn from the weighted scenarios, until `requests` were sent or
+    `duration` seconds passed. The first `warmup` requests are not counted.
+    """
+    draw = random.Random(seed)
+    population = [scenario for scenario in scenarios for _ in range(scenario.weight)]
+    results: Dict[str, List[tuple]] = {scenario.name: [] for scenario in scenarios}
+    headers = {"Authorization": f"Bearer {token}"}
+    sent = 0
+    measured_from: List[float] = []
+    deadline = None
+
+    async def send(scenario: Scenario) -> tuple:
+        city, country = draw.choice(CITIES)
+        path = scenario.path.format(
+            user_id=draw.randint(1, users), itinerary_id=f"{draw.randint(1, 10**6):024x}", city=city, country=country
+        )
+        start = time.perf_counter()
+        try:
+            response = await client.request(
+                scenario.method, path, json=scenario.body, headers=headers if scenario.auth else None
+            )
+            await response.aread()
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "error"
+        return status, time.perf_counter() - start
+
+    async def worker():
+        nonlocal sent, deadline
+        while sent < warmup + requests and (deadline is None or time.perf_counter() < deadline):
+            index = sent
+            sent += 1
+            if index == warmup:
+                measured_from.append(time.perf_counter())
+                if duration:
+                    deadline = measured_from[0] + duration
+            scenario = draw.choice(population)
+            sample = await send(scenario)
+            if index >= warmup:
+                results[scenario.name].append(sample)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - (measured_from[0] if measured_from else started)
+    every = [sample for samples in results.values() for sample in samples]
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(every, elapsed),
+        "routes": {name: summarize(samples, elapsed) for name, samples in results.items() if samples},
+    }
+
+
+async def _in_process(args, scenarios: List[Scenario]) -> dict:
+    os.environ.update(BENCH_ENV)
+    import main
+
+    main.backend.transport = httpx.ASGITransport(app=fake_backend(
+        BENCH_SECRET, latency=args.upstream_latency, hash_delay=args.hash_delay,
+    ))
+    main.nodeapi.transport = main.llm.transport = httpx.ASGITransport(app=fake_nodeapi(
+        latency=args.upstream_latency, llm_delay=args.llm_delay, token_delay=args.token_delay,
+        error_rate=args.error_rate, itineraries_per_user=args.itineraries, seed=args.seed,
+    ))
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://gateway", timeout=args.timeout
+        ) as client:
+            return await run_load(
+                client, scenarios, token=main.token_verifier.issue("1", lifetime=3600),
+                concurrency=args.concurrency, requests=args.requests, duration=args.duration,
+                warmup=args.warmup, users=args.users, seed=args.seed,
+            )
+
+
+async def _remote(args, scenarios: List[Scenario]) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.gateway_url, timeout=args.timeout, limits=limits) as client:
+        token = args.token
+        if token is None:
+            response = await client.post("/login", json={"username": args.username, "password": args.password})
+            response.raise_for_status()
+            token = response.json()["access_token"]
+        return await run_load(
+            client, scenarios, token=token,
+            concurrency=args.concurrency, requests=args.requests, duration=args.duration,
+            warmup=args.warmup, users=args.users, seed=args.seed,
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests, after the warmup")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--scenarios", default=None, help="comma-separated subset of: " + ", ".join(s.name for s in SCENARIOS))
+    parser.add_argument("--users", type=int, default=100, help="distinct user ids in the generated paths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=None, help="write the report to this file as well")
+    stand_ins = parser.add_argument_group("in-process upstreams")
+    stand_ins.add_argument("--upstream-latency", type=float, default=0.002)
+    stand_ins.add_argument("--hash-delay", type=float, default=0.0, help="extra login delay, standing in for argon2")
+    stand_ins.add_argument("--llm-delay", type=float, default=1.0)
+    stand_ins.add_argument("--token-delay", type=float, default=0.01)
+    stand_ins.add_argument("--error-rate", type=float, default=0.02)
+    stand_ins.add_argument("--itineraries", type=int, default=20, help="itineraries per user in listings")
+    remote = parser.add_argument_group("running gateway")
+    remote.add_argument("--gateway-url", default=None)
+    remote.add_argument("--token", default=None, help="bearer token; otherwise one is obtained from /login")
+    remote.add_argument("--username", default="bench@example.com")
+    remote.add_argument("--password", default="password")
+    args = parser.parse_args(argv)
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        wanted = set(args.scenarios.split(","))
+        unknown = wanted - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in wanted]
+
+    result = asyncio.run(_remote(args, scenarios) if args.gateway_url else _in_process(args, scenarios))
+    report = {
+        "benchmark": "gateway.load",
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "target": args.gateway_url or "in-process",
+        "settings": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "scenarios": {scenario.name: scenario.weight for scenario in scenarios},
+            "upstreams": None if args.gateway_url else {
+                "latency": args.upstream_latency,
+                "hash_delay": args.hash_delay,
+                "llm_delay": args.llm_delay,
+                "token_delay": args.token_delay,
+                "error_rate": args.error_rate,
+                "itineraries": args.itineraries,
+            },
+        },
+        **result,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
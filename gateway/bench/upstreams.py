@@ -0,0 +1,182 @@
+"""
+In-process stand-ins for the user backend and the Node API, serving the
+routes and payload shapes the gateway relies on. Delays are simulated with
+`asyncio.sleep`, so hundreds of slow calls cost no CPU, and a share of the
+Node API reads fail with the HTML error pages a proxy in front of it would
+return.
+"""
+import asyncio
+import datetime
+import json
+import random
+import time
+
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+ERROR_PAGE = "<html><head><title>{status}</title></head><body><h1>{status} {reason}</h1><hr><center>nginx</center></body></html>"
+CITIES = [("Paris", "France"), ("Lisbon", "Portugal"), ("Kyoto", "Japan"), ("Lima", "Peru"), ("Oslo", "Norway")]
+
+
+def itinerary(index: int, owner: str, days: int = 3, places: int = 2) -> dict:
+    city, country = CITIES[index % len(CITIES)]
+    start = datetime.date(2025, 6, 1) + datetime.timedelta(days=index)
+    return {
+        "_id": f"{index:024x}",
+        "destination": city,
+        "startDate": start.isoformat(),
+        "endDate": (start + datetime.timedelta(days=days)).isoformat(),
+        "state": ("planned", "done")[index % 2],
+        "owner": owner,
+        "country": country,
+        "city": city,
+        "stars": index % 5,
+        "itinerary": [
+            {
+                "day": f"Day {day + 1}",
+                "description": [
+                    {
+                        "place": f"Place {day}-{place}",
+                        "description": "What to see there, its history and why it matters. " * 3,
+                        "tips": "Go early and book tickets online.",
+                        "checked": False,
+                    }
+                    for place in range(places)
+                ],
+            }
+            for day in range(days)
+        ],
+    }
+
+
+def fake_backend(secret: str, *, latency: float = 0.002, hash_delay: float = 0.0) -> Starlette:
+    """
+    The user backend: login, signup, users and country statistics.
+    **Parameters**
+    * `secret`: Key the issued tokens are signed with, shared with the gateway
+    * `latency`: Delay added to every response
+    * `hash_delay`: Extra delay of login and signup, standing in for argon2
+    """
+
+    def user(user_id: int) -> dict:
+        return {
+            "id": user_id,
+            "name": f"user {user_id}",
+            "email": f"user{user_id}@example.com",
+            "birthday": "1990-01-01",
+            "countries": [country for _, country in CITIES[: 1 + user_id % len(CITIES)]],
+        }
+
+    async def login(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency + hash_delay)
+        if body.get("password") != "password":
+            return JSONResponse({"detail": "Incorrect username or password"}, status_code=400)
+        user_id = 1 + sum(map(ord, body.get("username", ""))) % 1000
+        token = jwt.encode({"sub": str(user_id), "exp": int(time.time()) + 3600}, secret, algorithm="HS256")
+        return JSONResponse({"access_token": token, "token_type": "bearer", "user_id": user_id})
+
+    async def signup(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency + hash_delay)
+        return JSONResponse({**user(random.randint(1000, 10**6)), "email": body.get("email")})
+
+    async def get_user(request: Request):
+        await asyncio.sleep(latency)
+        return JSONResponse(user(int(request.path_params["user_id"])))
+
+    async def top_countries(request: Request):
+        await asyncio.sleep(latency)
+        return JSONResponse({"countries": [{"country": country, "visitors": 100 - index} for index, (_, country) in enumerate(CITIES)]})
+
+    return Starlette(routes=[
+        Route("/login", login, methods=["POST"]),
+        Route("/signup", signup, methods=["POST"]),
+        Route("/user/{user_id:int}", get_user, methods=["GET"]),
+        Route("/stats/countries/top", top_countries, methods=["GET"]),
+    ])
+
+
+def fake_nodeapi(
+    *,
+    latency: float = 0.005,
+    llm_delay: float = 1.0,
+    token_delay: float = 0.02,
+    error_rate: float = 0.0,
+    itineraries_per_user: int = 20,
+    seed: int = 0,
+) -> Starlette:
+    """
+    The Node API: itineraries, places and LLM generation.
+    **Parameters**
+    * `latency`: Delay added to every response
+    * `llm_delay`: Time a non-streamed generation takes
+    * `token_delay`: Delay between streamed generation chunks
+    * `error_rate`: Share of reads answered with a 502/503 HTML page
+    * `itineraries_per_user`: Length of the by-user listing
+    * `seed`: Seed of the error draw, for reproducible runs
+    """
+    draw = random.Random(seed)
+
+    def failure():
+        if error_rate and draw.random() < error_rate:
+            status, reason = draw.choice(((502, "Bad Gateway"), (503, "Service Temporarily Unavailable")))
+            return HTMLResponse(ERROR_PAGE.format(status=status, reason=reason), status_code=status)
+        return None
+
+    async def by_user(request: Request):
+        await asyncio.sleep(latency)
+        owner = request.path_params["uid"]
+        items = [itinerary(index, owner) for index in range(itineraries_per_user)]
+        if request.query_params.get("limit"):
+            limit = int(request.query_params["limit"])
+            return JSONResponse({"itineraries": items[:limit], "next_cursor": None})
+        return failure() or JSONResponse(items)
+
+    async def get_itinerary(request: Request):
+        await asyncio.sleep(latency)
+        return failure() or JSONResponse(itinerary(7, "1"))
+
+    async def place_info(request: Request):
+        await asyncio.sleep(latency * 4)
+        city, country = request.path_params["city"], request.path_params["country"]
+        return failure() or JSONResponse({
+            "location": {"lon": "2.35", "lat": "48.85", "display_name": f"{city}, {country}"},
+            "nearbyPlaces": [{"name": f"Museum {index}", "address": f"{index} Main St", "fee": "yes"} for index in range(20)],
+        })
+
+    async def personalize(request: Request):
+        await request.body()
+        await asyncio.sleep(llm_delay)
+        # The Node API sends the model output as-is, not as a JSON string.
+        return Response(json.dumps({"destination": request.path_params["city"], "itinerary": itinerary(1, "1")["itinerary"]}),
+                        media_type="text/html; charset=utf-8")
+
+    async def personalize_stream(request: Request):
+        await request.body()
+        text = json.dumps({"destination": request.path_params["city"], "itinerary": itinerary(1, "1")["itinerary"]})
+        chunks = [text[index:index + 64] for index in range(0, len(text), 64)]
+
+        async def generate():
+            for chunk in chunks:
+                await asyncio.sleep(token_delay)
+                yield json.dumps({"response": chunk, "done": False}) + "\n"
+            yield json.dumps({"response": "", "done": True}) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    async def destination(request: Request):
+        await asyncio.sleep(latency)
+        return JSONResponse({"_id": request.path_params["destination_id"], "location": {"city": "Paris", "country": "France"}})
+
+    return Starlette(routes=[
+        Route("/itineraries/byUser/{uid}", by_user, methods=["GET"]),
+        Route("/itineraries/get/{itinerary_id}", get_itinerary, methods=["GET"]),
+        Route("/place/info/{city}/{country}", place_info, methods=["GET"]),
+        Route("/itineraries/personalize/stream/{city}/{country}", personalize_stream, methods=["POST"]),
+        Route("/itineraries/personalize/{city}/{country}", personalize, methods=["POST"]),
+        Route("/destination/{destination_id}", destination, methods=["GET"]),
+    ])
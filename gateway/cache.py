@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry expiry and LRU eviction.
+    **Parameters**
+    * `maxsize`: Maximum number of entries kept
+    * `ttl`: Default time to live of an entry, in seconds
+    * `max_bytes`: Optional bound on the summed `sizeof` of all values
+    * `sizeof`: Size of a value in bytes, required with `max_bytes`
+    * `clock`: Monotonic clock used for expiry, overridable for tests
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        *,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            self._discard(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        size = self._sizeof(value)
+        self.pop(key)
+        if ttl <= 0 or (self.max_bytes is not None and size > self.max_bytes):
+            return
+        self._data[key] = (self._clock() + ttl, value)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            self._discard(next(iter(self._data)))
+            self.evictions += 1
+
+    def _discard(self, key: Hashable) -> Any:
+        _, value = self._data.pop(key)
+        self.bytes -= self._sizeof(value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            return default
+        return self._discard(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    body: bytes
+    media_type: str = "application/json"
+
+
+class ResponseCache:
+    """
+    Caches successful upstream responses as raw bytes and coalesces concurrent
+    misses for the same key into a single upstream call. The upstream call runs
+    in its own task, so one caller disconnecting does not fail the others.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, max_bytes: Optional[int] = None):
+        self.cache = TTLCache(
+            maxsize=maxsize, ttl=ttl, max_bytes=max_bytes, sizeof=lambda entry: len(entry.body)
+        )
+        self._inflight: Dict[Hashable, "asyncio.Task[CachedResponse]"] = {}
+        self.coalesced = 0
+
+    async def get_or_fetch(
+        self, key: Hashable, fetch: Callable[[], Awaitable[CachedResponse]]
+    ) -> CachedResponse:
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[CachedResponse]]) -> CachedResponse:
+        try:
+            entry = await fetch()
+            if entry.status_code == 200:
+                self.cache.set(key, entry)
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.cache.pop(key)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "coalesced": self.coalesced, "inflight": len(self._inflight)}
@@ -0,0 +1,26 @@
+from collections import Counter
+from typing import Any, List, Optional
+
+
+def _as_list(countries: Any) -> List[str]:
+    # Older user records store visited countries as one comma-separated string.
+    if isinstance(countries, str):
+        return [country.strip() for country in countries.split(",") if country.strip()]
+    return list(countries or [])
+
+
+def summarize(user: Optional[dict], itineraries: Optional[list]) -> dict:
+    """Derived home-screen fields; each part is None when its source is missing."""
+    summary: dict = {"visited_countries": None, "visited_country_count": None, "itineraries": None}
+    if user is not None:
+        visited = sorted(set(_as_list(user.get("countries"))))
+        summary.update(visited_countries=visited, visited_country_count=len(visited))
+    if itineraries is not None:
+        states = Counter(item.get("state") or "unknown" for item in itineraries)
+        summary["itineraries"] = {
+            "count": len(itineraries),
+            "days": sum(len(item.get("itinerary") or []) for item in itineraries),
+            "by_state": dict(states),
+            "countries": sorted({item["country"] for item in itineraries if item.get("country")}),
+        }
+    return summary
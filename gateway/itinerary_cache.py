@@ -0,0 +1,181 @@
+"""
+Disk-backed cache of generated itineraries, keyed by a hash of the
+normalized request so identical personalizations are served without
+running the LLM again.
+
+Operators can manage it from the command line:
+
+    python itinerary_cache.py stats
+    python itinerary_cache.py seed itineraries.jsonl
+    python itinerary_cache.py purge [--expired]
+
+Seed files hold one JSON object per line with `city`, `country`, `prompt`,
+an optional `language` and the `result` to serve.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from typing import Any, Optional
+
+from codec import dumps, loads
+
+
+def normalize_text(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def itinerary_key(city: str, country: str, language: Optional[str], prompt: str) -> str:
+    parts = [normalize_text(part) for part in (city, country, language, prompt)]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ItineraryCache:
+    """
+    SQLite-backed store with a TTL and least-recently-used eviction once the
+    stored values exceed `max_bytes`. Entries survive restarts.
+    **Parameters**
+    * `path`: Database file, created on first use
+    * `ttl`: Seconds an entry is served after it was stored
+    * `max_bytes`: Bound on the summed size of the stored values
+    """
+
+    def __init__(self, path: str, *, ttl: float = 7*24*60*60, max_bytes: int = 256*1024*1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS itinerary ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_itinerary_accessed ON itinerary (accessed_at)")
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_sync(self, key: str) -> Optional[Any]:
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value FROM itinerary WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self._conn.execute("UPDATE itinerary SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return loads(row[0])
+
+    def set_sync(self, key: str, value: Any) -> None:
+        data = dumps(value)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO itinerary (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM itinerary WHERE created_at <= ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM itinerary").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM itinerary ORDER BY accessed_at"
+        ).fetchall():
+            self._conn.execute("DELETE FROM itinerary WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def purge_sync(self, expired_only: bool = False) -> int:
+        if expired_only:
+            statement, args = "DELETE FROM itinerary WHERE created_at <= ?", (time.time() - self.ttl,)
+        else:
+            statement, args = "DELETE FROM itinerary", ()
+        return self._conn.execute(statement, args).rowcount
+
+    def stats_sync(self) -> dict:
+        entries, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM itinerary"
+        ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await self._run(self.get_sync, key)
+
+    async def set(self, key: str, value: Any) -> None:
+        await self._run(self.set_sync, key, value)
+
+    async def stats(self) -> dict:
+        return await self._run(self.stats_sync)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def main(argv=None) -> int:
+    import os
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage the gateway itinerary cache")
+    parser.add_argument("--path", default=os.getenv("ITINERARY_CACHE_PATH", "itinerary_cache.db"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats")
+    seed = commands.add_parser("seed")
+    seed.add_argument("file", type=argparse.FileType("r", encoding="utf-8"))
+    purge = commands.add_parser("purge")
+    purge.add_argument("--expired", action="store_true", help="Only drop entries past their TTL")
+    args = parser.parse_args(argv)
+
+    cache = ItineraryCache(
+        args.path,
+        ttl=float(os.getenv("ITINERARY_CACHE_TTL", 7*24*60*60)),
+        max_bytes=int(os.getenv("ITINERARY_CACHE_MAX_BYTES", 256*1024*1024)),
+    )
+    try:
+        if args.command == "seed":
+            count = 0
+            for line in args.file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                key = itinerary_key(entry["city"], entry["country"], entry.get("language"), entry["prompt"])
+                cache.set_sync(key, entry["result"])
+                count += 1
+            print(json.dumps({"seeded": count}))
+        elif args.command == "purge":
+            print(json.dumps({"purged": cache.purge_sync(expired_only=args.expired)}))
+        else:
+            print(json.dumps(cache.stats_sync()))
+    finally:
+        cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Lower runs first. Clients may only pick within the user range; the levels
+# below it are reserved for jobs the gateway submits itself.
+USER_PRIORITY = 10
+USER_PRIORITY_MAX = 20
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    kind: str
+    payload: dict
+    owner: str
+    priority: int = USER_PRIORITY
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    def public(self) -> dict:
+        data = asdict(self)
+        del data["payload"], data["result"]
+        return data
+
+
+class MemoryJobStore:
+    """Keeps jobs in a dict; they are lost when the process exits."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+
+    async def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def unfinished(self) -> List[Job]:
+        return [job for job in self._jobs.values() if job.status not in FINISHED]
+
+    async def purge(self, finished_before: float) -> int:
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED and job.finished_at < finished_before
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore:
+    """
+    Persists jobs in a SQLite file so queued work and finished results
+    survive a restart. Calls run in a worker thread.
+    **Parameters**
+    * `path`: Database file, created on first use
+    """
+
+    _COLUMNS = [name for name in Job.__dataclass_fields__]
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job ("
+            "id TEXT PRIMARY KEY, kind TEXT, payload TEXT, owner TEXT, priority INTEGER, "
+            "status TEXT, created_at REAL, started_at REAL, finished_at REAL, result TEXT, error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_job_status_finished ON job (status, finished_at)")
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn: Callable, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _row(self, job: Job) -> tuple:
+        data = asdict(job)
+        data["payload"] = json.dumps(data["payload"])
+        data["result"] = json.dumps(data["result"])
+        return tuple(data[name] for name in self._COLUMNS)
+
+    def _job(self, row: tuple) -> Job:
+        data = dict(zip(self._COLUMNS, row))
+        data["payload"] = json.loads(data["payload"])
+        data["result"] = json.loads(data["result"])
+        return Job(**data)
+
+    async def save(self, job: Job) -> None:
+        placeholders = ", ".join("?" for _ in self._COLUMNS)
+        statement = f"INSERT OR REPLACE INTO job ({', '.join(self._COLUMNS)}) VALUES ({placeholders})"
+        await self._run(self._conn.execute, statement, self._row(job))
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        def fetch():
+            return self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM job WHERE id = ?", (job_id,)
+            ).fetchone()
+        row = await self._run(fetch)
+        return self._job(row) if row else None
+
+    async def unfinished(self) -> List[Job]:
+        def fetch():
+            return self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM job WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._job(row) for row in await self._run(fetch)]
+
+    async def purge(self, finished_before: float) -> int:
+        def delete():
+            return self._conn.execute(
+                "DELETE FROM job WHERE status IN (?, ?, ?) AND finished_at < ?",
+                (*FINISHED, finished_before),
+            ).rowcount
+        return await self._run(delete)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+
+
+class JobQueue:
+    """
+    Runs submitted jobs in priority order (lowest first, FIFO among equals)
+    on a fixed number of workers, which caps the load put on the upstream.
+    Finished jobs are kept for `retention` seconds so their result can be
+    fetched, then purged.
+    **Parameters**
+    * `runner`: Coroutine function taking a `Job` and returning its result
+    * `store`: Where jobs are kept, a `MemoryJobStore` or `SQLiteJobStore`
+    * `concurrency`: Number of jobs running at once
+    * `max_pending`: Number of queued jobs accepted before `submit` raises
+      `JobQueueFull`
+    * `retention`: Seconds a finished job is kept
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Job], Awaitable[Any]],
+        store,
+        *,
+        concurrency: int = 2,
+        max_pending: int = 100,
+        retention: float = 3600.0,
+    ):
+        self.runner = runner
+        self.store = store
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.retention = retention
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._order = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        # Ids still waiting; cancelled jobs leave their heap entry behind
+        # until a worker pops it, so the heap size overstates the backlog.
+        self._queued: set = set()
+        self._cancelled: set = set()
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        self._queue = asyncio.PriorityQueue()
+        self._queued = set()
+        for job in sorted(await self.store.unfinished(), key=lambda job: job.created_at):
+            job.status, job.started_at = QUEUED, None
+            await self.store.save(job)
+            self._enqueue(job)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._purge_finished()))
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.store.close()
+
+    def _enqueue(self, job: Job) -> None:
+        self._queued.add(job.id)
+        self._queue.put_nowait((job.priority, next(self._order), job.id))
+
+    async def submit(self, kind: str, payload: dict, owner: str, priority: int = USER_PRIORITY) -> Job:
+        if len(self._queued) >= self.max_pending:
+            self.rejected += 1
+            raise JobQueueFull()
+        job = Job(kind=kind, payload=payload, owner=owner, priority=priority)
+        await self.store.save(job)
+        self._enqueue(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self.store.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        job = await self.store.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+            return job
+        self._queued.discard(job_id)
+        await self._finish(job, CANCELLED)
+        return job
+
+    async def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        job.status, job.result, job.error = status, result, error
+        job.finished_at = time.time()
+        await self.store.save(job)
+        if status == SUCCEEDED:
+            self.completed += 1
+        elif status == FAILED:
+            self.failed += 1
+        else:
+            self.cancelled += 1
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            if job_id not in self._queued:
+                continue
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception:
+                # A store error must not take the worker down with it.
+                logger.exception("Job %s could not be run", job_id)
+
+    async def _run(self, job_id: str) -> None:
+        job = await self.store.get(job_id)
+        if job is None or job.status != QUEUED:
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        await self.store.save(job)
+        task = asyncio.create_task(self.runner(job))
+        self._running[job_id] = task
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                task.cancel()
+                raise
+            await self._finish(job, CANCELLED)
+        except Exception as exc:
+            await self._finish(job, FAILED, error=str(exc) or type(exc).__name__)
+        else:
+            await self._finish(job, SUCCEEDED, result=result)
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    async def _purge_finished(self) -> None:
+        interval = min(max(self.retention / 10, 1.0), 300.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.store.purge(time.time() - self.retention)
+            except Exception:
+                logger.exception("Purging finished jobs failed")
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queued),
+            "running": len(self._running),
+            "concurrency": self.concurrency,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+        }
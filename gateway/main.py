@@ -1,269 +1,555 @@
-from datetime import time
-import json
-from fastapi import Depends, HTTPException, FastAPI, APIRouter, Response
-from typing import List, Optional
-from httpx import AsyncClient
-import os
-from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from fastapi.encoders import jsonable_encoder
-from fastapi.middleware.cors import CORSMiddleware
-from jose import jwt
-from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-
-load_dotenv()
-
-app = FastAPI(title="Gateway to API", openapi_url="/openapi.json")
-api_router = APIRouter()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-JWT_SECRET = os.getenv("JWT_SECRET")
-JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
-BACK_BASE_URL = os.getenv('BACK_BASE_URL')
-API_BASE_URL = os.getenv('API_BASE_URL')
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/login")
-    
-class UserModel(BaseModel):
-    name: str
-    birthday: str
-    password: str
-    email: str
-    countries: List[str]
-
-class UserCredentials(BaseModel):
-    username: str
-    password: str
-
-class PlaceDescription(BaseModel):
-    place: str
-    description: str
-    tips: str
-    checked: str
-       
-class ItineraryDay(BaseModel):
-    day: str
-    description: List[PlaceDescription]
-class ItineraryResponse(BaseModel):
-    destination: str
-    startDate: str
-    endDate: str
-    state: str
-    owner: str
-    country: str
-    city: str
-    itinerary: List[ItineraryDay]
-    stars: Optional[int]
-
-class PersonalizedItinerary(BaseModel):
-    prompt: str
- 
-class ItineraryListResponse(BaseModel):
-    itineraries: List[ItineraryResponse]
-    
-class TokenData(BaseModel):
-    username: Optional[str] = None
-
-def decode_jwt(token: str) -> dict:
-    try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return decoded_token if decoded_token["expires"] >= time.time() else None
-    except:
-        return {}
-                  
-@api_router.get("/api/login", tags=["Auth"])
-async def login():
-    async with AsyncClient(follow_redirects=False) as client:
-        try:
-            response = await client.get(f"{BACK_BASE_URL}/api/login")
-            if response.status_code in (307, 302):
-                return JSONResponse({"redirect_url": response.headers["location"]})
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error calling backend login API: {e}")
-
-@api_router.post("/signup", response_model=dict, status_code=200, tags=["Auth"])
-async def create_user(user: UserModel):
-    async with AsyncClient() as client:
-        response = await client.post(f"{BACK_BASE_URL}/signup", json=jsonable_encoder(user))
-        return response.json()
-
-@api_router.post("/login", response_model=dict, status_code=200, tags=["Auth"])
-async def create_user(user: UserCredentials):
-    async with AsyncClient() as client:
-        response = await client.post(
-            f"{BACK_BASE_URL}/login",
-            json=jsonable_encoder(user)
-        )
-        return response.json()
-
-@api_router.get("/user/{user_id}", response_model=dict, tags=["Users"])
-async def fetch_user(user_id: int, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.get(f"{BACK_BASE_URL}/user/{user_id}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=response.json().get("detail", "Error from backend")
-            )
-        return response.json()
-
-@api_router.patch("/user/{user_id}", response_model=dict, tags=["Users"])
-async def modify_user(user_id: int, user_update: dict, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.patch(f"{BACK_BASE_URL}/user/{user_id}", json=user_update, headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=response.json().get("detail", "Error from backend")
-            )
-        return response.json()
-
-@api_router.delete("/user/{user_id}", tags=["Users"])
-async def delete_user(user_id: int, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.delete(f"{BACK_BASE_URL}/user/{user_id}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=response.json().get("detail", "Error from backend")
-            )
-        return {"detail": "User deleted successfully"}
-    
-@api_router.post("/itineraries/create", response_model=dict, tags=["Itineraries"])
-async def create_itinerary(new_itinerary: dict, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.post(f"{API_BASE_URL}/itineraries/create", json=new_itinerary, headers={"Authorization": f"Bearer {token}"})
-        return response.json()
-
-@api_router.get("/itineraries/get/{itinerary_id}",response_model=dict, tags=["Itineraries"])
-async def get_itinerary(itinerary_id: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.get(f"{API_BASE_URL}/itineraries/get/{itinerary_id}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=response.json().get("detail", "Error from backend")
-            )
-        return response.json()
-
-    
-@api_router.get("/itineraries/byUser/{itinerary_id}",response_model=dict, tags=["Itineraries"])
-async def get_itinerary(itinerary_id: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient(timeout=60*5) as client:
-        response = await client.get(f"{API_BASE_URL}/itineraries/byUser/{itinerary_id}", headers={"Authorization": f"Bearer {token}"})
-        return {"itineraries": response.json()}
-   
-@api_router.patch("/itineraries/modify/{itinerary_id}",response_model=dict, tags=["Itineraries"])
-async def modify_itinerary(itinerary_id: str, new_itinerary:dict, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.patch(f"{API_BASE_URL}/itineraries/modify/{itinerary_id}", json=new_itinerary, headers={"Authorization": f"Bearer {token}"})
-        return response.json()
-
-@api_router.delete("/itineraries/delete/{itinerary_id}",response_model=dict, tags=["Itineraries"])
-async def delete_itinerary(itinerary_id: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.delete(f"{API_BASE_URL}/itineraries/delete/{itinerary_id}", headers={"Authorization": f"Bearer {token}"})
-        return response.json()
-
-@api_router.delete("/itineraries/deleteByOwner/{owner}",response_model=dict, tags=["Itineraries"])
-async def delete_itinerary_byOwner(owner: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.delete(f"{API_BASE_URL}/itineraries/deleteByOwner/{owner}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            return {"error": "Failed to delete itinerary, status code: {}".format(response.status_code)}
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            return {"error": "Invalid response format"}
-
-@api_router.patch("/itinerariesDays/add/{itinerary_id}", tags=["Itineraries"])
-async def add_itinerary_day(itinerary_id: str, new_day:dict, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.patch(f"{API_BASE_URL}/itinerariesDays/add/{itinerary_id}", json=new_day, headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            try:
-                error_details = response.json()
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=error_details.get("error", "Failed to add itinerary day")
-                )
-            except ValueError:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to add itinerary day. No detailed error response."
-                )
-        return response.json()
-    
-@api_router.delete("/itinerariesDays/delete/{itinerary_id}/days/{index}", tags=["Itineraries"])
-async def delete_itinerary_day(itinerary_id: str, index: int, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.delete(f"{API_BASE_URL}/itinerariesDays/delete/{itinerary_id}/days/{index}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            try:
-                error_details = response.json()
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=error_details.get("error", "Failed to delete itinerary day")
-                )
-            except ValueError:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to delete itinerary day. No detailed error response."
-                )
-        return response.json()
-
-@api_router.post("/itineraries/personalize/{city}/{country}", response_model=dict, status_code=200, tags=["Itineraries"])
-async def personalize_itinerary(city: str, country: str, prompt: PersonalizedItinerary, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient(timeout=60*5) as client:
-        try:
-            response = await client.post(f"{API_BASE_URL}/itineraries/personalize/{city}/{country}", json=prompt.dict(), headers={"Authorization": f"Bearer {token}"})
-            return {"data": response.json()}
-        except json.JSONDecodeError:
-            return {"error": "Invalid JSON response", "content": response}
-        
-@api_router.get("/place/info/{city}/{country}",response_model=dict, tags=["Places"])
-async def get_itinerary(city: str, country: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.get(f"{API_BASE_URL}/place/info/{city}/{country}", headers={"Authorization": f"Bearer {token}"})
-        return response.json()
-       
-@api_router.post("/destination", response_model=dict, tags=["Places"])
-async def create_destination(new_destination: dict, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.post(f"{API_BASE_URL}/destination", json=new_destination)
-        return response.json()
-
-@api_router.get("/destination/{destination_id}",response_model=dict, tags=["Places"])
-async def get_destination(destination_id: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.get(f"{API_BASE_URL}/destination/{destination_id}", headers={"Authorization": f"Bearer {token}"})
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code, 
-                detail=response.json().get("detail", "Error from backend")
-            )
-        return response.json()
-
-@api_router.delete("/destination/{destination_id}",response_model=dict, tags=["Places"])
-async def delete_destination(destination_id: str, token: str = Depends(oauth2_scheme)):
-    async with AsyncClient() as client:
-        response = await client.delete(f"{API_BASE_URL}/destination/{destination_id}", headers={"Authorization": f"Bearer {token}"})
-        return response.json()
-
-app.include_router(api_router)
-
-if __name__ == "__main__":
-    import uvicorn
+import asyncio
+import json
+from fastapi import Depends, HTTPException, FastAPI, APIRouter, Query, Request, Response, status
+from typing import List, Optional
+import os
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import OAuth2PasswordBearer
+from passlib.context import CryptContext
+from contextlib import asynccontextmanager
+import httpx
+from httpx import Timeout
+from upstream import Upstream, UpstreamRegistry, default_breaker, default_limits, default_retry, http2_enabled
+from auth import TokenVerifier
+from cache import CachedResponse, ResponseCache
+from streaming import STREAM_MEDIA_TYPES, relay_bytes, relay_generation
+from itinerary_cache import ItineraryCache, itinerary_key
+from ratelimit import MemoryBucketStore, RateLimiter, RateLimitMiddleware, RateLimitRule, RedisBucketStore
+from codec import FastJSONResponse, loads
+from dashboard import summarize
+from proxy import ProxyRoute, mount_proxy_routes
+from batch import BatchDispatcher, BatchRequest
+from observability.tracing import SpanExporter, TracingMiddleware, configure as configure_tracing, span
+from observability.access import MonitoringAllowlist
+from observability.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS, Gauge, MetricsMiddleware
+from jobs import CANCELLED, FAILED, SUCCEEDED, USER_PRIORITY, USER_PRIORITY_MAX, Job, JobQueue, JobQueueFull, MemoryJobStore, SQLiteJobStore
+
+load_dotenv()
+
+JWT_SECRET = os.getenv("JWT_SECRET")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+PLACE_CACHE_TTL = float(os.getenv("PLACE_CACHE_TTL", 60*60*24))
+PLACE_CACHE_MAX_ENTRIES = int(os.getenv("PLACE_CACHE_MAX_ENTRIES", 4096))
+PLACE_CACHE_MAX_BYTES = int(os.getenv("PLACE_CACHE_MAX_BYTES", 64*1024*1024))
+ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
+BACK_BASE_URL = os.getenv('BACK_BASE_URL')
+API_BASE_URL = os.getenv('API_BASE_URL')
+
+BACK_TIMEOUT = float(os.getenv("BACK_TIMEOUT", 5))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", 10))
+API_LONG_TIMEOUT = float(os.getenv("API_LONG_TIMEOUT", 60*5))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 2))
+ITINERARY_HEDGE_AFTER = float(os.getenv("ITINERARY_HEDGE_AFTER", 0.25))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 6))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 20))
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 100))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 60*60))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+PERSONALIZE_RATE_PER_MIN = float(os.getenv("PERSONALIZE_RATE_PER_MIN", 4))
+PERSONALIZE_BURST = int(os.getenv("PERSONALIZE_BURST", 2))
+PERSONALIZE_MAX_CONCURRENT = int(os.getenv("PERSONALIZE_MAX_CONCURRENT", 8))
+PLACE_INFO_RATE_PER_MIN = float(os.getenv("PLACE_INFO_RATE_PER_MIN", 60))
+PLACE_INFO_BURST = int(os.getenv("PLACE_INFO_BURST", 20))
+LOGIN_RATE_PER_MIN = float(os.getenv("LOGIN_RATE_PER_MIN", 10))
+LOGIN_BURST = int(os.getenv("LOGIN_BURST", 5))
+ITINERARY_CACHE_PATH = os.getenv("ITINERARY_CACHE_PATH", "itinerary_cache.db")
+ITINERARY_CACHE_TTL = float(os.getenv("ITINERARY_CACHE_TTL", 7*24*60*60))
+ITINERARY_CACHE_MAX_BYTES = int(os.getenv("ITINERARY_CACHE_MAX_BYTES", 256*1024*1024))
+TRACE_EXPORT = os.getenv("TRACE_EXPORT")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", 1.0))
+MONITORING_ALLOW = os.getenv("MONITORING_ALLOW")
+
+backend = Upstream(
+    "backend",
+    BACK_BASE_URL,
+    timeouts={"default": Timeout(BACK_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)},
+    limits=default_limits(),
+    http2=http2_enabled(),
+    breaker=default_breaker(),
+    retry=default_retry(),
+)
+nodeapi = Upstream(
+    "nodeapi",
+    API_BASE_URL,
+    timeouts={
+        "default": Timeout(API_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        "long": Timeout(API_LONG_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+    },
+    limits=default_limits(),
+    http2=http2_enabled(),
+    breaker=default_breaker(),
+    retry=default_retry(),
+)
+# Generation goes to the same Node API through its own pool and breaker:
+# it is slow and fails on its own often enough that, sharing the CRUD
+# breaker, it would take the itinerary routes down with it. Only an
+# unreachable or timing-out Node API trips this one.
+llm = Upstream(
+    "llm",
+    API_BASE_URL,
+    timeouts={"default": Timeout(API_LONG_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)},
+    limits=default_limits(),
+    http2=http2_enabled(),
+    breaker=default_breaker(),
+    retry=default_retry(),
+    fail_on_status=False,
+)
+upstreams = UpstreamRegistry(backend, nodeapi, llm)
+
+span_exporter = SpanExporter(TRACE_EXPORT, "gateway") if TRACE_EXPORT else None
+configure_tracing(span_exporter)
+
+monitoring_access = MonitoringAllowlist(MONITORING_ALLOW)
+
+token_verifier = TokenVerifier(JWT_SECRET, JWT_ALGORITHM, cache_size=TOKEN_CACHE_SIZE, cache_ttl=TOKEN_CACHE_TTL)
+
+def token_subject(token: str) -> Optional[str]:
+    payload = token_verifier.verify(token)
+    return str(payload["sub"]) if payload else None
+
+rate_limiter = RateLimiter(
+    rules=[
+        RateLimitRule("personalize", r"^/itineraries/personalize/", PERSONALIZE_RATE_PER_MIN / 60, PERSONALIZE_BURST, methods=("POST",), max_concurrent=PERSONALIZE_MAX_CONCURRENT),
+        RateLimitRule("place_info", r"^/place/info/", PLACE_INFO_RATE_PER_MIN / 60, PLACE_INFO_BURST, methods=("GET",)),
+        RateLimitRule("login", r"^/(login|signup)$", LOGIN_RATE_PER_MIN / 60, LOGIN_BURST, methods=("POST",)),
+    ],
+    store=RedisBucketStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBucketStore(),
+    identify=token_subject,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstreams.start()
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await upstreams.aclose()
+        if itinerary_cache is not None:
+            itinerary_cache.close()
+        if span_exporter is not None:
+            span_exporter.shutdown()
+
+app = FastAPI(title="Gateway to API", openapi_url="/openapi.json", lifespan=lifespan, default_response_class=FastJSONResponse)
+api_router = APIRouter()
+MONITORING_PATHS = (
+    "/metrics", "/upstreams/stats", "/auth/stats", "/cache/stats", "/ratelimit/stats", "/queue/stats", "/tracing/stats",
+)
+batch_dispatcher = BatchDispatcher(
+    app, concurrency=BATCH_CONCURRENCY, max_items=BATCH_MAX_ITEMS, excluded_paths=MONITORING_PATHS
+)
+
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware, sample_ratio=TRACE_SAMPLE_RATIO)
+
+@app.exception_handler(httpx.TimeoutException)
+async def upstream_timeout_handler(request: Request, exc: httpx.TimeoutException):
+    return JSONResponse(status_code=504, content={"detail": "Upstream service timed out"})
+
+@app.exception_handler(httpx.TransportError)
+async def upstream_error_handler(request: Request, exc: httpx.TransportError):
+    return JSONResponse(status_code=502, content={"detail": "Upstream service unreachable"})
+
+@app.exception_handler(json.JSONDecodeError)
+async def upstream_payload_handler(request: Request, exc: json.JSONDecodeError):
+    return JSONResponse(status_code=502, content={"detail": "Invalid response from upstream service"})
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/login")
+place_cache = ResponseCache(maxsize=PLACE_CACHE_MAX_ENTRIES, ttl=PLACE_CACHE_TTL, max_bytes=PLACE_CACHE_MAX_BYTES)
+
+itinerary_cache = (
+    ItineraryCache(ITINERARY_CACHE_PATH, ttl=ITINERARY_CACHE_TTL, max_bytes=ITINERARY_CACHE_MAX_BYTES)
+    if ITINERARY_CACHE_PATH else None
+)
+
+def upstream_detail(response: httpx.Response, default: str):
+    try:
+        payload = response.json()
+    except ValueError:
+        return default
+    if isinstance(payload, dict):
+        return payload.get("detail") or payload.get("error") or default
+    return default
+
+def personalize_key(city: str, country: str, body: dict) -> str:
+    return itinerary_key(city, country, body.get("language"), body["prompt"])
+
+async def generate_itinerary(city: str, country: str, body: dict, token: str):
+    """Return a cached itinerary for this request, or generate and cache it."""
+    key = personalize_key(city, country, body)
+    if itinerary_cache is not None:
+        with span("itinerary_cache.get", stage="cache"):
+            cached = await itinerary_cache.get(key)
+        if cached is not None:
+            return cached
+    response = await llm.client.post(
+        f"/itineraries/personalize/{city}/{country}",
+        json=body,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if 400 <= response.status_code < 500:
+        # The caller's mistake (bad prompt, expired token): pass it through.
+        raise HTTPException(
+            status_code=response.status_code, detail=upstream_detail(response, "Failed to generate itinerary")
+        )
+    if response.status_code != 200:
+        raise RuntimeError(f"Itinerary service returned {response.status_code}")
+    result = loads(response.content)
+    if itinerary_cache is not None:
+        await itinerary_cache.set(key, result)
+    return result
+
+async def run_personalize_job(job: Job):
+    # Jobs can outlive the submitter's token (or a restart), so the call is
+    # made with a fresh token for the job owner.
+    token = token_verifier.issue(job.owner, lifetime=API_LONG_TIMEOUT + 60)
+    try:
+        return await generate_itinerary(job.payload["city"], job.payload["country"], job.payload["body"], token)
+    except json.JSONDecodeError:
+        raise RuntimeError("Invalid JSON response from the itinerary service")
+
+job_queue = JobQueue(
+    run_personalize_job,
+    SQLiteJobStore(JOB_STORE_PATH) if JOB_STORE_PATH else MemoryJobStore(),
+    concurrency=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    retention=JOB_RETENTION,
+)
+    
+class UserModel(BaseModel):
+    name: str
+    birthday: str
+    password: str
+    email: str
+    countries: List[str]
+
+class UserCredentials(BaseModel):
+    username: str
+    password: str
+
+class PlaceDescription(BaseModel):
+    place: str
+    description: str
+    tips: str
+    checked: str
+       
+class ItineraryDay(BaseModel):
+    day: str
+    description: List[PlaceDescription]
+class ItineraryResponse(BaseModel):
+    destination: str
+    startDate: str
+    endDate: str
+    state: str
+    owner: str
+    country: str
+    city: str
+    itinerary: List[ItineraryDay]
+    stars: Optional[int]
+
+class PersonalizedItinerary(BaseModel):
+    prompt: str
+    language: Optional[str] = None
+ 
+class ItineraryListResponse(BaseModel):
+    itineraries: List[ItineraryResponse]
+    
+class TokenData(BaseModel):
+    username: Optional[str] = None
+
+def decode_jwt(token: str) -> Optional[dict]:
+    return token_verifier.verify(token)
+
+async def verified_token(request: Request, token: str = Depends(oauth2_scheme)) -> str:
+    payload = decode_jwt(token)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    request.state.principal = payload
+    return token
+
+# Routes that only relay to an upstream. Bodies are forwarded as bytes and
+# upstream status codes and error bodies are passed through unchanged.
+proxy_routes = [
+    ProxyRoute("POST", "/signup", backend, auth=False, body_model=UserModel, tags=["Auth"]),
+    ProxyRoute("POST", "/login", backend, auth=False, body_model=UserCredentials, tags=["Auth"]),
+    ProxyRoute("GET", "/user/{user_id}", backend, tags=["Users"]),
+    ProxyRoute("PATCH", "/user/{user_id}", backend, tags=["Users"]),
+    ProxyRoute("DELETE", "/user/{user_id}", backend, tags=["Users"]),
+    ProxyRoute("GET", "/user/{user_id}/countries/count", backend, tags=["Stats"]),
+    ProxyRoute("GET", "/stats/countries/top", backend, tags=["Stats"]),
+    ProxyRoute("GET", "/stats/countries/{country}/users", backend, tags=["Stats"]),
+    ProxyRoute("POST", "/itineraries/create", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("GET", "/itineraries/get/{itinerary_id}", nodeapi, hedge_after=ITINERARY_HEDGE_AFTER or None, tags=["Itineraries"]),
+    ProxyRoute("PATCH", "/itineraries/modify/{itinerary_id}", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("DELETE", "/itineraries/delete/{itinerary_id}", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("DELETE", "/itineraries/deleteByOwner/{owner}", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("PATCH", "/itinerariesDays/add/{itinerary_id}", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("DELETE", "/itinerariesDays/delete/{itinerary_id}/days/{index}", nodeapi, tags=["Itineraries"]),
+    ProxyRoute("POST", "/destination", nodeapi, tags=["Places"]),
+    ProxyRoute(
+        "DELETE", "/destination/{destination_id}", nodeapi, tags=["Places"],
+        after=lambda params: place_cache.invalidate(("destination", params["destination_id"])),
+    ),
+]
+mount_proxy_routes(api_router, proxy_routes, verified_token)
+                  
+@api_router.get("/api/login", tags=["Auth"])
+async def login():
+    try:
+        response = await backend.client.get("/api/login")
+        if response.status_code in (307, 302):
+            return JSONResponse({"redirect_url": response.headers["location"]})
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calling backend login API: {e}")
+
+async def upstream_json(call):
+    """Await an upstream call and return `(data, error)` instead of raising."""
+    try:
+        response = await call
+    except httpx.TimeoutException:
+        return None, {"status": 504, "detail": "Upstream service timed out"}
+    except httpx.TransportError:
+        return None, {"status": 502, "detail": "Upstream service unreachable"}
+    try:
+        data = loads(response.content)
+    except json.JSONDecodeError:
+        return None, {"status": 502, "detail": "Invalid response from upstream service"}
+    if response.status_code != 200:
+        detail = (data.get("detail") or data.get("error") or data.get("message")) if isinstance(data, dict) else None
+        return None, {"status": response.status_code, "detail": detail or "Error from upstream service"}
+    return data, None
+
+@api_router.get("/dashboard/{user_id}", response_model=dict, tags=["Users"])
+async def get_dashboard(user_id: int, token: str = Depends(verified_token)):
+    headers = {"Authorization": f"Bearer {token}"}
+    (user, user_error), (itineraries, itineraries_error) = await asyncio.gather(
+        upstream_json(backend.client.get(f"/user/{user_id}", headers=headers)),
+        upstream_json(nodeapi.client.get(f"/itineraries/byUser/{user_id}", headers=headers)),
+    )
+    errors = {name: error for name, error in (("user", user_error), ("itineraries", itineraries_error)) if error}
+    if user_error and itineraries_error:
+        raise HTTPException(status_code=user_error["status"], detail=errors)
+    return FastJSONResponse({
+        "user": user,
+        "itineraries": itineraries,
+        "summary": summarize(user, itineraries),
+        "partial": bool(errors),
+        "errors": errors,
+    })
+
+@api_router.get("/itineraries/byUser/{itinerary_id}",response_model=dict, tags=["Itineraries"])
+async def get_itinerary(
+    itinerary_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    token: str = Depends(verified_token),
+):
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {key: value for key, value in (("limit", limit), ("cursor", cursor), ("fields", fields)) if value is not None}
+    if format == "ndjson":
+        request = nodeapi.client.build_request(
+            "GET", f"/itineraries/byUser/{itinerary_id}", params={**params, "format": "ndjson"}, headers=headers, timeout=nodeapi.timeout("long")
+        )
+        response = await nodeapi.client.send(request, stream=True)
+        if response.status_code != 200:
+            await response.aread()
+            await response.aclose()
+            return Response(content=response.content, status_code=response.status_code, media_type=response.headers.get("content-type"))
+        return StreamingResponse(relay_bytes(response), media_type="application/x-ndjson")
+    response = await nodeapi.client.get(f"/itineraries/byUser/{itinerary_id}", params=params, headers=headers, timeout=nodeapi.timeout("long"))
+    if limit is not None or response.status_code != 200:
+        # Pages already come as {"itineraries": [...], "next_cursor": ...}.
+        return Response(content=response.content, status_code=response.status_code, media_type=response.headers.get("content-type"))
+    # Wrap the upstream array without decoding it.
+    return Response(content=b'{"itineraries":' + response.content + b"}", media_type="application/json")
+   
+@api_router.post("/itineraries/personalize/{city}/{country}", response_model=dict, status_code=200, tags=["Itineraries"])
+async def personalize_itinerary(city: str, country: str, prompt: PersonalizedItinerary, token: str = Depends(verified_token)):
+    try:
+        return FastJSONResponse({"data": await generate_itinerary(city, country, prompt.dict(exclude_none=True), token)})
+    except RuntimeError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+
+@api_router.post("/itineraries/personalize/stream/{city}/{country}", status_code=200, tags=["Itineraries"])
+async def stream_personalized_itinerary(city: str, country: str, prompt: PersonalizedItinerary, format: str = "sse", token: str = Depends(verified_token)):
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    request = llm.client.build_request(
+        "POST",
+        f"/itineraries/personalize/stream/{city}/{country}",
+        json=prompt.dict(exclude_none=True),
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = await llm.client.send(request, stream=True)
+    if response.status_code != 200:
+        await response.aread()
+        await response.aclose()
+        raise HTTPException(
+            status_code=response.status_code, detail=upstream_detail(response, "Failed to generate itinerary")
+        )
+    return StreamingResponse(
+        relay_generation(response, format),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def owned_job(job_id: str, request: Request) -> Job:
+    job = await job_queue.get(job_id)
+    if job is None or job.owner != str(request.state.principal["sub"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/itineraries/personalize/jobs/{city}/{country}", response_model=dict, status_code=202, tags=["Itineraries"])
+async def submit_personalize_job(
+    city: str,
+    country: str,
+    prompt: PersonalizedItinerary,
+    request: Request,
+    priority: int = Query(USER_PRIORITY, ge=USER_PRIORITY, le=USER_PRIORITY_MAX),
+    token: str = Depends(verified_token),
+):
+    try:
+        job = await job_queue.submit(
+            "personalize",
+            {"city": city, "country": country, "body": prompt.dict(exclude_none=True)},
+            owner=str(request.state.principal["sub"]),
+            priority=priority,
+        )
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending itinerary jobs", headers={"Retry-After": "30"})
+    return job.public()
+
+@api_router.get("/jobs/{job_id}", response_model=dict, tags=["Itineraries"])
+async def get_job(job_id: str, request: Request, token: str = Depends(verified_token)):
+    return (await owned_job(job_id, request)).public()
+
+@api_router.get("/jobs/{job_id}/result", response_model=dict, tags=["Itineraries"])
+async def get_job_result(job_id: str, request: Request, token: str = Depends(verified_token)):
+    job = await owned_job(job_id, request)
+    if job.status == SUCCEEDED:
+        return FastJSONResponse({"data": job.result})
+    if job.status in (FAILED, CANCELLED):
+        raise HTTPException(status_code=409, detail=job.error or f"Job {job.status}")
+    return JSONResponse(status_code=202, content=job.public())
+
+@api_router.delete("/jobs/{job_id}", response_model=dict, tags=["Itineraries"])
+async def cancel_job(job_id: str, request: Request, token: str = Depends(verified_token)):
+    await owned_job(job_id, request)
+    return (await job_queue.cancel(job_id)).public()
+    
+def normalize_place(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+def cached_response(response) -> CachedResponse:
+    return CachedResponse(
+        status_code=response.status_code,
+        body=response.content,
+        media_type=response.headers.get("content-type", "application/json"),
+    )
+
+@api_router.get("/place/info/{city}/{country}",response_model=dict, tags=["Places"])
+async def get_place_info(city: str, country: str, token: str = Depends(verified_token)):
+    async def fetch():
+        response = await nodeapi.client.get(f"/place/info/{city}/{country}", headers={"Authorization": f"Bearer {token}"})
+        return cached_response(response)
+
+    entry = await place_cache.get_or_fetch(("place", normalize_place(city), normalize_place(country)), fetch)
+    return Response(content=entry.body, status_code=entry.status_code, media_type=entry.media_type)
+       
+@api_router.get("/destination/{destination_id}",response_model=dict, tags=["Places"])
+async def get_destination(destination_id: str, token: str = Depends(verified_token)):
+    async def fetch():
+        response = await nodeapi.client.get(f"/destination/{destination_id}", headers={"Authorization": f"Bearer {token}"})
+        return cached_response(response)
+
+    entry = await place_cache.get_or_fetch(("destination", destination_id), fetch)
+    if entry.status_code != 200:
+        raise HTTPException(
+            status_code=entry.status_code, 
+            detail=json.loads(entry.body).get("detail", "Error from backend")
+        )
+    return Response(content=entry.body, media_type=entry.media_type)
+
+@api_router.post("/batch", response_model=dict, tags=["Batch"])
+async def batch(batch_request: BatchRequest, request: Request, token: str = Depends(verified_token)):
+    if len(batch_request.requests) > batch_dispatcher.max_items:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {batch_dispatcher.max_items} requests")
+    return FastJSONResponse({"responses": await batch_dispatcher.run(batch_request.requests, request.headers, request.client)})
+
+@api_router.get("/upstreams/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def upstream_stats():
+    return upstreams.stats()
+
+@api_router.get("/auth/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def auth_stats():
+    return {"token_cache": token_verifier.cache.stats()}
+
+@api_router.get("/cache/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def cache_stats():
+    stats = {"place_cache": place_cache.stats()}
+    if itinerary_cache is not None:
+        stats["itinerary_cache"] = await itinerary_cache.stats()
+    return stats
+
+@api_router.get("/ratelimit/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def ratelimit_stats():
+    return rate_limiter.stats()
+
+@api_router.get("/queue/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def job_stats():
+    return job_queue.stats()
+
+@api_router.get("/tracing/stats", response_model=dict, tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def tracing_stats():
+    return {"exporter": span_exporter.stats() if span_exporter is not None else None}
+
+Gauge(
+    "upstream_in_flight", "Upstream requests whose response body is still open.", ("upstream",),
+    collect=lambda: [((name,), stats["in_use"]) for name, stats in upstreams.stats().items()],
+)
+Gauge(
+    "upstream_circuit_open", "1 while the upstream circuit breaker rejects calls.", ("upstream",),
+    collect=lambda: [
+        ((upstream.name,), int(upstream.breaker.state == "open")) for upstream in upstreams if upstream.breaker
+    ],
+)
+Gauge(
+    "job_queue_jobs", "Generation jobs waiting or running.", ("state",),
+    collect=lambda: [((state,), job_queue.stats()[state]) for state in ("queued", "running")],
+)
+
+@api_router.get("/metrics", tags=["Monitoring"], dependencies=[Depends(monitoring_access)])
+async def metrics():
+    return Response(content=METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+app.include_router(api_router)
+
+if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host='0.0.0.0', port=8888, log_level="debug")
\ No newline at end of file
@@ -0,0 +1,123 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional, Type
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from streaming import relay_bytes
+from upstream import Upstream
+
+# Hop-by-hop headers, plus the ones httpx recomputes for the upstream request.
+REQUEST_HEADER_BLOCKLIST = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+))
+RESPONSE_HEADER_BLOCKLIST = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "transfer-encoding", "upgrade", "server", "date",
+    # Set by the gateway's own tracing, which folds in the upstream timings.
+    "x-request-id", "server-timing",
+))
+
+
+@dataclass
+class ProxyRoute:
+    """
+    One gateway route forwarded verbatim to an upstream.
+    **Parameters**
+    * `method`: HTTP method of the route
+    * `path`: Gateway path, with `{name}` placeholders
+    * `upstream`: The `Upstream` the request is sent to
+    * `upstream_path`: Path on the upstream, defaults to `path`
+    * `auth`: Whether a valid bearer token is required
+    * `body_model`: Optional Pydantic model the request body is validated
+      against; the original bytes are still what gets forwarded
+    * `timeout`: Timeout profile of the upstream to use
+    * `hedge_after`: Seconds after which a hedged second attempt is sent,
+      for idempotent reads
+    * `after`: Optional callback run with the path parameters once the
+      upstream answered with a 2xx status
+    """
+    method: str
+    path: str
+    upstream: Upstream
+    upstream_path: Optional[str] = None
+    auth: bool = True
+    body_model: Optional[Type[BaseModel]] = None
+    timeout: str = "default"
+    hedge_after: Optional[float] = None
+    after: Optional[Callable[[dict], Any]] = None
+    tags: List[str] = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+def _request_headers(request: Request) -> List[tuple]:
+    headers = [
+        (name, value) for name, value in request.headers.raw
+        if name.decode("latin-1").lower() not in REQUEST_HEADER_BLOCKLIST
+    ]
+    if "accept-encoding" not in request.headers:
+        # Bodies are relayed undecoded, so don't let httpx ask for a
+        # compression the caller never accepted.
+        headers.append((b"accept-encoding", b"identity"))
+    return headers
+
+
+def _response_headers(headers) -> List[tuple]:
+    return [
+        (name.lower(), value) for name, value in headers.raw
+        if name.decode("latin-1").lower() not in RESPONSE_HEADER_BLOCKLIST
+    ]
+
+
+def _endpoint(route: ProxyRoute):
+    upstream_path = route.upstream_path or route.path
+    extensions = {"hedge_after": route.hedge_after} if route.hedge_after else None
+
+    async def proxy(request: Request):
+        body = await request.body()
+        if route.body_model is not None:
+            try:
+                route.body_model.model_validate_json(body or b"{}")
+            except ValidationError as exc:
+                raise HTTPException(status_code=422, detail=exc.errors(include_url=False))
+        client = route.upstream.client
+        upstream_request = client.build_request(
+            route.method,
+            upstream_path.format(**request.path_params),
+            params=request.url.query,
+            headers=_request_headers(request),
+            content=body or None,
+            timeout=route.upstream.timeout(route.timeout),
+            extensions=extensions,
+        )
+        response = await client.send(upstream_request, stream=True)
+        if route.after is not None and 200 <= response.status_code < 300:
+            route.after(request.path_params)
+        relayed = StreamingResponse(relay_bytes(response), status_code=response.status_code)
+        relayed.raw_headers = _response_headers(response.headers)
+        return relayed
+
+    proxy.__name__ = f"proxy_{route.method.lower()}_{route.path.strip('/').replace('/', '_').replace('{', '').replace('}', '')}"
+    return proxy
+
+
+def mount_proxy_routes(router: APIRouter, routes: Iterable[ProxyRoute], auth_dependency: Callable) -> None:
+    """Register every `ProxyRoute` on `router`, guarded by `auth_dependency` where required."""
+    for route in routes:
+        openapi_extra = None
+        if route.body_model is not None:
+            openapi_extra = {"requestBody": {
+                "required": True,
+                "content": {"application/json": {"schema": route.body_model.model_json_schema()}},
+            }}
+        router.add_api_route(
+            route.path,
+            _endpoint(route),
+            methods=[route.method],
+            tags=route.tags,
+            summary=route.summary,
+            dependencies=[Depends(auth_dependency)] if route.auth else None,
+            openapi_extra=openapi_extra,
+        )
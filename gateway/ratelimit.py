@@ -0,0 +1,201 @@
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from starlette.datastructures import Headers
+
+
+@dataclass
+class RateLimitRule:
+    """
+    A token bucket applied to every request whose method and path match.
+    **Parameters**
+    * `name`: Label used in bucket keys and counters
+    * `pattern`: Regular expression matched against the request path
+    * `rate`: Tokens added per second
+    * `burst`: Bucket capacity, the number of requests allowed at once
+    * `methods`: HTTP methods the rule applies to
+    * `max_concurrent`: Optional cap on requests in flight for the rule,
+      across all callers; requests past it are shed with a 503
+    """
+    name: str
+    pattern: str
+    rate: float
+    burst: int
+    methods: Tuple[str, ...] = ("GET", "POST", "PUT", "PATCH", "DELETE")
+    max_concurrent: Optional[int] = None
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern)
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and self._regex.match(path) is not None
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in the process. Idle buckets beyond `maxsize` are
+    dropped oldest first, which only ever refills them.
+    """
+
+    def __init__(self, maxsize: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        """Take `cost` tokens; return 0 when allowed, or the seconds to wait."""
+        now = self._clock()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        if tokens >= cost:
+            wait = 0.0
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared by every gateway replica through Redis. Requires
+    the optional `redis` package.
+    """
+
+    _SCRIPT = """
+    local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            from redis import asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError("RedisBucketStore requires the 'redis' package") from exc
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        wait = await self._script(keys=[self.prefix + key], args=[rate, burst, cost, time.time()])
+        return float(wait)
+
+
+class RateLimiter:
+    """
+    Applies `RateLimitRule`s to incoming requests. Callers are identified by
+    the `sub` of a valid bearer token, or by client address otherwise.
+    **Parameters**
+    * `rules`: Rules checked in order; the first match applies
+    * `store`: Bucket store, a `MemoryBucketStore` or `RedisBucketStore`
+    * `identify`: Callable returning the user id for a bearer token, or None
+    """
+
+    def __init__(
+        self,
+        rules: Iterable[RateLimitRule],
+        store,
+        identify: Callable[[str], Optional[str]],
+    ):
+        self.rules = list(rules)
+        self.store = store
+        self.identify = identify
+        self.in_flight: Dict[str, int] = {rule.name: 0 for rule in self.rules}
+        self.allowed: Dict[str, int] = {rule.name: 0 for rule in self.rules}
+        self.limited: Dict[str, int] = {rule.name: 0 for rule in self.rules}
+        self.shed: Dict[str, int] = {rule.name: 0 for rule in self.rules}
+
+    def rule_for(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def caller(self, scope) -> str:
+        authorization = Headers(scope=scope).get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            sub = self.identify(token)
+            if sub is not None:
+                return f"user:{sub}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    def stats(self) -> dict:
+        return {
+            rule.name: {
+                "rate": rule.rate,
+                "burst": rule.burst,
+                "max_concurrent": rule.max_concurrent,
+                "in_flight": self.in_flight[rule.name],
+                "allowed": self.allowed[rule.name],
+                "limited": self.limited[rule.name],
+                "shed": self.shed[rule.name],
+            }
+            for rule in self.rules
+        }
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing a `RateLimiter` before requests reach the
+    routes: `429` once a caller's bucket is empty, `503` once a rule's
+    concurrency cap is reached, both with `Retry-After`.
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = self.limiter
+        rule = limiter.rule_for(scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        if rule.max_concurrent is not None and limiter.in_flight[rule.name] >= rule.max_concurrent:
+            limiter.shed[rule.name] += 1
+            return await _reject(send, 503, "Server busy, try again later", 1)
+        wait = await limiter.store.take(f"{rule.name}:{limiter.caller(scope)}", rule.rate, rule.burst)
+        if wait > 0:
+            limiter.limited[rule.name] += 1
+            return await _reject(send, 429, "Rate limit exceeded", wait)
+
+        limiter.allowed[rule.name] += 1
+        limiter.in_flight[rule.name] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight[rule.name] -= 1
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
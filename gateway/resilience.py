@@ -0,0 +1,223 @@
+import asyncio
+import json
+import random
+import time
+from typing import Callable, Optional
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+RETRY_STATUSES = (502, 503, 504)
+# Errors raised before the upstream could have acted on the request. Read
+# timeouts are left out: retrying them multiplies the wait, hedging is the
+# tool for slow reads.
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.ReadError)
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `failure_threshold` consecutive
+    failures. Once `reset_timeout` seconds have passed, up to
+    `half_open_max` probe requests are let through; a success closes the
+    breaker again and a failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self) -> None:
+        """Give back a half-open probe whose outcome is unknown, e.g. a cancelled call."""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._state = CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+            self._state = OPEN
+            self._opened_at = self._clock()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryPolicy:
+    """
+    Retries for idempotent requests, `attempts` in total, sleeping a random
+    time up to `base_delay * 2**n` (capped at `max_delay`) between them.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an upstream transport with a circuit breaker, retries of
+    idempotent requests and, for requests sent with a `hedge_after`
+    extension, a second concurrent attempt when the first one is slow.
+    While the breaker is open, requests are answered locally with a `503`.
+    Transport errors, timeouts included, count against the breaker, and so
+    do `5xx` responses unless `fail_on_status` is false.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        name: str,
+        breaker: CircuitBreaker,
+        retry: Optional[RetryPolicy] = None,
+        fail_on_status: bool = True,
+    ):
+        self._transport = transport
+        self.name = name
+        self.breaker = breaker
+        self.retry = retry or RetryPolicy(attempts=1)
+        self.fail_on_status = fail_on_status
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _unavailable(self) -> httpx.Response:
+        detail = f"{self.name} is unavailable"
+        body = json.dumps({"detail": detail, "error": detail}).encode("utf-8")
+        # Built on a stream rather than `json=`, which would mark the body as
+        # already read and break callers that relay it with `aiter_raw`.
+        return httpx.Response(
+            503,
+            headers={
+                "Content-Type": "application/json",
+                "Content-Length": str(len(body)),
+                "Retry-After": str(max(1, round(self.breaker.retry_after()))),
+            },
+            stream=httpx.ByteStream(body),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempts = self.retry.attempts if idempotent else 1
+        hedge_after = request.extensions.get("hedge_after") if idempotent else None
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                return self._unavailable()
+            last = attempt == attempts - 1
+            try:
+                if hedge_after:
+                    response = await self._hedged(request, hedge_after)
+                else:
+                    response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as exc:
+                self.breaker.record_failure()
+                if last or not isinstance(exc, RETRY_ERRORS):
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code >= 500 and self.fail_on_status:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if last or response.status_code not in RETRY_STATUSES:
+                    return response
+                await response.aclose()
+            self.retries += 1
+            await asyncio.sleep(self.retry.delay(attempt))
+
+    async def _hedged(self, request: httpx.Request, hedge_after: float) -> httpx.Response:
+        primary = asyncio.create_task(self._transport.handle_async_request(request))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        self.hedges += 1
+        hedge = asyncio.create_task(self._transport.handle_async_request(request))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if not task.cancelled() and task.exception() is None]
+                for task in done:
+                    if task not in winners:
+                        error = task.exception()
+                if winners:
+                    if winners[0] is hedge:
+                        self.hedge_wins += 1
+                    for task in winners[1:]:
+                        await task.result().aclose()
+                    return winners[0].result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    response = await task
+                except BaseException:
+                    continue
+                await response.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.stats(),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,57 @@
+import json
+from typing import AsyncIterator
+
+import httpx
+
+from codec import dumps, loads
+
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def format_event(event: dict, fmt: str) -> bytes:
+    payload = dumps(event)
+    if fmt == "sse":
+        return b"event: " + event["type"].encode() + b"\ndata: " + payload + b"\n\n"
+    return payload + b"\n"
+
+
+async def relay_bytes(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Forward a streamed upstream body chunk by chunk, closing it when done or abandoned."""
+    try:
+        async for chunk in response.aiter_raw():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def relay_generation(response: httpx.Response, fmt: str) -> AsyncIterator[bytes]:
+    """
+    Re-emit an upstream NDJSON generation stream (`{"response": ..., "done": ...}`
+    per line) as `token` events, chunk by chunk, followed by a single `done`
+    or `error` event. The upstream response is closed when the client goes
+    away, which cancels the generation behind it.
+    **Parameters**
+    * `response`: A streamed `httpx.Response` from the itinerary service
+    * `fmt`: Either `"sse"` or `"ndjson"`
+    """
+    try:
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            try:
+                chunk = loads(line)
+            except json.JSONDecodeError:
+                yield format_event({"type": "error", "error": "Invalid chunk from upstream"}, fmt)
+                return
+            if chunk.get("response"):
+                yield format_event({"type": "token", "token": chunk["response"]}, fmt)
+            if chunk.get("done"):
+                break
+        yield format_event({"type": "done"}, fmt)
+    except httpx.HTTPError as exc:
+        yield format_event({"type": "error", "error": str(exc) or type(exc).__name__}, fmt)
+    finally:
+        await response.aclose()
@@ -0,0 +1,53 @@
+import itertools
+import os
+import sys
+import time
+
+import pytest
+from jose import jwt
+
+GATEWAY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The service modules, and the shared `observability` package next to them.
+sys.path[:0] = [GATEWAY, os.path.dirname(GATEWAY)]
+
+
+class FakeClock:
+    """Monotonic clock the tests move forward by hand."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def gateway():
+    """The gateway app module, configured without the on-disk itinerary cache."""
+    os.environ.setdefault("JWT_SECRET", "test-secret")
+    os.environ.setdefault("BACK_BASE_URL", "http://backend.test")
+    os.environ.setdefault("API_BASE_URL", "http://nodeapi.test")
+    os.environ["ITINERARY_CACHE_PATH"] = ""
+    import main
+    return main
+
+
+@pytest.fixture
+def bearer(gateway):
+    """Authorization headers for a new user on every call, so rate limits never carry over."""
+    def headers():
+        claims = {"sub": str(next(_users)), "exp": int(time.time()) + 60}
+        return {"Authorization": f"Bearer {jwt.encode(claims, gateway.JWT_SECRET, algorithm=gateway.JWT_ALGORITHM)}"}
+
+    return headers
@@ -0,0 +1,68 @@
+import asyncio
+
+from cache import CachedResponse, ResponseCache, TTLCache
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("default", 1)
+    cache.set("short", 2, ttl=1)
+
+    clock.advance(1)
+    assert cache.get("short") is None and cache.get("default") == 1
+
+    clock.advance(9)
+    assert "default" not in cache
+    assert cache.stats()["expirations"] == 2 and len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_bound_evicts_and_skips_oversized_values(clock):
+    cache = TTLCache(max_bytes=10, sizeof=len, clock=clock)
+    cache.set("a", b"1234")
+    cache.set("b", b"5678")
+    cache.set("c", b"90ab")
+
+    assert "a" not in cache and cache.bytes == 8
+
+    cache.set("huge", b"x" * 11)
+    assert "huge" not in cache and cache.bytes == 8
+
+
+def test_concurrent_misses_share_one_fetch_and_errors_are_not_cached():
+    cache = ResponseCache()
+    calls = []
+
+    async def fetch_ok():
+        calls.append("ok")
+        await asyncio.sleep(0)
+        return CachedResponse(200, b"{}")
+
+    async def fetch_missing():
+        calls.append("missing")
+        return CachedResponse(404, b'{"detail": "Not found"}')
+
+    async def run():
+        first = await asyncio.gather(*(cache.get_or_fetch("place", fetch_ok) for _ in range(5)))
+        again = await cache.get_or_fetch("place", fetch_ok)
+        missing = [await cache.get_or_fetch("gone", fetch_missing) for _ in range(2)]
+        return first, again, missing
+
+    first, again, missing = asyncio.run(run())
+
+    assert {entry.body for entry in first} == {b"{}"} and again.body == b"{}"
+    assert [entry.status_code for entry in missing] == [404, 404]
+    assert calls == ["ok", "missing", "missing"]
+    assert cache.stats()["coalesced"] == 4
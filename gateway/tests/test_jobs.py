@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from jobs import CANCELLED, FAILED, FINISHED, QUEUED, SUCCEEDED, JobQueue, JobQueueFull, MemoryJobStore, SQLiteJobStore
+
+
+async def settle(queue, *jobs):
+    for job in jobs:
+        while (await queue.get(job.id)).status not in FINISHED:
+            await asyncio.sleep(0.001)
+
+
+def test_jobs_run_by_priority_then_submission_order():
+    ran = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def runner(job):
+            if job.payload.get("block"):
+                await release.wait()
+            ran.append(job.payload["name"])
+            return job.payload["name"]
+
+        queue = JobQueue(runner, MemoryJobStore(), concurrency=1)
+        await queue.start()
+        blocker = await queue.submit("test", {"name": "blocker", "block": True}, "ana")
+        while queue.stats()["running"] == 0:
+            await asyncio.sleep(0)
+        jobs = [
+            await queue.submit("test", {"name": "late"}, "ana", priority=20),
+            await queue.submit("test", {"name": "first"}, "ana", priority=10),
+            await queue.submit("test", {"name": "second"}, "bob", priority=10),
+            await queue.submit("test", {"name": "internal"}, "gateway", priority=0),
+        ]
+        release.set()
+        await settle(queue, blocker, *jobs)
+        result = (await queue.get(jobs[0].id)).result
+        await queue.stop()
+        return result
+
+    assert asyncio.run(run()) == "late"
+    assert ran == ["blocker", "internal", "first", "second", "late"]
+
+
+def test_cancel_queued_and_running_jobs():
+    started = []
+
+    async def run():
+        async def runner(job):
+            started.append(job.payload["name"])
+            await asyncio.sleep(3600)
+
+        queue = JobQueue(runner, MemoryJobStore(), concurrency=1)
+        await queue.start()
+        running = await queue.submit("test", {"name": "running"}, "ana")
+        queued = await queue.submit("test", {"name": "queued"}, "ana")
+        while not started:
+            await asyncio.sleep(0)
+
+        await queue.cancel(queued.id)
+        await queue.cancel(running.id)
+        await settle(queue, running, queued)
+        statuses = [(await queue.get(job.id)).status for job in (running, queued)]
+        stats = queue.stats()
+        await queue.stop()
+        return statuses, stats
+
+    statuses, stats = asyncio.run(run())
+
+    assert statuses == [CANCELLED, CANCELLED]
+    # The queued job was dropped before a worker picked it up.
+    assert started == ["running"]
+    assert stats["cancelled"] == 2 and stats["running"] == 0
+
+
+def test_failures_are_recorded_and_a_full_queue_rejects():
+    async def run():
+        async def runner(job):
+            raise ValueError("model unavailable")
+
+        queue = JobQueue(runner, MemoryJobStore(), concurrency=1, max_pending=1)
+        await queue.start()
+        job = await queue.submit("test", {}, "ana")
+        await settle(queue, job)
+        failed = await queue.get(job.id)
+        await queue.stop()
+
+        # No workers, so submitted jobs stay queued.
+        idle = JobQueue(runner, MemoryJobStore(), concurrency=0, max_pending=1)
+        await idle.start()
+        await idle.submit("test", {}, "ana")
+        with pytest.raises(JobQueueFull):
+            await idle.submit("test", {}, "ana")
+        await idle.stop()
+        return failed, queue.stats(), idle.stats()
+
+    failed, stats, idle_stats = asyncio.run(run())
+
+    assert (failed.status, failed.error) == (FAILED, "model unavailable")
+    assert stats["failed"] == 1
+    assert idle_stats["queued"] == 1 and idle_stats["rejected"] == 1
+
+
+def test_unfinished_jobs_are_requeued_after_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+
+    async def run():
+        async def hang(job):
+            await asyncio.sleep(3600)
+
+        queue = JobQueue(hang, SQLiteJobStore(path), concurrency=1)
+        await queue.start()
+        running = await queue.submit("test", {"n": 1}, "ana")
+        queued = await queue.submit("test", {"n": 2}, "ana")
+        while queue.stats()["running"] == 0:
+            await asyncio.sleep(0)
+        await queue.stop()
+
+        async def double(job):
+            return job.payload["n"] * 2
+
+        restarted = JobQueue(double, SQLiteJobStore(path), concurrency=1)
+        await restarted.start()
+        await settle(restarted, running, queued)
+        jobs = [await restarted.get(job.id) for job in (running, queued)]
+        await restarted.stop()
+        return jobs
+
+    jobs = asyncio.run(run())
+
+    assert [(job.status, job.result) for job in jobs] == [(SUCCEEDED, 2), (SUCCEEDED, 4)]
+
+
+def test_cancelled_jobs_free_their_place_in_the_queue():
+    async def run():
+        async def runner(job):
+            return None
+
+        queue = JobQueue(runner, MemoryJobStore(), concurrency=0, max_pending=2)
+        await queue.start()
+        for _ in range(3):
+            jobs = [await queue.submit("test", {}, "ana") for _ in range(2)]
+            for job in jobs:
+                await queue.cancel(job.id)
+        stats = queue.stats()
+        await queue.stop()
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert stats["queued"] == 0 and stats["rejected"] == 0 and stats["cancelled"] == 6
+
+
+class FlakyStore(MemoryJobStore):
+    def __init__(self):
+        super().__init__()
+        self.broken = False
+
+    async def get(self, job_id):
+        if self.broken:
+            self.broken = False
+            raise OSError("disk I/O error")
+        return await super().get(job_id)
+
+
+def test_worker_survives_a_store_error():
+    async def run():
+        async def runner(job):
+            return job.payload["n"]
+
+        store = FlakyStore()
+        queue = JobQueue(runner, store, concurrency=1)
+        await queue.start()
+        store.broken = True
+        lost = await queue.submit("test", {"n": 1}, "ana")
+        while store.broken:
+            await asyncio.sleep(0)
+        done = await queue.submit("test", {"n": 2}, "ana")
+        await settle(queue, done)
+        jobs = [await queue.get(job.id) for job in (lost, done)]
+        await queue.stop()
+        return jobs
+
+    lost, done = asyncio.run(run())
+
+    assert (done.status, done.result) == (SUCCEEDED, 2)
+    assert lost.status == QUEUED
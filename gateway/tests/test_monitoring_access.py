@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI, Request
+
+from batch import BatchDispatcher, BatchRequest
+from observability.access import MonitoringAllowlist
+
+
+def request_from(host, app, method, path, **kwargs):
+    async def call():
+        transport = httpx.ASGITransport(app=app, client=(host, 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await client.request(method, path, **kwargs)
+
+    return asyncio.run(call())
+
+
+def guarded_app(allowlist, excluded_paths=()):
+    app = FastAPI()
+    dispatcher = BatchDispatcher(app, excluded_paths=excluded_paths)
+
+    @app.get("/metrics", dependencies=[Depends(allowlist)])
+    async def metrics():
+        return {}
+
+    @app.get("/whoami")
+    async def whoami(request: Request):
+        return {"host": request.client.host}
+
+    @app.post("/batch")
+    async def batch(batch_request: BatchRequest, request: Request):
+        return {"responses": await dispatcher.run(batch_request.requests, request.headers, request.client)}
+
+    return app
+
+
+def status_from(host, allowlist):
+    return request_from(host, guarded_app(allowlist), "GET", "/metrics").status_code
+
+
+def batch_statuses(host, app, paths, headers=None):
+    response = request_from(host, app, "POST", "/batch", json={"requests": [{"path": path} for path in paths]},
+                            headers=headers)
+    assert response.status_code == 200
+    return [item["status"] for item in response.json()["responses"]]
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "::1", "10.1.2.3", "172.18.0.4", "192.168.1.20", "::ffff:10.0.0.7"])
+def test_default_allows_loopback_and_private_networks(host):
+    assert status_from(host, MonitoringAllowlist()) == 200
+
+
+@pytest.mark.parametrize("host", ["203.0.113.9", "2001:db8::1", "172.32.0.1", "testclient", ""])
+def test_default_rejects_other_clients(host):
+    assert status_from(host, MonitoringAllowlist()) == 403
+
+
+def test_configured_networks_replace_the_default():
+    allowlist = MonitoringAllowlist("203.0.113.0/24, 2001:db8::/32")
+
+    assert allowlist.allows("203.0.113.9") and allowlist.allows("2001:db8::1")
+    assert not allowlist.allows("127.0.0.1")
+
+
+def test_star_allows_everyone():
+    assert MonitoringAllowlist("*").allows("198.51.100.1")
+
+
+def test_bad_network_fails_at_startup():
+    with pytest.raises(ValueError):
+        MonitoringAllowlist("10.0.0.0/8,not-a-network")
+
+
+def test_batch_sub_requests_keep_the_caller_address():
+    app = guarded_app(MonitoringAllowlist())
+
+    assert batch_statuses("203.0.113.9", app, ["/metrics"]) == [403]
+    assert batch_statuses("10.0.0.7", app, ["/metrics"]) == [200]
+    response = request_from("203.0.113.9", app, "POST", "/batch", json={"requests": [{"path": "/whoami"}]})
+    assert response.json()["responses"][0]["body"] == {"host": "203.0.113.9"}
+
+
+def test_batch_refuses_excluded_paths_even_for_internal_callers():
+    app = guarded_app(MonitoringAllowlist(), excluded_paths=["/metrics"])
+
+    assert batch_statuses("10.0.0.7", app, ["/metrics", "/metrics/", "/%6Detrics?x=1", "/batch"]) == [403, 403, 403, 400]
+
+
+def test_gateway_batch_cannot_reach_monitoring_routes(gateway, bearer):
+    headers = bearer()
+
+    assert request_from("203.0.113.9", gateway.app, "GET", "/metrics").status_code == 403
+    assert batch_statuses("203.0.113.9", gateway.app, ["/metrics", "/upstreams/stats"], headers) == [403, 403]
@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+@pytest.fixture
+def llm(gateway):
+    """Replies the LLM upstream gives, in order."""
+    replies = []
+    gateway.llm.transport = httpx.MockTransport(lambda request: replies.pop(0))
+    gateway.llm._client = None
+    yield replies
+    gateway.llm.transport = None
+    gateway.llm._client = None
+
+
+def personalize(gateway, headers):
+    async def call():
+        transport = httpx.ASGITransport(app=gateway.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await client.post("/itineraries/personalize/Lima/Peru", json={"prompt": "three days"}, headers=headers)
+
+    return asyncio.run(call())
+
+
+def test_generated_itinerary_is_wrapped(gateway, llm, bearer):
+    llm.append(httpx.Response(200, json={"days": []}))
+
+    response = personalize(gateway, bearer())
+
+    assert (response.status_code, response.json()) == (200, {"data": {"days": []}})
+
+
+@pytest.mark.parametrize("status", [400, 401, 422])
+def test_client_errors_from_the_llm_service_pass_through(gateway, llm, bearer, status):
+    llm.append(httpx.Response(status, json={"error": "Prompt too long"}))
+
+    response = personalize(gateway, bearer())
+
+    assert (response.status_code, response.json()) == (status, {"detail": "Prompt too long"})
+
+
+def test_server_errors_from_the_llm_service_become_502(gateway, llm, bearer):
+    llm.append(httpx.Response(500, json={"error": "model crashed"}))
+
+    response = personalize(gateway, bearer())
+
+    assert (response.status_code, response.json()) == (502, {"detail": "Itinerary service returned 500"})
+
+
+def test_undecodable_reply_is_a_502(gateway, llm, bearer):
+    llm.append(httpx.Response(200, content=b"<html>oops</html>"))
+
+    response = personalize(gateway, bearer())
+
+    assert (response.status_code, response.json()) == (502, {"detail": "Invalid response from upstream service"})
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from ratelimit import MemoryBucketStore, RateLimiter, RateLimitMiddleware, RateLimitRule
+
+TOKENS = {"token-ana": "1", "token-bob": "2"}
+
+
+def take(store, key, rate=1.0, burst=2):
+    return asyncio.run(store.take(key, rate, burst))
+
+
+def limited_app(limiter, release=None):
+    app = FastAPI()
+
+    @app.post("/personalize")
+    async def personalize():
+        if release is not None:
+            await release.wait()
+        return {}
+
+    @app.get("/health")
+    async def health():
+        return {}
+
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    return app
+
+
+def client_for(app, host="203.0.113.9"):
+    transport = httpx.ASGITransport(app=app, client=(host, 50000))
+    return httpx.AsyncClient(transport=transport, base_url="http://gateway")
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    store = MemoryBucketStore(clock=clock)
+
+    assert [take(store, "caller") for _ in range(2)] == [0.0, 0.0]
+    assert take(store, "caller") == 1.0
+
+    clock.advance(0.5)
+    assert take(store, "caller") == 0.5
+    clock.advance(0.5)
+    assert take(store, "caller") == 0.0
+
+
+def test_idle_bucket_refills_only_up_to_the_burst(clock):
+    store = MemoryBucketStore(clock=clock)
+    take(store, "caller")
+
+    clock.advance(3600)
+
+    assert [take(store, "caller") for _ in range(3)] == [0.0, 0.0, 1.0]
+
+
+def test_buckets_are_per_key_and_evicted_oldest_first(clock):
+    store = MemoryBucketStore(maxsize=2, clock=clock)
+    for key in ("a", "a", "b", "b"):
+        take(store, key)
+    assert take(store, "a") > 0 and take(store, "b") > 0
+
+    take(store, "c")
+
+    # "a" was touched before "b", so it went first and starts full again.
+    assert take(store, "b") > 0
+    assert take(store, "a") == 0.0
+
+
+def test_callers_are_limited_per_user_or_per_address(clock):
+    rule = RateLimitRule("personalize", r"^/personalize$", rate=1.0, burst=1, methods=("POST",))
+    limiter = RateLimiter([rule], MemoryBucketStore(clock=clock), identify=TOKENS.get)
+
+    async def statuses():
+        async with client_for(limited_app(limiter)) as client:
+            return [
+                (await client.post("/personalize", headers=bearer("token-ana"))).status_code,
+                (await client.post("/personalize", headers=bearer("token-ana"))).status_code,
+                (await client.post("/personalize", headers=bearer("token-bob"))).status_code,
+                # An unknown token falls back to the client address.
+                (await client.post("/personalize", headers=bearer("forged"))).status_code,
+                (await client.post("/personalize")).status_code,
+                (await client.get("/health")).status_code,
+            ]
+
+    assert asyncio.run(statuses()) == [200, 429, 200, 200, 429, 200]
+    assert limiter.stats()["personalize"]["allowed"] == 3
+    assert limiter.stats()["personalize"]["limited"] == 2
+
+
+def test_rejection_carries_retry_after(clock):
+    rule = RateLimitRule("personalize", r"^/personalize$", rate=0.1, burst=1)
+    limiter = RateLimiter([rule], MemoryBucketStore(clock=clock), identify=TOKENS.get)
+
+    async def second_response():
+        async with client_for(limited_app(limiter)) as client:
+            await client.post("/personalize")
+            return await client.post("/personalize")
+
+    response = asyncio.run(second_response())
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "10"
+    assert response.json() == {"detail": "Rate limit exceeded"}
+
+
+def test_concurrency_cap_sheds_requests_until_one_finishes(clock):
+    rule = RateLimitRule("personalize", r"^/personalize$", rate=100.0, burst=100, max_concurrent=1)
+    limiter = RateLimiter([rule], MemoryBucketStore(clock=clock), identify=TOKENS.get)
+
+    async def statuses():
+        release = asyncio.Event()
+        async with client_for(limited_app(limiter, release)) as client:
+            first = asyncio.ensure_future(client.post("/personalize", headers=bearer("token-ana")))
+            while limiter.in_flight["personalize"] == 0:
+                await asyncio.sleep(0)
+            shed = await client.post("/personalize", headers=bearer("token-bob"))
+            release.set()
+            done = await first
+            after = await client.post("/personalize", headers=bearer("token-bob"))
+            return [done.status_code, shed.status_code, shed.headers["retry-after"], after.status_code]
+
+    assert asyncio.run(statuses()) == [200, 503, "1", 200]
+    assert limiter.stats()["personalize"]["shed"] == 1
+    assert limiter.in_flight["personalize"] == 0
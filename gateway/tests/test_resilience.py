@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+import pytest
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResilientTransport, RetryPolicy
+
+
+def client_for(handler, breaker, retry=None):
+    transport = ResilientTransport(httpx.MockTransport(handler), "upstream", breaker, retry)
+    return httpx.AsyncClient(transport=transport, base_url="http://upstream")
+
+
+def test_open_breaker_answers_with_a_relayable_503(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    async def relay():
+        async with client_for(lambda request: httpx.Response(200), breaker) as client:
+            request = client.build_request("GET", "/itineraries/get/1")
+            response = await client.send(request, stream=True)
+            # Proxy routes relay the raw body; a `json=` response raised
+            # StreamConsumed here.
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+            await response.aclose()
+            return response, body
+
+    response, body = asyncio.run(relay())
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "30"
+    assert response.headers["content-type"] == "application/json"
+    assert body == b'{"detail": "upstream is unavailable", "error": "upstream is unavailable"}'
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_after_reset(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, half_open_max=1, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    clock.advance(10)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+    assert breaker.stats() == {"state": CLOSED, "consecutive_failures": 0, "opened": 1, "rejected": 2}
+
+
+def test_failed_probe_reopens_and_released_probe_is_given_back(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.advance(5)
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.retry_after() == 5
+
+
+def test_idempotent_requests_are_retried_on_502(clock):
+    statuses = iter([502, 503, 200])
+    breaker = CircuitBreaker(failure_threshold=5, clock=clock)
+
+    async def run():
+        async with client_for(lambda request: httpx.Response(next(statuses)), breaker,
+                              RetryPolicy(attempts=3, base_delay=0)) as client:
+            return await client.get("/itineraries/get/1")
+
+    assert asyncio.run(run()).status_code == 200
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+def test_posts_are_not_retried(clock):
+    calls = []
+    breaker = CircuitBreaker(clock=clock)
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    async def run():
+        async with client_for(handler, breaker, RetryPolicy(attempts=3, base_delay=0)) as client:
+            return await client.post("/itineraries/create", json={})
+
+    assert asyncio.run(run()).status_code == 503
+    assert len(calls) == 1
+
+
+def test_status_failures_can_be_left_to_the_caller(clock):
+    breaker = CircuitBreaker(failure_threshold=1, clock=clock)
+    failures = iter([httpx.Response(500), httpx.ConnectError("refused")])
+
+    def handler(request):
+        outcome = next(failures)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run():
+        transport = ResilientTransport(httpx.MockTransport(handler), "llm", breaker, fail_on_status=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://llm") as client:
+            response = await client.post("/itineraries/personalize/Paris/France")
+            assert response.status_code == 500 and breaker.state == CLOSED
+            with pytest.raises(httpx.ConnectError):
+                await client.post("/itineraries/personalize/Paris/France")
+            assert breaker.state == OPEN
+
+    asyncio.run(run())
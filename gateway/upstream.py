@@ -0,0 +1,268 @@
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from observability.metrics import Counter, Histogram
+from resilience import CircuitBreaker, ResilientTransport, RetryPolicy
+from observability.tracing import merge_server_timing, propagation_headers, span
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Time until an upstream answered with response headers, per attempt.",
+    ("upstream", "method"),
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Upstream attempts, by status code or `error` for transport failures.",
+    ("upstream", "method", "status"),
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def default_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_env_int("UPSTREAM_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("UPSTREAM_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def default_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=_env_int("UPSTREAM_BREAKER_FAILURES", 5),
+        reset_timeout=_env_float("UPSTREAM_BREAKER_RESET", 30.0),
+    )
+
+
+def default_retry() -> RetryPolicy:
+    return RetryPolicy(
+        attempts=_env_int("UPSTREAM_RETRY_ATTEMPTS", 3),
+        base_delay=_env_float("UPSTREAM_RETRY_BASE_DELAY", 0.05),
+        max_delay=_env_float("UPSTREAM_RETRY_MAX_DELAY", 1.0),
+    )
+
+
+def http2_enabled() -> bool:
+    if not _env_bool("UPSTREAM_HTTP2"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("UPSTREAM_HTTP2 is set but the 'h2' package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the pooled transport and keeps track of requests in flight, so the
+    pool usage can be reported without reaching into httpcore on every call.
+    A request is counted as in use until its response body is closed.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_connections: Optional[int], name: str = ""):
+        self._transport = transport
+        self._name = name
+        self._max_connections = max_connections
+        self.in_flight = 0
+        self.requests = 0
+        self.waits = 0
+        self.errors = 0
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._max_connections is not None and self.in_flight >= self._max_connections:
+            self.waits += 1
+        self.in_flight += 1
+        self.requests += 1
+        start = time.perf_counter()
+        with span(f"{request.method} {self._name}", stage=self._name, upstream=self._name,
+                  url=str(request.url.copy_with(query=None))):
+            request.headers.update(propagation_headers())
+            try:
+                response = await self._transport.handle_async_request(request)
+            except Exception:
+                self.errors += 1
+                self._release()
+                UPSTREAM_LATENCY.labels(self._name, request.method).observe(time.perf_counter() - start)
+                UPSTREAM_REQUESTS.labels(self._name, request.method, "error").inc()
+                raise
+        UPSTREAM_LATENCY.labels(self._name, request.method).observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(self._name, request.method, response.status_code).inc()
+        merge_server_timing(self._name, response.headers.get("server-timing"))
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    def connection_counts(self) -> Dict[str, int]:
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "idle": idle}
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class Upstream:
+    """
+    A long-lived, pooled HTTP client for one upstream service.
+    **Parameters**
+    * `name`: Name used in logs and pool statistics
+    * `base_url`: Base URL every request path is resolved against
+    * `timeouts`: Named timeout profiles, `default` is used when none is given
+    * `breaker`: Optional circuit breaker guarding every call
+    * `retry`: Retry policy for idempotent calls, used with `breaker`
+    * `fail_on_status`: Whether `5xx` responses count against `breaker`;
+      transport errors and timeouts always do
+    * `transport`: Transport requests are sent through instead of a pooled
+      `AsyncHTTPTransport`, e.g. an `ASGITransport` in benchmarks
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: Optional[str],
+        *,
+        timeouts: Dict[str, httpx.Timeout],
+        limits: Optional[httpx.Limits] = None,
+        http2: bool = False,
+        breaker: Optional[CircuitBreaker] = None,
+        retry: Optional[RetryPolicy] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        fail_on_status: bool = True,
+    ):
+        self.name = name
+        self.base_url = base_url or ""
+        self.timeouts = timeouts
+        self.limits = limits or default_limits()
+        self.http2 = http2
+        self.breaker = breaker
+        self.retry = retry
+        self.transport = transport
+        self.fail_on_status = fail_on_status
+        self._transport: Optional[_CountingTransport] = None
+        self._resilient: Optional[ResilientTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def timeout(self, profile: str = "default") -> httpx.Timeout:
+        return self.timeouts.get(profile, self.timeouts["default"])
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._transport = _CountingTransport(
+                self.transport or httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2),
+                self.limits.max_connections,
+                self.name,
+            )
+            transport = self._transport
+            if self.breaker is not None:
+                self._resilient = transport = ResilientTransport(
+                    self._transport, self.name, self.breaker, self.retry, self.fail_on_status
+                )
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=transport,
+                timeout=self.timeout(),
+                follow_redirects=False,
+            )
+        return self._client
+
+    async def start(self) -> None:
+        self.client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        stats = {
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "in_use": 0,
+            "idle": 0,
+            "connections": 0,
+            "waits": 0,
+            "requests": 0,
+            "errors": 0,
+        }
+        if self._transport is not None:
+            stats.update(self._transport.connection_counts())
+            stats.update(
+                in_use=self._transport.in_flight,
+                waits=self._transport.waits,
+                requests=self._transport.requests,
+                errors=self._transport.errors,
+            )
+        if self._resilient is not None:
+            stats.update(self._resilient.stats())
+        return stats
+
+
+class UpstreamRegistry:
+    def __init__(self, *upstreams: Upstream):
+        self._upstreams: Dict[str, Upstream] = {upstream.name: upstream for upstream in upstreams}
+
+    def __getitem__(self, name: str) -> Upstream:
+        return self._upstreams[name]
+
+    def __iter__(self):
+        return iter(self._upstreams.values())
+
+    async def start(self) -> None:
+        for upstream in self:
+            await upstream.start()
+
+    async def aclose(self) -> None:
+        for upstream in self:
+            await upstream.aclose()
+
+    def stats(self) -> Dict[str, dict]:
+        return {upstream.name: upstream.stats() for upstream in self}
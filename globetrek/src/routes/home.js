@@ -71,7 +71,9 @@ function Element() {
         setUser(data);
 
         if (data.countries) {
-          const parsedCountries = data.countries.replace(/"/g, '').replace(/{|}/g, '').split(',').map((country) => country.trim());
+          const parsedCountries = Array.isArray(data.countries)
+            ? data.countries
+            : data.countries.replace(/"/g, '').replace(/{|}/g, '').split(',').map((country) => country.trim());
           setCountriesArray(parsedCountries);
         }
 
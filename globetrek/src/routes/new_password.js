@@ -77,8 +77,10 @@ function NewPassword() {
         }
 
         if (userData.countries) {
-          const parsedCountries = userData.countries.replace(/"/g, '').replace(/{|}/g, '').split(',').map((country) => country.trim());
-          if (parsedCountries[0].length !== 0) {
+          const parsedCountries = Array.isArray(userData.countries)
+            ? userData.countries
+            : userData.countries.replace(/"/g, '').replace(/{|}/g, '').split(',').map((country) => country.trim());
+          if (parsedCountries.length > 0 && parsedCountries[0].length !== 0) {
             setSelectedCountries(parsedCountries);
           }
         }
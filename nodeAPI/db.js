@@ -41,6 +41,8 @@ const itinerarySchema = new mongoose.Schema({
     }]
   });
 
+itinerarySchema.index({ owner: 1, _id: 1 });
+
 const Itinerary = mongoose.model('Itinerary', itinerarySchema);
 
 const Destination = mongoose.model('Destination', destinationSchema);
@@ -123,6 +125,59 @@ async function getItineraryByUser(id) {
     }
 }
 
+const ITINERARY_FIELDS = ['destination', 'startDate', 'endDate', 'state', 'owner', 'country', 'city', 'stars', 'itinerary'];
+const SUMMARY_FIELDS = ['destination', 'startDate', 'endDate', 'state', 'country', 'city', 'stars'];
+
+// Turns a "fields" query value into a mongo projection; "summary" selects
+// the fields needed for list views. Unknown names are ignored.
+function itineraryProjection(fields) {
+    if (!fields) {
+        return null;
+    }
+    const names = fields === 'summary' ? SUMMARY_FIELDS : fields.split(',').map(f => f.trim());
+    const selected = names.filter(name => ITINERARY_FIELDS.includes(name));
+    return selected.length ? selected.join(' ') : null;
+}
+
+function encodeCursor(id) {
+    return Buffer.from(String(id)).toString('base64url');
+}
+
+function decodeCursor(cursor) {
+    const id = Buffer.from(cursor, 'base64url').toString();
+    return mongoose.isValidObjectId(id) ? id : null;
+}
+
+// Keyset pagination over (owner, _id): each page starts after the last id
+// of the previous one, so deep pages cost the same as the first.
+async function getItineraryPageByUser(id, { limit, cursor, fields }) {
+    try {
+        const query = { owner: id };
+        if (cursor) {
+            const after = decodeCursor(cursor);
+            if (!after) {
+                return { error: 'Invalid cursor' };
+            }
+            query._id = { $gt: after };
+        }
+        const items = await Itinerary.find(query, itineraryProjection(fields))
+            .sort({ _id: 1 })
+            .limit(limit + 1)
+            .lean();
+        const hasMore = items.length > limit;
+        if (hasMore) {
+            items.pop();
+        }
+        return { data: { itineraries: items, next_cursor: hasMore ? encodeCursor(items[items.length - 1]._id) : null } };
+    } catch (error) {
+        return { error: error.message };
+    }
+}
+
+function streamItinerariesByUser(id, fields) {
+    return Itinerary.find({ owner: id }, itineraryProjection(fields)).sort({ _id: 1 }).lean().cursor();
+}
+
 async function modifyItinerary(id, body) {
     try {
         const result = await Itinerary.findByIdAndUpdate(
@@ -176,6 +231,7 @@ async function destinationExists(city, country) {
 }
 
 module.exports = { createItinerary, removeItinerary, getItinerary, 
-    modifyItinerary, getItineraryByUser, removeItineraryDay, addItineraryDay, 
+    modifyItinerary, getItineraryByUser, getItineraryPageByUser, streamItinerariesByUser,
+    removeItineraryDay, addItineraryDay, 
     removeItineraryByOwner, createDestination, removeDestination, getDestination,
     destinationExists };
\ No newline at end of file
@@ -1,10 +1,11 @@
 require('dotenv').config();
 const fetch = require('node-fetch');
-const { createItinerary, getItinerary, removeItinerary, removeItineraryByOwner, modifyItinerary, getItineraryByUser, removeItineraryDay, addItineraryDay, createDestination, getDestination, removeDestination, destinationExists } = require('./db');
+const { createItinerary, getItinerary, removeItinerary, removeItineraryByOwner, modifyItinerary, getItineraryByUser, getItineraryPageByUser, streamItinerariesByUser, removeItineraryDay, addItineraryDay, createDestination, getDestination, removeDestination, destinationExists } = require('./db');
 const express = require('express');
 const bodyParser = require("body-parser");
 const mongoose = require('mongoose');
 const { verifyToken } = require('./auth');
+const { serverTiming, timed } = require('./timing');
 const swaggerUi = require('swagger-ui-express');
 const swaggerJsdoc = require('swagger-jsdoc');
 
@@ -45,6 +46,7 @@ const swaggerOptions = {
 const swaggerDocs = swaggerJsdoc(swaggerOptions);
 app.use('/api-docs', swaggerUi.serve, swaggerUi.setup(swaggerDocs));
 
+app.use(serverTiming);
 app.use(bodyParser.json());
 
 mongoose.connect(process.env.MONGO_URI)
@@ -468,7 +470,7 @@ app.get('/itineraries/get/:uid', verifyToken, async (req, res) => {
  *     summary: Get itineraries by user ID
  *     tags:
  *       - Itineraries
- *     description: Fetch all itineraries associated with a user.
+ *     description: Fetch the itineraries associated with a user. Without `limit` or `format` the full list is returned as an array.
  *     parameters:
  *       - in: path
  *         name: uid
@@ -476,6 +478,26 @@ app.get('/itineraries/get/:uid', verifyToken, async (req, res) => {
  *         description: Unique ID of the user.
  *         schema:
  *           type: string
+ *       - in: query
+ *         name: limit
+ *         description: Page size; returns {"itineraries":[...],"next_cursor":...} instead of an array.
+ *         schema:
+ *           type: integer
+ *       - in: query
+ *         name: cursor
+ *         description: Opaque cursor from a previous page's next_cursor.
+ *         schema:
+ *           type: string
+ *       - in: query
+ *         name: fields
+ *         description: Comma-separated fields to return, or "summary".
+ *         schema:
+ *           type: string
+ *       - in: query
+ *         name: format
+ *         description: Set to "ndjson" to stream one itinerary per line.
+ *         schema:
+ *           type: string
  *     responses:
  *       200:
  *         description: Itineraries fetched successfully.
@@ -487,6 +509,34 @@ app.get('/itineraries/byUser/:uid', verifyToken, async (req, res) => {
   
   if (String(userIdFromToken) !== String(req.params.uid)) {
     return res.status(401).json({ message: "Not authorized." });
+  } else if (req.query.format === 'ndjson') {
+    const cursor = streamItinerariesByUser(req.params.uid, req.query.fields);
+    res.on('close', () => {
+      if (!res.writableEnded) {
+        cursor.close();
+      }
+    });
+    res.status(200).set('Content-Type', 'application/x-ndjson');
+    try {
+      for await (const itinerary of cursor) {
+        if (res.destroyed) {
+          break;
+        }
+        if (!res.write(JSON.stringify(itinerary) + '\n')) {
+          await new Promise(resolve => { res.once('drain', resolve); res.once('close', resolve); });
+        }
+      }
+    } catch (error) {
+      res.write(JSON.stringify({ error: error.message }) + '\n');
+    }
+    return res.end();
+  } else if (req.query.limit) {
+    const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 20, 1), 100);
+    const result = await getItineraryPageByUser(req.params.uid, { limit, cursor: req.query.cursor, fields: req.query.fields });
+    if (result.error) {
+      return res.status(400).json({ error: result.error });
+    }
+    return res.status(200).json(result.data);
   } else { 
     const result = await getItineraryByUser(req.params.uid);
     if (result.error) {
@@ -556,21 +606,7 @@ app.post('/itineraries/personalize/:place_name/:country', verifyToken, async (re
     }
 
     try {
-      let prompt = `Generate a detailed travel itinerary in ${req.body.language} based on the preferences provided: ${req.body.prompt}. 
-      Return the itinerary strictly in JSON format only, without any additional text, comments, or explanations. ${info}
-
-      The JSON output should match the exact structure below, formatted as a single line with no extra spaces, line breaks, or comments. Ensure it is properly structured for direct use as valid JSON.
-
-      {"destination":"City name based on user preferences","itinerary":[{"day":"Day 1","description":[{"place":"Name of the first place to visit","description":"Detailed information about this place, including historical, cultural, or recreational significance.","tips":"Useful advice on visiting, such as the best times, local recommendations, or nearby attractions."},{"place":"Name of the second place to visit","description":"Details about this place, explaining its uniqueness or importance in the city.","tips":"Specific tips for this location, like timing, nearby dining, or local customs."}]},{"day":"Day 2","description":[{"place":"Name of a third place to visit","description":"Description of the third place.","tips":"Tips for visiting the third place."},{"place":"Name of a fourth place to visit","description":"Description of the fourth place.","tips":"Tips for visiting the fourth place."}]},{"day":"Day 3","description":[{"place":"Name of a fifth place to visit","description":"Description of the fifth place.","tips":"Tips for visiting the fifth place."},{"place":"Name of a sixth place to visit","description":"Description of the sixth place.","tips":"Tips for visiting the sixth place."}]}]}
-
-      **Important Instructions:**
-      1. **Exact Key Names**: Use these keys without changes: "destination", "itinerary", "day", "description", "place", "tips".
-      2. **Single-Line JSON**: Output JSON must be a single line, with no line breaks, unnecessary spaces, or extra characters.
-      3. **Error-Free JSON Structure**: Ensure proper bracket nesting and placement to avoid parsing errors.
-      4. **Multiple Entries Per Day**: Each "description" array must contain at least two unique activities with accurate details and tips for each day.
-
-      Return only the JSON output as shown, without explanations or extra characters.
-      `;
+      const prompt = buildItineraryPrompt(req.body.language, req.body.prompt, info);
 
       const response = await promptOllama(prompt);
       res.send(response);
@@ -582,6 +618,66 @@ app.post('/itineraries/personalize/:place_name/:country', verifyToken, async (re
   }
 });
 
+/**
+ * @swagger
+ * /itineraries/personalize/stream/{place_name}/{country}:
+ *   post:
+ *     summary: Stream a personalized itinerary as it is generated
+ *     tags:
+ *       - Itineraries
+ *     description: Same as /itineraries/personalize, but forwards the Ollama output as newline-delimited JSON chunks while it is generated. Closing the connection cancels the generation.
+ *     parameters:
+ *       - in: path
+ *         name: place_name
+ *         required: true
+ *         schema:
+ *           type: string
+ *       - in: path
+ *         name: country
+ *         required: true
+ *         schema:
+ *           type: string
+ *     responses:
+ *       200:
+ *         description: NDJSON stream of Ollama chunks ({"response":"...","done":false}).
+ *         content:
+ *           application/x-ndjson:
+ *             schema:
+ *               type: string
+ *       500:
+ *         description: Server error while generating the itinerary.
+ */
+app.post('/itineraries/personalize/stream/:place_name/:country', verifyToken, async (req, res) => {
+  const userIdFromToken = req.user_id;
+  if (!userIdFromToken) {
+    return res.status(401).json({ message: "Not authorized." });
+  }
+
+  const controller = new AbortController();
+  // 'close' on the request fires once its body is read; only the response
+  // closing before it ended means the client went away.
+  res.on('close', () => {
+    if (!res.writableEnded) {
+      controller.abort();
+    }
+  });
+
+  const result = await getInfoSummary(req.params.place_name, req.params.country);
+  const info = result.error ? "" : "Use this information: " + result.output;
+
+  try {
+    const prompt = buildItineraryPrompt(req.body.language, req.body.prompt, info);
+    const stream = await promptOllamaStream(prompt, controller.signal);
+    res.status(200).set('Content-Type', 'application/x-ndjson');
+    stream.on('error', () => res.end());
+    stream.pipe(res);
+  } catch (error) {
+    if (!controller.signal.aborted) {
+      res.status(500).json({ error: String(error) });
+    }
+  }
+});
+
 /**
  * @swagger
  * /place/info_summary/{place_name}/{country}:
@@ -823,12 +919,12 @@ app.delete('/destination/:uid', verifyToken, async (req, res) => {
 
 async function getLonLat(city, country) {
   try {
-    const response = await fetch(`https://nominatim.openstreetmap.org/search?q=${city}, ${country}&format=json`, {
+    const response = await timed('nominatim', () => fetch(`https://nominatim.openstreetmap.org/search?q=${city}, ${country}&format=json`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
       }
-    });
+    }));
 
     if (!response.ok) return { error: "Error fetching data from the API" };
 
@@ -844,13 +940,13 @@ async function getLonLat(city, country) {
 
 async function getInfo(lon, lat, city, country) {
   try {
-    const dataInDB = await destinationExists(city, country);
+    const dataInDB = await timed('mongo', () => destinationExists(city, country));
     let data = null;
 
     if (dataInDB.exists) {
       data = dataInDB.data;
     } else {
-      const response = await fetch(
+      const response = await timed('geoapify', () => fetch(
         `https://api.geoapify.com/v2/places?categories=entertainment&filter=circle:${lon},${lat},5000&limit=20&apiKey=${process.env.GEOAPIFY_API_KEY}`,
         {
           method: 'GET',
@@ -858,7 +954,7 @@ async function getInfo(lon, lat, city, country) {
             'Content-Type': 'application/json',
           },
         }
-      );
+      ));
 
       if (!response.ok) return { error: "Error fetching data from the API" };
 
@@ -888,7 +984,7 @@ async function getInfo(lon, lat, city, country) {
         nearbyPlaces,
       };
 
-      const saveResult = await createDestination(destinationData);
+      const saveResult = await timed('mongo', () => createDestination(destinationData));
       if (saveResult.error) {
         return { error: "Failed to save destination data" };
       }
@@ -920,18 +1016,19 @@ async function promptOllama(prompt) {
   const url = `${process.env.OLLAMA_URL}/api/generate`;
 
 try {
-  const response = await fetch(url, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(model),
-  });
-
-  if (!response.ok) {
-    const errorData = await response.json();
-    throw new Error(`Ollama API error: ${errorData.message || 'Unknown error'}`);
-  }
+  const data = await timed('ollama', async () => {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(model),
+    });
 
-  const data = await response.json();
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(`Ollama API error: ${errorData.message || 'Unknown error'}`);
+    }
+    return response.json();
+  });
   return data.response;
 } catch (error) {
   console.error('Request failed for URL:', url);
@@ -941,6 +1038,41 @@ try {
 
 }
 
+function buildItineraryPrompt(language, preferences, info) {
+  return `Generate a detailed travel itinerary in ${language} based on the preferences provided: ${preferences}. 
+      Return the itinerary strictly in JSON format only, without any additional text, comments, or explanations. ${info}
+
+      The JSON output should match the exact structure below, formatted as a single line with no extra spaces, line breaks, or comments. Ensure it is properly structured for direct use as valid JSON.
+
+      {"destination":"City name based on user preferences","itinerary":[{"day":"Day 1","description":[{"place":"Name of the first place to visit","description":"Detailed information about this place, including historical, cultural, or recreational significance.","tips":"Useful advice on visiting, such as the best times, local recommendations, or nearby attractions."},{"place":"Name of the second place to visit","description":"Details about this place, explaining its uniqueness or importance in the city.","tips":"Specific tips for this location, like timing, nearby dining, or local customs."}]},{"day":"Day 2","description":[{"place":"Name of a third place to visit","description":"Description of the third place.","tips":"Tips for visiting the third place."},{"place":"Name of a fourth place to visit","description":"Description of the fourth place.","tips":"Tips for visiting the fourth place."}]},{"day":"Day 3","description":[{"place":"Name of a fifth place to visit","description":"Description of the fifth place.","tips":"Tips for visiting the fifth place."},{"place":"Name of a sixth place to visit","description":"Description of the sixth place.","tips":"Tips for visiting the sixth place."}]}]}
+
+      **Important Instructions:**
+      1. **Exact Key Names**: Use these keys without changes: "destination", "itinerary", "day", "description", "place", "tips".
+      2. **Single-Line JSON**: Output JSON must be a single line, with no line breaks, unnecessary spaces, or extra characters.
+      3. **Error-Free JSON Structure**: Ensure proper bracket nesting and placement to avoid parsing errors.
+      4. **Multiple Entries Per Day**: Each "description" array must contain at least two unique activities with accurate details and tips for each day.
+
+      Return only the JSON output as shown, without explanations or extra characters.
+      `;
+}
+
+async function promptOllamaStream(prompt, signal) {
+  const url = `${process.env.OLLAMA_URL}/api/generate`;
+  // Only the wait for Ollama's first byte fits in the response headers.
+  const response = await timed('ollama', () => fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ model: 'mistral', prompt, stream: true }),
+    signal,
+  }));
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(`Ollama API error: ${errorData.message || 'Unknown error'}`);
+  }
+  return response.body;
+}
+
 async function getInfoSummary(placeName, country) {
   try {
     const locationResult = await getLonLat(placeName, country);
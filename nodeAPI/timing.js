@@ -0,0 +1,35 @@
+const { AsyncLocalStorage } = require('async_hooks');
+
+const requestTimings = new AsyncLocalStorage();
+
+// Adds a Server-Timing header with the time spent in each stage recorded by
+// `timed`, and echoes the caller's X-Request-ID so logs can be correlated.
+function serverTiming(req, res, next) {
+    const timings = {};
+    const start = process.hrtime.bigint();
+    const requestId = req.get('x-request-id');
+    if (requestId) res.setHeader('X-Request-ID', requestId);
+
+    const writeHead = res.writeHead;
+    res.writeHead = function (...args) {
+        const entries = Object.entries(timings).map(([stage, ms]) => `${stage};dur=${ms.toFixed(1)}`);
+        entries.push(`total;dur=${(Number(process.hrtime.bigint() - start) / 1e6).toFixed(1)}`);
+        this.setHeader('Server-Timing', entries.join(', '));
+        return writeHead.apply(this, args);
+    };
+    requestTimings.run(timings, next);
+}
+
+async function timed(stage, fn) {
+    const start = process.hrtime.bigint();
+    try {
+        return await fn();
+    } finally {
+        const timings = requestTimings.getStore();
+        if (timings) {
+            timings[stage] = (timings[stage] || 0) + Number(process.hrtime.bigint() - start) / 1e6;
+        }
+    }
+}
+
+module.exports = { serverTiming, timed };
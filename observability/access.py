@@ -0,0 +1,53 @@
+"""
+Network allowlist for the monitoring routes. `/metrics` and the `/…/stats`
+pages expose traffic, cache contents and upstream health, so they answer
+only clients on the networks listed here, e.g. the Prometheus scraper and
+the compose network; everyone else gets a 403.
+"""
+import ipaddress
+from typing import Iterable, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request
+
+# Loopback and the private ranges a compose or cluster network uses.
+DEFAULT_ALLOW = "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7"
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_networks(spec: Union[str, Iterable[str]]) -> Tuple[Network, ...]:
+    """Comma-separated CIDRs (or bare addresses) into networks; raises `ValueError` on a bad entry."""
+    items = spec.split(",") if isinstance(spec, str) else spec
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in items if item.strip())
+
+
+class MonitoringAllowlist:
+    """
+    FastAPI dependency that rejects clients outside the allowed networks.
+    **Parameters**
+    * `networks`: CIDRs as a comma-separated string or a list; `None` uses
+      `DEFAULT_ALLOW`, `"*"` lets every client through
+    """
+
+    def __init__(self, networks: Union[str, Iterable[str], None] = None):
+        if networks is None:
+            networks = DEFAULT_ALLOW
+        self.allow_all = isinstance(networks, str) and networks.strip() == "*"
+        self.networks = () if self.allow_all else parse_networks(networks)
+
+    def allows(self, host: Optional[str]) -> bool:
+        if self.allow_all:
+            return True
+        if not host:
+            return False
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        if getattr(address, "ipv4_mapped", None) is not None:
+            address = address.ipv4_mapped
+        return any(address in network for network in self.networks)
+
+    async def __call__(self, request: Request) -> None:
+        if not self.allows(request.client.host if request.client else None):
+            raise HTTPException(status_code=403, detail="Monitoring endpoints are restricted to internal networks")
@@ -0,0 +1,360 @@
+"""
+Request tracing without an SDK: every HTTP request gets a request ID and a
+W3C trace context, work done on its behalf is recorded as spans, the time
+per stage is returned in a `Server-Timing` header, and finished spans can
+be exported to a JSON-lines file or an OTLP/HTTP collector.
+"""
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from observability.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACEPARENT_HEADER = "traceparent"
+SERVER_TIMING_HEADER = "server-timing"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration: float = 0.0
+    attributes: Dict[str, object] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class RequestTrace:
+    """Spans and per-stage durations of one incoming request."""
+
+    def __init__(self, request_id: str, trace_id: str, sampled: bool):
+        self.request_id = request_id
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_timing(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def propagation_headers() -> Dict[str, str]:
+    """Headers that carry the current request ID and span to an upstream."""
+    trace, parent = _trace.get(), _span.get()
+    if trace is None or parent is None:
+        return {}
+    flags = "01" if trace.sampled else "00"
+    return {
+        REQUEST_ID_HEADER: trace.request_id,
+        TRACEPARENT_HEADER: f"00-{trace.trace_id}-{parent.span_id}-{flags}",
+    }
+
+
+def _finish(trace: RequestTrace, span_: Span, stage: Optional[str]) -> None:
+    if stage:
+        trace.add_timing(stage, span_.duration)
+    if trace.sampled and _exporter is not None:
+        _exporter.export(span_)
+
+
+@contextmanager
+def span(name: str, stage: Optional[str] = None, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Record the enclosed block as a child of the current span. `stage` names
+    the `Server-Timing` entry its duration is added to. Outside a request
+    this does nothing.
+    """
+    trace, parent = _trace.get(), _span.get()
+    if trace is None:
+        yield None
+        return
+    current = Span(name, trace.trace_id, _new_id(64), parent.span_id if parent else None, time.time(),
+                   attributes=attributes)
+    token = _span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _span.reset(token)
+        _finish(trace, current, stage)
+
+
+def record_span(name: str, duration: float, stage: Optional[str] = None, **attributes) -> None:
+    """Record work that was already timed, e.g. from SQLAlchemy events."""
+    trace, parent = _trace.get(), _span.get()
+    if trace is None:
+        return
+    finished = Span(name, trace.trace_id, _new_id(64), parent.span_id if parent else None,
+                    time.time() - duration, duration, attributes)
+    _finish(trace, finished, stage)
+
+
+def merge_server_timing(prefix: str, header: Optional[str]) -> None:
+    """Add an upstream's `Server-Timing` entries to the current request, as `prefix.name`."""
+    trace = _trace.get()
+    if trace is None or not header:
+        return
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    trace.add_timing(f"{prefix}.{name}", float(value) / 1000)
+                except ValueError:
+                    pass
+
+
+def server_timing(trace: RequestTrace, total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class _FileSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.writelines(json.dumps(span_.to_dict(), default=str) + "\n" for span_ in spans)
+
+
+class _OTLPSink:
+    """Posts spans to an OpenTelemetry collector using OTLP/HTTP with JSON encoding."""
+
+    def __init__(self, url: str, service: str, timeout: float = 5.0):
+        self.url = url if url.rstrip("/").endswith("/v1/traces") else url.rstrip("/") + "/v1/traces"
+        self.service = service
+        self.timeout = timeout
+
+    def _span(self, span_: Span) -> dict:
+        start = int(span_.start * 1e9)
+        encoded = {
+            "traceId": span_.trace_id,
+            "spanId": span_.span_id,
+            "name": span_.name,
+            "kind": 2 if span_.parent_id is None else 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span_.duration * 1e9)),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}} for key, value in span_.attributes.items()
+            ],
+            "status": {"code": 2, "message": span_.error} if span_.error else {},
+        }
+        if span_.parent_id:
+            encoded["parentSpanId"] = span_.parent_id
+        return encoded
+
+    def write(self, spans: List[Span]) -> None:
+        body = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [self._span(span_) for span_ in spans]}],
+        }]}).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SpanExporter:
+    """
+    Hands finished spans to a background thread, which writes them in
+    batches, so exporting never blocks a request. Spans are dropped, and
+    counted, when the buffer is full.
+    **Parameters**
+    * `target`: Path of a JSON-lines file, or the URL of an OTLP/HTTP collector
+    * `service`: Service name reported to the collector
+    * `max_batch`: Number of spans written at once
+    * `interval`: Seconds between flushes of a partial batch
+    * `max_pending`: Number of spans buffered before new ones are dropped
+    """
+
+    def __init__(self, target: str, service: str, *, max_batch: int = 512, interval: float = 1.0,
+                 max_pending: int = 10000):
+        if target.startswith(("http://", "https://")):
+            self._sink = _OTLPSink(target, service)
+        else:
+            self._sink = _FileSink(target)
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, span_: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span_)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._sink.write(batch)
+                    self.exported += len(batch)
+                except Exception:
+                    self.failed += len(batch)
+                    logger.warning("Could not export %d spans", len(batch), exc_info=True)
+
+    def shutdown(self) -> None:
+        """Write the spans still buffered and stop the background thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=10)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_exporter: Optional[SpanExporter] = None
+
+
+def configure(exporter: Optional[SpanExporter]) -> None:
+    global _exporter
+    _exporter = exporter
+
+
+class TracingMiddleware:
+    """
+    Starts a `RequestTrace` for every HTTP request. The request ID is taken
+    from `X-Request-ID` when the caller sent a valid one, and the trace
+    continues the caller's `traceparent`; both are echoed back together
+    with `Server-Timing`. Add it last, so it wraps every other middleware.
+    **Parameters**
+    * `sample_ratio`: Share of new traces whose spans are exported; traces
+      continued from a `traceparent` follow the caller's sampling flag
+    """
+
+    def __init__(self, app, sample_ratio: float = 1.0):
+        self.app = app
+        self.sample_ratio = sample_ratio
+
+    def _start(self, scope) -> tuple:
+        request_id = trace_id = parent_id = None
+        sampled = random.random() < self.sample_ratio
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID.match(candidate):
+                    request_id = candidate
+            elif name == b"traceparent":
+                match = _TRACEPARENT.match(value.decode("latin-1").strip().lower())
+                if match and match.group(1) != "0" * 32:
+                    trace_id, parent_id = match.group(1), match.group(2)
+                    sampled = bool(int(match.group(3), 16) & 1)
+        trace = RequestTrace(request_id or _new_id(128), trace_id or _new_id(128), sampled)
+        return trace, parent_id
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace, parent_id = self._start(scope)
+        root = Span("http.request", trace.trace_id, _new_id(64), parent_id, time.time(),
+                    attributes={"http.method": scope["method"], "http.target": scope["path"],
+                                "request_id": trace.request_id})
+        trace_token, span_token = _trace.set(trace), _span.set(root)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in (b"x-request-id", b"server-timing")
+                ]
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                headers.append((b"server-timing", server_timing(trace, time.perf_counter() - start).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException as exc:
+            root.error = type(exc).__name__
+            raise
+        finally:
+            root.duration = time.perf_counter() - start
+            root.name = f"{scope['method']} {route_template(scope)}"
+            _span.reset(span_token)
+            _trace.reset(trace_token)
+            _finish(trace, root, None)